@@ -13,6 +13,9 @@ import pathlib
 import pkgutil
 import string
 
+import meshroom.core
+from meshroom.core.pluginIndex import isNodeTypeSubclass
+
 # AV is the AliceVision specific command lines.
 # There is also CommandLineNode which is generic.
 from meshroom.core.desc.node import AVCommandLineNode
@@ -97,8 +100,15 @@ def commands(modules: collections.abc.Iterable) -> collections.abc.Generator[Com
 
 
 def alice_commands() -> collections.abc.Generator[Command]:
-    """Yield the commands from AliceVision."""
-    yield from commands(modules(SCRIPT_DIRECTORY / PACKAGE_NAME))
+    """Yield the commands from AliceVision.
+
+    The node types are found through meshroom's plugin index, so while the
+    package is unchanged its modules are only imported once the inputs or
+    outputs of a command are used.
+    """
+    for node_type in meshroom.core.loadNodes(str(SCRIPT_DIRECTORY), PACKAGE_NAME):
+        if isNodeTypeSubclass(node_type, AVCommandLineNode):
+            yield Command(node_type)
 
 
 def parameters_for_command_line(command: Command) -> list:
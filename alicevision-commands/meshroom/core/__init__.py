@@ -19,6 +19,7 @@ try:
 except Exception:
     pass
 
+from meshroom.core.pluginIndex import NodeTypes, getPluginIndex
 from meshroom.core.submitter import BaseSubmitter
 from meshroom.env import EnvVar, meshroomFolder
 from . import desc
@@ -31,7 +32,8 @@ logging.basicConfig(format='[%(asctime)s][%(levelname)s] %(message)s', level=log
 sessionUid = str(uuid.uuid1())
 
 cacheFolderName = 'MeshroomCache'
-nodesDesc: dict[str, desc.BaseNode] = {}
+# Node types registered from the plugin index are only imported when they are looked up
+nodesDesc: dict[str, desc.BaseNode] = NodeTypes()
 submitters: dict[str, BaseSubmitter] = {}
 pipelineTemplates: dict[str, str] = {}
 
@@ -57,8 +59,22 @@ def add_to_path(p):
 def loadClasses(folder, packageName, classType):
     """
     """
+    classes, warning, _ = _importClasses(folder, packageName, classType)
+    if warning:
+        logging.warning(warning)
+    return classes or []
+
+
+def _importClasses(folder, packageName, classType):
+    """
+    Import the modules of the package and return the classes of the given type they define, along
+    with the message about the modules that could not be loaded (None if all have been loaded) and
+    whether some modules could not be imported.
+    Returns None instead of the classes if the package itself could not be imported.
+    """
     classes = []
     errors = []
+    importFailed = False
 
     resolvedFolder = str(Path(folder).resolve())
     # temporarily add folder to python path
@@ -81,7 +97,7 @@ def loadClasses(folder, packageName, classType):
                             # Full traceback
                             f'\n{traceback.format_exc()}\n\n'
                             )
-            return []
+            return None, None, True
 
         for importer, pluginName, ispkg in pkgutil.iter_modules(package.__path__):
             pluginModuleName = '.' + pluginName
@@ -109,6 +125,7 @@ def loadClasses(folder, packageName, classType):
                 if importPlugin:
                     classes.extend(plugins)
             except Exception as e:
+                importFailed = True
                 tb = traceback.extract_tb(e.__traceback__)
                 last_call = tb[-1]
                 errors.append(f'  * {pluginName} ({type(e).__name__}): {e}\n'
@@ -121,10 +138,11 @@ def loadClasses(folder, packageName, classType):
                               )
 
     if errors:
-        logging.warning(' The following "{package}" plugins could not be loaded:\n'
-                        '{errorMsg}\n'
-                        .format(package=packageName, errorMsg='\n'.join(errors)))
-    return classes
+        message = (' The following "{package}" plugins could not be loaded:\n'
+                   '{errorMsg}\n'
+                   .format(package=packageName, errorMsg='\n'.join(errors)))
+        return classes, message, importFailed
+    return classes, None, importFailed
 
 
 def validateNodeDesc(nodeDesc):
@@ -305,6 +323,70 @@ def nodeVersion(nodeDesc, default=None):
     return moduleVersion(nodeDesc.__module__, default)
 
 
+_descCodeHash = None
+_moduleHashes = {}
+_descriptionHashes = {}
+
+
+def _hashFile(digest, filepath):
+    with open(filepath, "rb") as f:
+        digest.update(f.read())
+
+
+def _moduleHash(moduleName):
+    """ Return the hash of the source file of the given module, None if it is not available. """
+    if moduleName in _moduleHashes:
+        return _moduleHashes[moduleName]
+    moduleFile = getattr(sys.modules.get(moduleName), "__file__", None)
+    moduleHash = None
+    if moduleFile and moduleFile.endswith(".py"):
+        try:
+            digest = hashlib.sha1()
+            _hashFile(digest, moduleFile)
+            moduleHash = digest.hexdigest()
+        except OSError:
+            pass
+    _moduleHashes[moduleName] = moduleHash
+    return moduleHash
+
+
+def nodeDescriptionHash(nodeDesc):
+    """ Return a hash of the code defining the given node description class.
+
+    It changes whenever the module of the node type, the module of any of its base classes
+    or the node description code (meshroom.core.desc) is modified.
+
+    Args:
+        nodeDesc (desc.Node): the node description class
+
+    Returns:
+        str: the hash of the node description, None if the source of one of its modules is not available
+    """
+    global _descCodeHash
+    if nodeDesc in _descriptionHashes:
+        return _descriptionHashes[nodeDesc]
+    if _descCodeHash is None:
+        digest = hashlib.sha1()
+        descFolder = os.path.dirname(desc.__file__)
+        for filename in sorted(os.listdir(descFolder)):
+            if filename.endswith(".py"):
+                _hashFile(digest, os.path.join(descFolder, filename))
+        _descCodeHash = digest.hexdigest()
+    digest = hashlib.sha1(_descCodeHash.encode())
+    descriptionHash = None
+    moduleNames = sorted({cls.__module__ for cls in nodeDesc.__mro__ if cls.__module__ != "builtins"})
+    for moduleName in moduleNames:
+        moduleHash = _moduleHash(moduleName)
+        if moduleHash is None:
+            break
+        digest.update(moduleName.encode())
+        digest.update(moduleHash.encode())
+    else:
+        descriptionHash = digest.hexdigest()
+    _descriptionHashes[nodeDesc] = descriptionHash
+    return descriptionHash
+
+
 def registerNodeType(nodeType):
     """ Register a Node Type based on a Node Description class.
 
@@ -326,7 +408,23 @@ def loadNodes(folder, packageName):
         logging.error(f"Node folder '{folder}' does not exist.")
         return
 
-    return loadClasses(folder, packageName, desc.BaseNode)
+    pluginIndex = getPluginIndex()
+    if pluginIndex is None:
+        return loadClasses(folder, packageName, desc.BaseNode)
+
+    # Register the node types without importing them if the package has not changed
+    indexed = pluginIndex.lookup(folder, packageName)
+    if indexed is not None:
+        nodeTypes, warning = indexed
+    else:
+        nodeTypes, warning, importFailed = _importClasses(folder, packageName, desc.BaseNode)
+        if nodeTypes is None:
+            return []
+        pluginIndex.record(folder, packageName, nodeTypes, warning, importFailed)
+        pluginIndex.save()
+    if warning:
+        logging.warning(warning)
+    return nodeTypes
 
 
 def loadAllNodes(folder):
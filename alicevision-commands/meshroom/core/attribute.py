@@ -78,6 +78,8 @@ class Attribute(BaseObject):
 
         # invalidation value for output attributes
         self._invalidationValue = ""
+        # UID of the value, when it only depends on this attribute (see _uidEntry)
+        self._uidCache = None
 
         self._value = None
         self.initValue()
@@ -162,6 +164,8 @@ class Attribute(BaseObject):
         if self._enabled == v:
             return
         self._enabled = v
+        # The UID of a parent GroupAttribute depends on the enabled state of its children
+        self._invalidateUid()
         self.enabledChanged.emit()
 
     def getUidIgnoreValue(self):
@@ -227,8 +231,16 @@ class Attribute(BaseObject):
 
     @Slot()
     def _onValueChanged(self):
+        self._invalidateUid()
         self.node._onAttributeChanged(self)
 
+    def _invalidateUid(self):
+        """ Forget the cached UID of this attribute and of the List/Group attributes containing it. """
+        attr = self
+        while attr is not None:
+            attr._uidCache = None
+            attr = attr.root
+
     def _set_label(self, label):
         if self._label == label:
             return
@@ -255,6 +267,8 @@ class Attribute(BaseObject):
         self._set_value(copy.copy(self.defaultValue()))
 
     def requestGraphUpdate(self):
+        # The graph update may run before valueChanged is emitted
+        self._invalidateUid()
         if self.node.graph:
             self.node.graph.markNodesDirty(self.node)
             self.node.graph.update()
@@ -277,25 +291,37 @@ class Attribute(BaseObject):
         """
         Compute the UID for the attribute.
         """
+        return self._uidEntry()[0]
+
+    def _uidEntry(self):
+        """
+        Return the UID of the attribute and whether it only depends on the value of this attribute.
+        Such UIDs are cached until the value changes, while the ones depending on links or on the
+        node (for output attributes) are computed each time.
+        """
+        if self._uidCache is not None:
+            return self._uidCache, True
         if self.isOutput:
             if self.desc.isDynamicValue:
                 # If the attribute is a dynamic output, the UID is derived from the node UID.
                 # To guarantee that each output attribute receives a unique ID, we add the attribute name to it.
-                return hashValue((self.name, self.node._uid))
+                return hashValue((self.name, self.node._uid)), False
             else:
                 # Only dependent on the hash of its value without the cache folder.
                 # "/" at the end of the link is stripped to prevent having different UIDs depending on
                 # whether the invalidation value finishes with it or not
                 strippedInvalidationValue = self._invalidationValue.rstrip("/")
-                return hashValue(strippedInvalidationValue)
+                return hashValue(strippedInvalidationValue), False
         if self.isLink:
             linkParam = self.getLinkParam(recursive=True)
-            return linkParam.uid()
+            return linkParam.uid(), False
         if isinstance(self._value, (list, tuple, set,)):
             # non-exclusive choice param
             # hash of sorted values hashed
-            return hashValue([hashValue(v) for v in sorted(self._value)])
-        return hashValue(self._value)
+            self._uidCache = hashValue([hashValue(v) for v in sorted(self._value)])
+        else:
+            self._uidCache = hashValue(self._value)
+        return self._uidCache, True
 
     @property
     def isLink(self):
@@ -698,14 +724,22 @@ class ListAttribute(Attribute):
         self.requestGraphUpdate()
         self.valueChanged.emit()
 
-    def uid(self):
+    def _uidEntry(self):
+        if self._uidCache is not None:
+            return self._uidCache, True
         if isinstance(self.value, ListModel):
             uids = []
+            cacheable = not self.isOutput and not self.isLink
             for value in self.value:
                 if value.invalidate:
-                    uids.append(value.uid())
-            return hashValue(uids)
-        return super().uid()
+                    uid, valueCacheable = value._uidEntry()
+                    uids.append(uid)
+                    cacheable = cacheable and valueCacheable
+            uid = hashValue(uids)
+            if cacheable:
+                self._uidCache = uid
+            return uid, cacheable
+        return super()._uidEntry()
 
     def _applyExpr(self):
         if not self.node.graph:
@@ -865,12 +899,23 @@ class GroupAttribute(Attribute):
         except KeyError:
             return None
 
-    def uid(self):
+    def _uidEntry(self):
+        if self._uidCache is not None:
+            return self._uidCache, True
         uids = []
+        cacheable = not self.isOutput
         for k, v in self._value.items():
+            if isinstance(v.desc.enabled, types.FunctionType):
+                # The enabled state is evaluated on the node and may depend on other attributes
+                cacheable = False
             if v.enabled and v.invalidate:
-                uids.append(v.uid())
-        return hashValue(uids)
+                uid, valueCacheable = v._uidEntry()
+                uids.append(uid)
+                cacheable = cacheable and valueCacheable
+        uid = hashValue(uids)
+        if cacheable:
+            self._uidCache = uid
+        return uid, cacheable
 
     def _applyExpr(self):
         for value in self._value:
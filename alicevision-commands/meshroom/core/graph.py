@@ -3,9 +3,10 @@ import logging
 import os
 import re
 from typing import Any, Optional
-from collections.abc import Iterable
+from collections.abc import Iterable, Mapping
 import weakref
 from collections import defaultdict, OrderedDict
+from heapq import heappop, heappush
 from contextlib import contextmanager
 
 from enum import Enum
@@ -16,9 +17,11 @@ from meshroom.common import BaseObject, DictModel, Slot, Signal, Property
 from meshroom.core import Version
 from meshroom.core.attribute import Attribute, ListAttribute, GroupAttribute
 from meshroom.core.exception import GraphCompatibilityError, StopGraphVisit, StopBranchVisit
-from meshroom.core.graphIO import GraphIO, GraphSerializer, TemplateGraphSerializer, PartialGraphSerializer
-from meshroom.core.node import BaseNode, Status, Node, CompatibilityNode
+from meshroom.core.graphIO import (
+    GraphIO, GraphSerializer, TemplateGraphSerializer, PartialGraphSerializer, loadGraphData)
+from meshroom.core.node import BaseNode, Status, Node, CompatibilityNode, updateChunksStatusFromCache
 from meshroom.core.nodeFactory import nodeFactory
+from meshroom.core.scheduler import ChunkScheduler
 from meshroom.core.mtyping import PathLike
 
 # Replace default encoder to support Enums
@@ -195,6 +198,9 @@ class Graph(BaseObject):
 
     """
 
+    # Maximum number of traversal results kept until the topology changes
+    maxCachedTraversals = 1024
+
     def __init__(self, name: str = "", parent: BaseObject = None):
         super().__init__(parent)
         self.name: str = name
@@ -205,6 +211,12 @@ class Graph(BaseObject):
         self.dirtyTopology: bool = False
         self._nodesMinMaxDepths = {}
         self._computationBlocked = {}
+        # Adjacency maps and traversal results, valid until the topology changes
+        self._adjacencyCache = {}
+        self._traversalCache = {}
+        self._topologicalIndex = None
+        # Nodes whose internals need to be updated on the next graph update (see markNodesDirty)
+        self._dirtyNodes = set()
         self._canComputeLeaves: bool = True
         self._nodes = DictModel(keyAttrName='name', parent=self)
         # Edges: use dst attribute as unique key since it can only have one input connection
@@ -227,6 +239,30 @@ class Graph(BaseObject):
             node.alive = False
         self._nodes.clear()
         self._compatibilityNodes.clear()
+        self._dirtyNodes.clear()
+        self._invalidateTopologyCache()
+
+    def _invalidateTopologyCache(self, addedNode=None, addedEdge=None):
+        """ Forget the adjacency maps and traversal results computed for the previous topology.
+
+        Args:
+            addedNode (Node): the node added to the previous topology, if it is the only change:
+                              it has no edge yet, so the adjacency maps are still valid.
+            addedEdge (Edge): the edge added to the previous topology, if it is the only change: it is
+                              added to the adjacency map of all the edges instead of building it again.
+        """
+        if addedEdge is not None:
+            adjacency = self._adjacencyCache.get(False)
+            # The edges considered for dependencies only may change with any new edge
+            self._adjacencyCache.clear()
+            if adjacency is not None:
+                adjacency[0][addedEdge.dst.node].add(addedEdge.src.node)
+                adjacency[1][addedEdge.src.node].add(addedEdge.dst.node)
+                self._adjacencyCache[False] = adjacency
+        elif addedNode is None:
+            self._adjacencyCache.clear()
+        self._traversalCache.clear()
+        self._topologicalIndex = None
 
     @property
     def fileFeatures(self):
@@ -280,10 +316,12 @@ class Graph(BaseObject):
 
     @staticmethod
     def _loadGraphData(filepath: PathLike) -> dict:
-        """Deserialize the content of the Meshroom Graph file at `filepath` to a dictionnary."""
+        """Deserialize the content of the Meshroom Graph file at `filepath` to a dictionnary.
+
+        The nodes are decoded one at a time when they are accessed (see graphIO.SerializedNodes).
+        """
         with open(filepath) as file:
-            graphData = json.load(file)
-        return graphData
+            return loadGraphData(file.read())
 
     @blockNodeCallbacks
     def _deserialize(self, graphData: dict):
@@ -300,11 +338,13 @@ class Graph(BaseObject):
         graphContent = self._normalizeGraphContent(graphData, fileVersion)
         isTemplate = self.header.get(GraphIO.Keys.Template, False)
 
+        # The UIDs stored in the file, to check the computed ones against once the graph is loaded
+        serializedUids = {}
         with GraphModification(self):
             # iterate over nodes sorted by suffix index in their names
-            for nodeName, nodeData in sorted(
-                graphContent.items(), key=lambda x: self.getNodeIndexFromName(x[0])
-            ):
+            for nodeName in sorted(graphContent, key=self.getNodeIndexFromName):
+                nodeData = graphContent[nodeName]
+                serializedUids[nodeName] = nodeData.get("uid", None)
                 self._deserializeNode(nodeData, nodeName, self)
 
             # Create graph edges by resolving attributes expressions
@@ -321,14 +361,14 @@ class Graph(BaseObject):
         # nodes' links have been resolved and their UID computations are all complete.
         # It is now possible to check whether the UIDs stored in the graph file for each node correspond to the ones
         # that were computed.
-        self._evaluateUidConflicts(graphContent)
+        self._evaluateUidConflicts(graphContent, serializedUids)
 
-    def _normalizeGraphContent(self, graphData: dict, fileVersion: Version) -> dict:
+    def _normalizeGraphContent(self, graphData: dict, fileVersion: Version) -> Mapping:
         graphContent = graphData.get(GraphIO.Keys.Graph, graphData)
 
         if fileVersion < Version("2.0"):
             # For internal folders, all "{uid0}" keys should be replaced with "{uid}"
-            updatedFileData = json.dumps(graphContent).replace("{uid0}", "{uid}")
+            updatedFileData = json.dumps(dict(graphContent)).replace("{uid0}", "{uid}")
 
             # For fileVersion < 2.0, the nodes' UID is stored as:
             # "uids": {"0": "hashvalue"}
@@ -345,6 +385,15 @@ class Graph(BaseObject):
         return graphContent
 
     def _deserializeNode(self, nodeData: dict, nodeName: str, fromGraph: "Graph"):
+        self._setNodeDataVersion(nodeData, fromGraph)
+        inTemplate = fromGraph.header.get(GraphIO.Keys.Template, False)
+        descriptionHash = fromGraph.header.get(GraphIO.Keys.NodesDescriptionHashes, {}).get(nodeData["nodeType"])
+        node = nodeFactory(nodeData, nodeName, inTemplate=inTemplate, descriptionHash=descriptionHash)
+        self._addNode(node, nodeName)
+        return node
+
+    @staticmethod
+    def _setNodeDataVersion(nodeData: dict, fromGraph: "Graph"):
         # Retrieve version info from:
         #   1. nodeData: node saved from a CompatibilityNode
         #   2. nodesVersion in file header: node saved from a Node
@@ -352,36 +401,33 @@ class Graph(BaseObject):
         if "version" not in nodeData:
             if version := fromGraph._getNodeTypeVersionFromHeader(nodeData["nodeType"]):
                 nodeData["version"] = version
-        inTemplate = fromGraph.header.get(GraphIO.Keys.Template, False)
-        node = nodeFactory(nodeData, nodeName, inTemplate=inTemplate)
-        self._addNode(node, nodeName)
-        return node
 
     def _getNodeTypeVersionFromHeader(self, nodeType: str, default: Optional[str] = None) -> Optional[str]:
         nodeVersions = self.header.get(GraphIO.Keys.NodesVersions, {})
         return nodeVersions.get(nodeType, default)
 
-    def _evaluateUidConflicts(self, graphContent: dict):
+    def _evaluateUidConflicts(self, graphContent: Mapping, serializedUids: dict[str, Optional[str]]):
         """
         Compare the computed UIDs of all the nodes in the graph with the UIDs serialized in `graphContent`. If there
         are mismatches, the nodes with the unexpected UID are replaced with "UidConflict" compatibility nodes.
   
         Args:
             graphContent: The serialized Graph content.
+            serializedUids: The UID serialized in `graphContent` for each node.
         """
 
-        def _serializedNodeUidMatchesComputedUid(nodeData: dict, node: BaseNode) -> bool:
+        def _serializedNodeUidMatchesComputedUid(node: BaseNode) -> bool:
             """Returns whether the serialized UID matches the one computed in the `node` instance."""
             if isinstance(node, CompatibilityNode):
                 return True
-            serializedUid = nodeData.get("uid", None)
+            serializedUid = serializedUids.get(node.name, None)
             computedUid = node._uid
             return serializedUid is None or computedUid is None or serializedUid == computedUid
 
         uidConflictingNodes = [
             node
             for node in self.nodes
-            if not _serializedNodeUidMatchesComputedUid(graphContent[node.name], node)
+            if not _serializedNodeUidMatchesComputedUid(node)
         ]
 
         if not uidConflictingNodes:
@@ -395,13 +441,14 @@ class Graph(BaseObject):
         # the serialized uid, which might solve "false-positives" downstream conflicts as well.
         nodesSortedByDepth = sorted(uidConflictingNodes, key=lambda node: node.minDepth)
         for node in nodesSortedByDepth:
-            nodeData = graphContent[node.name]
             # Evaluate if the node uid is still conflicting at this point, or if it has been resolved by an
             # upstream node replacement.
-            if _serializedNodeUidMatchesComputedUid(nodeData, node):
+            if _serializedNodeUidMatchesComputedUid(node):
                 continue
+            nodeData = graphContent[node.name]
+            self._setNodeDataVersion(nodeData, self)
             expectedUid = node._uid
-            compatibilityNode = nodeFactory(graphContent[node.name], node.name, expectedUid=expectedUid)
+            compatibilityNode = nodeFactory(nodeData, node.name, expectedUid=expectedUid)
             # This operation will trigger a graph update that will recompute the uids of all nodes,
             # allowing the iterative resolution of uid conflicts.
             self.replaceNode(node.name, compatibilityNode)
@@ -486,6 +533,9 @@ class Graph(BaseObject):
         node._name = uniqueName
         node.graph = self
         self._nodes.add(node)
+        if node.dirty:
+            self._dirtyNodes.add(node)
+        self._invalidateTopologyCache(addedNode=node)
 
     def addNode(self, node, uniqueName=None):
         """
@@ -635,6 +685,8 @@ class Graph(BaseObject):
 
             node.alive = False
             self._nodes.remove(node)
+            self._dirtyNodes.discard(node)
+            self._invalidateTopologyCache()
             self.update()
 
         return inEdges, outEdges, outListAttributes
@@ -855,11 +907,13 @@ class Graph(BaseObject):
         return self._edges.get(dstAttributeName)
 
     def getLeafNodes(self, dependenciesOnly):
-        nodesWithOutputLink = {edge.src.node for edge in self.getEdges(dependenciesOnly)}
+        nodesWithOutputLink = {node for node, outputs in self._getOutputEdgesPerNode(dependenciesOnly).items()
+                               if outputs}
         return set(self._nodes) - nodesWithOutputLink
 
     def getRootNodes(self, dependenciesOnly):
-        nodesWithInputLink = {edge.dst.node for edge in self.getEdges(dependenciesOnly)}
+        nodesWithInputLink = {node for node, inputs in self._getInputEdgesPerNode(dependenciesOnly).items()
+                              if inputs}
         return set(self._nodes) - nodesWithInputLink
 
     @changeTopology
@@ -872,6 +926,8 @@ class Graph(BaseObject):
             raise RuntimeError(f'Destination attribute "{dstAttr.getFullNameToNode()}" is already connected.')
         edge = Edge(srcAttr, dstAttr)
         self.edges.add(edge)
+        self._invalidateTopologyCache(addedEdge=edge)
+        dstAttr._invalidateUid()
         self.markNodesDirty(dstAttr.node)
         dstAttr.valueChanged.emit()
         dstAttr.isLinkChanged.emit()
@@ -888,6 +944,8 @@ class Graph(BaseObject):
         if dstAttr not in self.edges.keys():
             raise RuntimeError(f'Attribute "{dstAttr.getFullNameToNode()}" is not connected')
         edge = self.edges.pop(dstAttr)
+        self._invalidateTopologyCache()
+        dstAttr._invalidateUid()
         self.markNodesDirty(dstAttr.node)
         dstAttr.valueChanged.emit()
         dstAttr.isLinkChanged.emit()
@@ -912,20 +970,23 @@ class Graph(BaseObject):
         return {edge for edge in self.getEdges(dependenciesOnly=dependenciesOnly) if edge.dst.node is node}
 
     def _getInputEdgesPerNode(self, dependenciesOnly):
-        nodeEdges = defaultdict(set)
-
-        for edge in self.getEdges(dependenciesOnly=dependenciesOnly):
-            nodeEdges[edge.dst.node].add(edge.src.node)
-
-        return nodeEdges
+        """ Return the input nodes of each node. The result is cached until the topology changes: do not modify it. """
+        return self._getAdjacency(dependenciesOnly)[0]
 
     def _getOutputEdgesPerNode(self, dependenciesOnly):
-        nodeEdges = defaultdict(set)
-
-        for edge in self.getEdges(dependenciesOnly=dependenciesOnly):
-            nodeEdges[edge.src.node].add(edge.dst.node)
-
-        return nodeEdges
+        """ Return the output nodes of each node. The result is cached until the topology changes: do not modify it. """
+        return self._getAdjacency(dependenciesOnly)[1]
+
+    def _getAdjacency(self, dependenciesOnly):
+        adjacency = self._adjacencyCache.get(dependenciesOnly)
+        if adjacency is None:
+            inputNodes = defaultdict(set)
+            outputNodes = defaultdict(set)
+            for edge in self.getEdges(dependenciesOnly=dependenciesOnly):
+                inputNodes[edge.dst.node].add(edge.src.node)
+                outputNodes[edge.src.node].add(edge.dst.node)
+            adjacency = self._adjacencyCache[dependenciesOnly] = (inputNodes, outputNodes)
+        return adjacency
 
     def dfs(self, visitor, startNodes=None, longestPathFirst=False):
         # Default direction (visitor.reverse=False): from node to root
@@ -964,28 +1025,61 @@ class Graph(BaseObject):
             pass
 
     def _dfsVisit(self, u, visitor, colors, nodeChildren, longestPathFirst):
-        colors[u] = GRAY
-        visitor.discoverVertex(u, self)
-        # d_time[u] = time = time + 1
-        children = nodeChildren[u]
-        if longestPathFirst:
-            assert not self.dirtyTopology
-            children = sorted(children, reverse=True, key=lambda item: self._nodesMinMaxDepths[item][1])
-        for v in children:
-            visitor.examineEdge((u, v), self)
-            if colors[v] == WHITE:
-                visitor.treeEdge((u, v), self)
-                # (u,v) is a tree edge
-                self.dfsVisit(v, visitor, colors, nodeChildren, longestPathFirst)  # TODO: avoid recursion
-            elif colors[v] == GRAY:
-                # (u,v) is a back edge
-                visitor.backEdge((u, v), self)
-            elif colors[v] == BLACK:
-                # (u,v) is a cross or forward edge
-                visitor.forwardOrCrossEdge((u, v), self)
-            visitor.finishEdge((u, v), self)
-        colors[u] = BLACK
-        visitor.finishVertex(u, self)
+        # Iterative depth-first visit with an explicit stack of (vertex, children iterator).
+        # Events are emitted in the same order as a recursive visit, and a StopBranchVisit
+        # only stops the visit of the vertex whose event raised it.
+        stack = []
+
+        def discover(v):
+            colors[v] = GRAY
+            visitor.discoverVertex(v, self)
+            # d_time[v] = time = time + 1
+            children = nodeChildren[v]
+            if longestPathFirst:
+                assert not self.dirtyTopology
+                children = sorted(children, reverse=True, key=lambda item: self._nodesMinMaxDepths[item][1])
+            stack.append((v, iter(children)))
+
+        try:
+            discover(u)
+        except StopBranchVisit:
+            return
+
+        finishedChild = None
+        while stack:
+            v, children = stack[-1]
+            try:
+                if finishedChild is not None:
+                    w, finishedChild = finishedChild, None
+                    visitor.finishEdge((v, w), self)
+                descended = False
+                for w in children:
+                    visitor.examineEdge((v, w), self)
+                    if colors[w] == WHITE:
+                        # (v,w) is a tree edge
+                        visitor.treeEdge((v, w), self)
+                        try:
+                            discover(w)
+                            descended = True
+                            break
+                        except StopBranchVisit:
+                            pass
+                    elif colors[w] == GRAY:
+                        # (v,w) is a back edge
+                        visitor.backEdge((v, w), self)
+                    elif colors[w] == BLACK:
+                        # (v,w) is a cross or forward edge
+                        visitor.forwardOrCrossEdge((v, w), self)
+                    visitor.finishEdge((v, w), self)
+                if descended:
+                    continue
+                stack.pop()
+                colors[v] = BLACK
+                visitor.finishVertex(v, self)
+            except StopBranchVisit:
+                if stack and stack[-1][0] is v:
+                    stack.pop()
+            finishedChild = v
 
     def dfsOnFinish(self, startNodes=None, longestPathFirst=False, reverse=False, dependenciesOnly=False):
         """
@@ -1002,13 +1096,17 @@ class Graph(BaseObject):
         Returns:
             The list of nodes and edges, from startNodes to the graph roots/leaves following edges.
         """
-        nodes = []
-        edges = []
-        visitor = Visitor(reverse=reverse, dependenciesOnly=dependenciesOnly)
-        visitor.finishVertex = lambda vertex, graph: nodes.append(vertex)
-        visitor.finishEdge = lambda edge, graph: edges.append(edge)
-        self.dfs(visitor=visitor, startNodes=startNodes, longestPathFirst=longestPathFirst)
-        return nodes, edges
+        key = ("finish", tuple(startNodes) if startNodes else None, longestPathFirst, reverse, dependenciesOnly)
+        result = self._traversalCache.get(key)
+        if result is None:
+            nodes = []
+            edges = []
+            visitor = Visitor(reverse=reverse, dependenciesOnly=dependenciesOnly)
+            visitor.finishVertex = lambda vertex, graph: nodes.append(vertex)
+            visitor.finishEdge = lambda edge, graph: edges.append(edge)
+            self.dfs(visitor=visitor, startNodes=startNodes, longestPathFirst=longestPathFirst)
+            result = self._cacheTraversal(key, nodes, edges)
+        return list(result[0]), list(result[1])
 
     def dfsOnDiscover(self, startNodes=None, filterTypes=None, longestPathFirst=False, reverse=False, dependenciesOnly=False):
         """
@@ -1027,18 +1125,30 @@ class Graph(BaseObject):
         Returns:
             The list of nodes and edges, from startNodes to the graph roots/leaves following edges.
         """
-        nodes = []
-        edges = []
-        visitor = Visitor(reverse=reverse, dependenciesOnly=dependenciesOnly)
-
-        def discoverVertex(vertex, graph):
-            if not filterTypes or vertex.nodeType in filterTypes:
-                nodes.append(vertex)
-
-        visitor.discoverVertex = discoverVertex
-        visitor.examineEdge = lambda edge, graph: edges.append(edge)
-        self.dfs(visitor=visitor, startNodes=startNodes, longestPathFirst=longestPathFirst)
-        return nodes, edges
+        key = ("discover", tuple(startNodes) if startNodes else None, tuple(filterTypes) if filterTypes else None,
+               longestPathFirst, reverse, dependenciesOnly)
+        result = self._traversalCache.get(key)
+        if result is None:
+            nodes = []
+            edges = []
+            visitor = Visitor(reverse=reverse, dependenciesOnly=dependenciesOnly)
+
+            def discoverVertex(vertex, graph):
+                if not filterTypes or vertex.nodeType in filterTypes:
+                    nodes.append(vertex)
+
+            visitor.discoverVertex = discoverVertex
+            visitor.examineEdge = lambda edge, graph: edges.append(edge)
+            self.dfs(visitor=visitor, startNodes=startNodes, longestPathFirst=longestPathFirst)
+            result = self._cacheTraversal(key, nodes, edges)
+        return list(result[0]), list(result[1])
+
+    def _cacheTraversal(self, key, nodes, edges):
+        """ Keep the result of a traversal that only depends on the topology, until it changes. """
+        if len(self._traversalCache) >= self.maxCachedTraversals:
+            self._traversalCache.clear()
+        result = self._traversalCache[key] = (tuple(nodes), tuple(edges))
+        return result
 
     def dfsToProcess(self, startNodes=None):
         """
@@ -1222,7 +1332,7 @@ class Graph(BaseObject):
     def getInputNodes(self, node, recursive, dependenciesOnly):
         """ Return either the first level input nodes of a node or the whole chain. """
         if not recursive:
-            return {edge.src.node for edge in self.getEdges(dependenciesOnly) if edge.dst.node is node}
+            return set(self._getInputEdgesPerNode(dependenciesOnly).get(node, ()))
 
         inputNodes, edges = self.dfsOnDiscover(startNodes=[node], filterTypes=None, reverse=False)
         return inputNodes[1:]  # exclude current node
@@ -1230,7 +1340,7 @@ class Graph(BaseObject):
     def getOutputNodes(self, node, recursive, dependenciesOnly):
         """ Return either the first level output nodes of a node or the whole chain. """
         if not recursive:
-            return {edge.dst.node for edge in self.getEdges(dependenciesOnly) if edge.src.node is node}
+            return set(self._getOutputEdgesPerNode(dependenciesOnly).get(node, ()))
 
         outputNodes, edges = self.dfsOnDiscover(startNodes=[node], filterTypes=None, reverse=True)
         return outputNodes[1:]  # exclude current node
@@ -1332,10 +1442,11 @@ class Graph(BaseObject):
         if not path:
             path = generateTempProjectFilepath()
 
-        data = self.serialize(template)
+        SerializerClass = TemplateGraphSerializer if template else GraphSerializer
 
         with open(path, 'w') as jsonFile:
-            json.dump(data, jsonFile, indent=4)
+            # Nodes are serialized and written one at a time
+            SerializerClass(self).write(jsonFile, indent=4)
 
         if path != self._filepath and setupProjectFile:
             self._setFilepath(path)
@@ -1386,15 +1497,46 @@ class Graph(BaseObject):
         self.filepathChanged.emit()
 
     def updateInternals(self, startNodes=None, force=False):
-        nodes, edges = self.dfsOnFinish(startNodes=startNodes)
-        for node in nodes:
-            if node.dirty or force:
+        if startNodes is not None or force:
+            nodes, edges = self.dfsOnFinish(startNodes=startNodes)
+            for node in nodes:
+                if node.dirty or force:
+                    node.updateInternals()
+            return
+
+        # Only visit the dirty nodes, in the order given by dfsOnFinish so that the inputs of a node
+        # are updated before it. Updating a node may mark other nodes as dirty, they are queued as well.
+        index = self._getTopologicalIndex()
+        queue = []
+        queued = set()
+
+        def enqueueDirtyNodes():
+            for node in self._dirtyNodes - queued:
+                queued.add(node)
+                heappush(queue, (index.get(node, len(index)), len(queued), node))
+
+        enqueueDirtyNodes()
+        while queue:
+            _, _, node = heappop(queue)
+            if node.dirty:
+                nbDirtyNodes = len(self._dirtyNodes)
                 node.updateInternals()
+                if len(self._dirtyNodes) != nbDirtyNodes:
+                    enqueueDirtyNodes()
+
+    def _getTopologicalIndex(self):
+        """ Return the position of each node in the order given by dfsOnFinish, cached until the topology changes. """
+        if self._topologicalIndex is None:
+            nodes, _ = self.dfsOnFinish()
+            self._topologicalIndex = {node: i for i, node in enumerate(nodes)}
+        return self._topologicalIndex
 
     def updateStatusFromCache(self, force=False):
-        for node in self._nodes:
-            if node.dirty or force:
-                node.updateStatusFromCache()
+        nodes = list(self._nodes) if force else [node for node in self._dirtyNodes if node.dirty]
+        # Read the status of all the chunks at once rather than node by node
+        updateChunksStatusFromCache([chunk for node in nodes for chunk in node._chunks])
+        for node in nodes:
+            node.updateOutputAttr()
 
     def updateStatisticsFromCache(self):
         for node in self._nodes:
@@ -1424,13 +1566,17 @@ class Graph(BaseObject):
             self._updateRequested = True
             return
 
+        hasDirtyNodes = bool(self._dirtyNodes)
         self.updateInternals()
         if os.path.exists(self._cacheDir):
             self.updateStatusFromCache()
-        for node in self.nodes:
+        for node in self._dirtyNodes:
             node.dirty = False
+        self._dirtyNodes.clear()
 
-        self.updateNodesPerUid()
+        # UIDs only change on dirty nodes
+        if hasDirtyNodes or self.dirtyTopology:
+            self.updateNodesPerUid()
 
         # Graph topology has changed
         if self.dirtyTopology:
@@ -1455,6 +1601,7 @@ class Graph(BaseObject):
         nodes, edges = self.dfsOnDiscover(startNodes=[fromNode], reverse=True)
         for node in nodes:
             node.dirty = True
+        self._dirtyNodes.update(nodes)
 
     def stopExecution(self):
         """ Request graph execution to be stopped by terminating running chunks"""
@@ -1602,6 +1749,8 @@ def getAlreadySubmittedChunks(nodes):
 
 def executeGraph(graph, toNodes=None, forceCompute=False, forceStatus=False):
     """
+    Compute the nodes required by 'toNodes' (all graph leaves if None) in the current process.
+    Chunks are computed in parallel by a ChunkScheduler, within the available resources.
     """
     if forceCompute:
         nodes, edges = graph.dfsOnFinish(startNodes=toNodes)
@@ -1628,23 +1777,16 @@ def executeGraph(graph, toNodes=None, forceCompute=False, forceStatus=False):
     for node in nodes:
         node.beginSequence(forceCompute)
 
-    for n, node in enumerate(nodes):
-        try:
-            node.preprocess()
-            multiChunks = len(node.chunks) > 1
-            for c, chunk in enumerate(node.chunks):
-                if multiChunks:
-                    print('\n[{node}/{nbNodes}]({chunk}/{nbChunks}) {nodeName}'.format(
-                        node=n+1, nbNodes=len(nodes),
-                        chunk=c+1, nbChunks=len(node.chunks), nodeName=node.nodeType))
-                else:
-                    print(f'\n[{n + 1}/{len(nodes)}] {node.nodeType}')
-                chunk.process(forceCompute)
-            node.postprocess()
-        except Exception as e:
-            logging.error(f"Error on node computation: {e}")
-            graph.clearSubmittedNodes()
-            raise
+    # Independent nodes and the chunks of parallelized nodes are computed concurrently
+    scheduler = ChunkScheduler(graph, forceCompute=forceCompute)
+    scheduler.addNodes(nodes)
+    if not scheduler.run():
+        graph.clearSubmittedNodes()
+        if scheduler.errors:
+            raise scheduler.errors[0][1]
+        if scheduler.stopped:
+            raise RuntimeError("The computation has been stopped.")
+        raise RuntimeError("Some nodes have not been computed because of unresolved dependencies.")
 
     for node in nodes:
         node.endSequence()
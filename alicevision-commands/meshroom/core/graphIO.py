@@ -1,5 +1,8 @@
+import json
+import re
+from collections.abc import Mapping
 from enum import Enum
-from typing import Any, TYPE_CHECKING, Union
+from typing import Any, TextIO, TYPE_CHECKING, Union
 
 import meshroom
 from meshroom.core import Version
@@ -21,6 +24,7 @@ class GraphIO:
         # Doesn't inherit enum to simplify usage (GraphIO.Keys.XX, without .value)
         Header = "header"
         NodesVersions = "nodesVersions"
+        NodesDescriptionHashes = "nodesDescriptionHashes"
         ReleaseVersion = "releaseVersion"
         FileVersion = "fileVersion"
         Graph = "graph"
@@ -77,6 +81,27 @@ class GraphSerializer:
             GraphIO.Keys.Graph: self.serializeContent(),
         }
 
+    def write(self, stream: TextIO, indent: int = 4):
+        """
+        Serialize the Graph as JSON into `stream`, one node at a time.
+
+        The output is the same as `json.dump(self.serialize(), stream, indent=indent)`, without holding
+        the serialized data of all the nodes in memory at once.
+        """
+        def dumps(value, level):
+            # Indent the nested JSON text to its level in the file
+            return json.dumps(value, indent=indent).replace("\n", "\n" + " " * (indent * level))
+
+        stream.write("{\n" + " " * indent + json.dumps(GraphIO.Keys.Header) + ": "
+                     + dumps(self.serializeHeader(), 1) + ",\n")
+        stream.write(" " * indent + json.dumps(GraphIO.Keys.Graph) + ": {")
+        separator = "\n"
+        for node in sorted(self.nodes, key=lambda n: n.name):
+            stream.write(separator + " " * (indent * 2) + json.dumps(node.name) + ": "
+                         + dumps(self.serializeNode(node), 2))
+            separator = ",\n"
+        stream.write("}\n}" if separator == "\n" else "\n" + " " * indent + "}\n}")
+
     @property
     def nodes(self) -> list[Node]:
         return self._graph.nodes
@@ -88,12 +113,14 @@ class GraphSerializer:
             - version of the software used to create it.
             - version of the file format.
             - version of the nodes types used in the graph.
+            - hash of the descriptions of the nodes types used in the graph.
             - template flag.
         """
         header: dict[str, Any] = {}
         header[GraphIO.Keys.ReleaseVersion] = meshroom.__version__
         header[GraphIO.Keys.FileVersion] = GraphIO.__version__
         header[GraphIO.Keys.NodesVersions] = self._getNodeTypesVersions()
+        header[GraphIO.Keys.NodesDescriptionHashes] = self._getNodeTypesDescriptionHashes()
         return header
 
     def _getNodeTypesVersions(self) -> dict[str, str]:
@@ -107,6 +134,22 @@ class GraphSerializer:
         # Sort them by name (to avoid random order changing from one save to another).
         return dict(sorted(nodeTypesVersions.items()))
 
+    def _getNodeTypesDescriptionHashes(self) -> dict[str, str]:
+        """
+        Get the hash of the description of each node types in `nodes`, for which all the nodes are
+        compatible with their description: their attributes do not need to be checked again on load
+        while the description is unchanged.
+        """
+        nodeTypes = {node.nodeDesc.__class__ for node in self.nodes if isinstance(node, Node)}
+        incompatibleNodeTypes = {node.nodeType for node in self.nodes if not isinstance(node, Node)}
+        nodeTypesHashes = {
+            nodeType.__name__: descriptionHash
+            for nodeType in nodeTypes
+            if nodeType.__name__ not in incompatibleNodeTypes
+            and (descriptionHash := meshroom.core.nodeDescriptionHash(nodeType)) is not None
+        }
+        return dict(sorted(nodeTypesHashes.items()))
+
     def serializeContent(self) -> dict:
         """Graph content serialization logic."""
         return {node.name: self.serializeNode(node) for node in sorted(self.nodes, key=lambda n: n.name)}
@@ -229,3 +272,117 @@ class PartialGraphSerializer(GraphSerializer):
         return attribute.getExportValue()
 
 
+
+
+class SerializedNodes(Mapping):
+    """
+    Serialized data of the nodes of a Graph file, by node name.
+
+    The file content is scanned once to locate the data of each node, which is only decoded when it
+    is accessed: the decoded data of all the nodes is never held in memory at once.
+    Each access returns a newly decoded dict.
+    """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, text: str, spans: dict[str, int]):
+        self._text = text
+        self._spans = spans
+
+    def __getitem__(self, name: str) -> dict:
+        return self._decoder.raw_decode(self._text, self._spans[name])[0]
+
+    def __iter__(self):
+        return iter(self._spans)
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+
+_whitespace = re.compile(r"[ \t\n\r]*")
+_stringOrBracket = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]', re.DOTALL)
+
+
+def _skipContainer(text: str, pos: int) -> int:
+    """
+    Return the position after the JSON object or array starting at `pos`, without decoding it.
+    The content of the container is only validated when it is decoded.
+    """
+    depth = 0
+    for match in _stringOrBracket.finditer(text, pos):
+        char = match.group()
+        if char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    raise ValueError(f"Unterminated container at position {pos}")
+
+
+def _expect(text: str, pos: int, chars: str) -> tuple[str, int]:
+    """Skip whitespaces from `pos` and check that the next character is one of `chars`."""
+    pos = _whitespace.match(text, pos).end()
+    if pos >= len(text) or text[pos] not in chars:
+        raise ValueError(f"Expected one of {chars!r} at position {pos}")
+    return text[pos], pos + 1
+
+
+def _decodeObject(text: str, pos: int, decodeValue) -> tuple[dict, int]:
+    """
+    Decode the JSON object at `pos`, using `decodeValue(key, pos)` to decode the value of each member
+    into a (value, end position) pair.
+
+    Returns:
+        The decoded object and the position after it.
+    """
+    result = {}
+    _, pos = _expect(text, pos, "{")
+    pos = _whitespace.match(text, pos).end()
+    if text.startswith("}", pos):
+        return result, pos + 1
+    while True:
+        _, pos = _expect(text, pos, '"')
+        key, pos = json.decoder.scanstring(text, pos)
+        _, pos = _expect(text, pos, ":")
+        result[key], pos = decodeValue(key, _whitespace.match(text, pos).end())
+        char, pos = _expect(text, pos, ",}")
+        if char == "}":
+            return result, pos
+
+
+def loadGraphData(text: str) -> dict:
+    """
+    Decode the content of a Graph file.
+
+    The graph content is returned as SerializedNodes, decoded one node at a time.
+    Content that does not have the layout of a Graph file is decoded at once.
+
+    Args:
+        text: The content of the Graph file.
+
+    Returns:
+        The serialized Graph.
+    """
+    decoder = SerializedNodes._decoder
+
+    def locateNode(name, pos):
+        # Only keep the position of the node data, decoded when accessed
+        if text.startswith(("{", "["), pos):
+            return pos, _skipContainer(text, pos)
+        return pos, decoder.raw_decode(text, pos)[1]
+
+    def decodeMember(key, pos):
+        if key == GraphIO.Keys.Graph and text.startswith("{", pos):
+            spans, pos = _decodeObject(text, pos, locateNode)
+            return SerializedNodes(text, spans), pos
+        return decoder.raw_decode(text, pos)
+
+    try:
+        graphData, pos = _decodeObject(text, 0, decodeMember)
+        if _whitespace.match(text, pos).end() != len(text):
+            raise ValueError(f"Extra data at position {pos}")
+        return graphData
+    except ValueError:
+        # Let the standard decoder report the error if the content is not valid
+        return json.loads(text)
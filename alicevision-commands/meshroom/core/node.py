@@ -21,6 +21,8 @@ from meshroom.common import Signal, Variant, Property, BaseObject, Slot, ListMod
 from meshroom.core import desc, stats, hashValue, nodeVersion, Version, MrNodeType
 from meshroom.core.attribute import attributeFactory, ListAttribute, GroupAttribute, Attribute
 from meshroom.core.exception import NodeUpgradeError, UnknownNodeTypeError
+from meshroom.core.outputCache import detachOutputFiles, getOutputCache
+from meshroom.core.statusStore import getStatusStore
 
 
 def getWritingFilepath(filepath: str) -> str:
@@ -101,6 +103,7 @@ class StatusData(BaseObject):
         self.startDateTime = min(self.startDateTime, other.startDateTime)
         self.endDateTime = max(self.endDateTime, other.endDateTime)
         self.elapsedTime += other.elapsedTime
+        self.peakMemory = max(self.peakMemory, other.peakMemory)
 
     def reset(self):
         self.nodeName: str = ""
@@ -117,9 +120,12 @@ class StatusData(BaseObject):
         self.commandLine: str = ""
         self.env: str = ""
         self._startTime: Optional[datetime.datetime] = None
+        self.submitDateTime: str = ""
         self.startDateTime: str = ""
         self.endDateTime: str = ""
         self.elapsedTime: float = 0.0
+        # Peak resident memory of the process computing the chunk (in bytes), as sampled by the statistics
+        self.peakMemory: int = 0
         self.hostname: str = ""
 
     def initStartCompute(self):
@@ -139,7 +145,9 @@ class StatusData(BaseObject):
         When submitting a node, we reset the status information to ensure that we do not keep
         outdated information.
         """
+        submitDateTime = self.submitDateTime
         self.resetDynamicValues()
+        self.submitDateTime = submitDateTime
         self.initStartCompute()
         assert self.mrNodeType == MrNodeType.NODE
         self.sessionUid = None
@@ -153,6 +161,7 @@ class StatusData(BaseObject):
         self.resetDynamicValues()
         self.sessionUid = None
         self.submitterSessionUid = meshroom.core.sessionUid
+        self.submitDateTime = datetime.datetime.now().strftime(self.dateTimeFormatting)
         self.status = Status.SUBMITTED
         self.execMode = ExecMode.EXTERN
 
@@ -164,6 +173,7 @@ class StatusData(BaseObject):
         self.resetDynamicValues()
         self.sessionUid = None
         self.submitterSessionUid = meshroom.core.sessionUid
+        self.submitDateTime = datetime.datetime.now().strftime(self.dateTimeFormatting)
         self.status = Status.SUBMITTED
         self.execMode = ExecMode.LOCAL
 
@@ -207,9 +217,11 @@ class StatusData(BaseObject):
         self.graph = d.get("graph", "")
         self.commandLine = d.get("commandLine", "")
         self.env = d.get("env", "")
+        self.submitDateTime = d.get("submitDateTime", "")
         self.startDateTime = d.get("startDateTime", "")
         self.endDateTime = d.get("endDateTime", "")
         self.elapsedTime = d.get("elapsedTime", 0)
+        self.peakMemory = d.get("peakMemory", 0)
         self.hostname = d.get("hostname", "")
         self.sessionUid = d.get("sessionUid", "")
         self.submitterSessionUid = d.get("submitterSessionUid", "")
@@ -317,6 +329,28 @@ def clearProcessesStatus():
         v.upgradeStatusTo(Status.KILLED)
 
 
+def updateChunksStatusFromCache(chunks):
+    """
+    Update the status of the given chunks, reading them in batch from their status store.
+    """
+    chunksPerStore = {}
+    for chunk in chunks:
+        chunksPerStore.setdefault(chunk.statusStore, []).append(chunk)
+    for store, storeChunks in chunksPerStore.items():
+        knownKeys = {}
+        statusFiles = [chunk.statusFile for chunk in storeChunks]
+        for chunk, statusFile in zip(storeChunks, statusFiles):
+            key = chunk.knownStatusKey(statusFile)
+            # Duplicate nodes share the same status file: reload it if they are not in sync
+            if statusFile in knownKeys and knownKeys[statusFile] != key:
+                knownKeys[statusFile] = None
+            else:
+                knownKeys.setdefault(statusFile, key)
+        entries = store.readMany(knownKeys)
+        for chunk, statusFile in zip(storeChunks, statusFiles):
+            chunk.setStatusFromCache(entries[statusFile], statusFile)
+
+
 class NodeChunk(BaseObject):
     def __init__(self, node, range, parent=None):
         super().__init__(parent)
@@ -327,6 +361,8 @@ class NodeChunk(BaseObject):
                                               node.packageVersion, node.getMrNodeType())
         self.statistics: stats.Statistics = stats.Statistics()
         self.statusFileLastModTime = -1
+        # Status file and version of its status in the status store when it was last read
+        self._statusCacheKey = (None, None)
         self.subprocess = None
         # Notify update in filepaths when node's internal folder changes
         self.node.internalFolderChanged.connect(self.nodeFolderChanged)
@@ -354,27 +390,42 @@ class NodeChunk(BaseObject):
     def execModeName(self):
         return self._status.execMode.name
 
+    @property
+    def statusStore(self):
+        return getStatusStore(self.node.graph.cacheDir)
+
     def updateStatusFromCache(self):
         """
         Update node status based on status file content/existence.
         """
         statusFile = self.statusFile
+        self.setStatusFromCache(self.statusStore.read(statusFile, self.knownStatusKey(statusFile)), statusFile)
+
+    def knownStatusKey(self, statusFile):
+        """ Return the version of the status last read from the given status file (None if unknown). """
+        cachedStatusFile, key = self._statusCacheKey
+        return key if cachedStatusFile == statusFile else None
+
+    def setStatusFromCache(self, entry, statusFile):
+        """
+        Update node status from a StatusEntry read from the status store for the given status file.
+        """
         oldStatus = self._status.status
         # No status file => reset status to Status.None
-        if not os.path.exists(statusFile):
+        if entry.key is None:
             self.statusFileLastModTime = -1
+            self._statusCacheKey = (None, None)
             self._status.reset()
             self._status.setNodeType(self.node)
-        else:
+        elif entry.data is not None:
             try:
-                with open(statusFile) as jsonFile:
-                    statusData = json.load(jsonFile)
-                # logging.debug(f"updateStatusFromCache({self.node.name}): From status {self.status.status} to {statusData['status']}")
-                self._status.fromDict(statusData)
-                self.statusFileLastModTime = os.path.getmtime(statusFile)
+                self._status.fromDict(entry.data)
+                self.statusFileLastModTime = entry.modTime
+                self._statusCacheKey = (statusFile, entry.key)
             except Exception as e:
                 logging.debug(f"updateStatusFromCache({self.node.name}): Error while loading status file {statusFile}: {e}")
                 self.statusFileLastModTime = -1
+                self._statusCacheKey = (None, None)
                 self._status.reset()
                 self._status.setNodeType(self.node)
 
@@ -409,15 +460,9 @@ class NodeChunk(BaseObject):
         """
         Write node status on disk.
         """
-        data = self._status.toDict()
-        statusFilepath = self.statusFile
-        folder = os.path.dirname(statusFilepath)
-        os.makedirs(folder, exist_ok=True)
-
-        statusFilepathWriting = getWritingFilepath(statusFilepath)
-        with open(statusFilepathWriting, 'w') as jsonFile:
-            json.dump(data, jsonFile, indent=4)
-        renameWritingToFinalPath(statusFilepathWriting, statusFilepath)
+        self.statusStore.write(self.statusFile, self._status.toDict())
+        # The status in memory is the latest: the next update has to read the status again
+        self._statusCacheKey = (None, None)
 
     def upgradeStatusFile(self):
         """
@@ -437,26 +482,17 @@ class NodeChunk(BaseObject):
 
     def updateStatisticsFromCache(self):
         """
+        Read the samples added to the statistics file since the last update.
         """
-        oldTimes = self.statistics.times
         statisticsFile = self.statisticsFile
         if not os.path.exists(statisticsFile):
             return
-        with open(statisticsFile) as jsonFile:
-            statisticsData = json.load(jsonFile)
-        self.statistics.fromDict(statisticsData)
-        if oldTimes != self.statistics.times:
+        if self.statistics.load(statisticsFile):
             self.statisticsChanged.emit()
 
     def saveStatistics(self):
-        data = self.statistics.toDict()
-        statisticsFilepath = self.statisticsFile
-        folder = os.path.dirname(statisticsFilepath)
-        os.makedirs(folder, exist_ok=True)
-        statisticsFilepathWriting = getWritingFilepath(statisticsFilepath)
-        with open(statisticsFilepathWriting, 'w') as jsonFile:
-            json.dump(data, jsonFile, indent=4)
-        renameWritingToFinalPath(statisticsFilepathWriting, statisticsFilepath)
+        # Only the samples added since the last save are appended to the file
+        self.statistics.save(self.statisticsFile)
 
     def isAlreadySubmitted(self):
         return self._status.status in (Status.SUBMITTED, Status.RUNNING)
@@ -481,6 +517,10 @@ class NodeChunk(BaseObject):
             logging.info(f"Node chunk already computed: {self.name}")
             return
 
+        # Reuse the outputs of an identical node computed in another project
+        if not forceCompute and not inCurrentEnv and self._restoreFromOutputCache():
+            return
+
         # Start the process environment for nodes running in isolation.
         # This only happens once, when the node has the SUBMITTED status.
         # The sub-process will go through this method again, but the node status will
@@ -497,6 +537,9 @@ class NodeChunk(BaseObject):
         self.statThread = stats.StatisticsThread(self)
         self.statThread.start()
         try:
+            # Output files restored from the output cache are shared with it and with other projects,
+            # even if the cache has been disabled since: they must not be modified
+            detachOutputFiles(self.node.internalFolder)
             self.node.nodeDesc.processChunk(self)
             # NOTE: this assumes saving the output attributes for each chunk
             self.node.saveOutputAttr()
@@ -511,6 +554,7 @@ class NodeChunk(BaseObject):
             raise
         finally:
             self._status.setNode(self.node)
+            self._status.peakMemory = self.statistics.process.peakMemory
             self._status.initEndCompute()
             self.upgradeStatusFile()
 
@@ -523,6 +567,52 @@ class NodeChunk(BaseObject):
             self.statistics = stats.Statistics()
             del runningProcesses[self.name]
 
+        self._storeInOutputCache()
+
+    def _restoreFromOutputCache(self):
+        """
+        Restore the outputs of the node from the OutputCache, if they have been computed before.
+
+        Returns:
+            bool: whether the chunk has been restored.
+        """
+        cache = getOutputCache()
+        if cache is None or not cache.isCacheable(self.node):
+            return False
+        try:
+            if not cache.restore(self.node):
+                return False
+        except Exception as e:
+            logging.warning(f"Failed to look up {self.name} in the output cache: {e}")
+            return False
+        logging.info(f"Node chunk restored from the output cache: {self.name}")
+        self._status.setNode(self.node)
+        self._status.initStartCompute()
+        self._status.initEndCompute()
+        self.upgradeStatusTo(Status.SUCCESS)
+        return True
+
+    def _storeInOutputCache(self):
+        """
+        Store the outputs of the node in the OutputCache once all its chunks are computed.
+        """
+        cache = getOutputCache()
+        if cache is None or not cache.isCacheable(self.node):
+            return
+        # The other chunks may have been computed in other processes
+        chunks = list(self.node.chunks)
+        entries = self.statusStore.readMany({chunk.statusFile: None for chunk in chunks})
+        elapsedTime = 0.0
+        for chunk in chunks:
+            data = entries[chunk.statusFile].data
+            if not data or data.get("status") != Status.SUCCESS.name:
+                return
+            elapsedTime += data.get("elapsedTime", 0.0)
+        try:
+            cache.store(self.node, elapsedTime)
+        except Exception as e:
+            logging.warning(f"Failed to store the outputs of {self.node.name} in the output cache: {e}")
+
 
     def _processInIsolatedEnvironment(self):
         """
@@ -1020,6 +1110,7 @@ class BaseNode(BaseObject):
                 # fail.
                 # In both cases, we can ignore it.
                 logging.warning(f"Failed to remove internal folder: '{self.internalFolder}'. Error: {e}.")
+            getStatusStore(self.graph.cacheDir).removeFolder(self.internalFolder)
             self.updateStatusFromCache()
 
     @Slot(result=str)
@@ -1242,8 +1333,7 @@ class BaseNode(BaseObject):
         Update node status based on status file content/existence.
         """
         s = self.globalStatus
-        for chunk in self._chunks:
-            chunk.updateStatusFromCache()
+        updateChunksStatusFromCache(self._chunks)
         # logging.warning(f"updateStatusFromCache: {self.name}, status: {s} => {self.globalStatus}")
         self.updateOutputAttr()
 
@@ -12,6 +12,7 @@ def nodeFactory(
     name: Optional[str] = None,
     inTemplate: bool = False,
     expectedUid: Optional[str] = None,
+    descriptionHash: Optional[str] = None,
 ) -> Union[Node, CompatibilityNode]:
     """
     Create a node instance by deserializing the given node data.
@@ -23,11 +24,13 @@ def nodeFactory(
         name: The node's name.
         inTemplate: True if the node is created as part of a graph template.
         expectedUid: The expected UID of the node within the context of a Graph.
+        descriptionHash: The hash of the node type description the node data has been serialized with
+                         (see meshroom.core.nodeDescriptionHash).
 
     Returns:
         The created Node instance.
     """
-    return _NodeCreator(nodeData, name, inTemplate, expectedUid).create()
+    return _NodeCreator(nodeData, name, inTemplate, expectedUid, descriptionHash).create()
 
 
 class _NodeCreator:
@@ -38,11 +41,13 @@ class _NodeCreator:
         name: Optional[str] = None,
         inTemplate: bool = False,
         expectedUid: Optional[str] = None,
+        descriptionHash: Optional[str] = None,
     ):
         self.nodeData = nodeData
         self.name = name
         self.inTemplate = inTemplate
         self.expectedUid = expectedUid
+        self.descriptionHash = descriptionHash
 
         self._normalizeNodeData()
 
@@ -62,7 +67,17 @@ class _NodeCreator:
             node = self._createCompatibilityNode(compatibilityIssue)
             node = self._tryUpgradeCompatibilityNode(node)
         else:
-            node = self._createNode()
+            try:
+                node = self._createNode()
+            except Exception:
+                if self.descriptionHash is None:
+                    raise
+                # The description hash did not catch a change of the description:
+                # fall back to the full compatibility check.
+                logging.warning(f"Failed to create node '{self.name}' from its description hash, "
+                                "checking its attributes against the description.")
+                self.descriptionHash = None
+                return self.create()
         return node
 
     def _normalizeNodeData(self):
@@ -119,6 +134,11 @@ class _NodeCreator:
         )
 
     def _checkAttributesAreCompatibleWithDescription(self) -> bool:
+        # The attributes were compatible with the description the node has been serialized with:
+        # no need to check them again while this description is unchanged.
+        if self.descriptionHash is not None and \
+                self.descriptionHash == meshroom.core.nodeDescriptionHash(self.nodeDesc):
+            return True
         return (
             self._checkAttributesCompatibility(self.nodeDesc.inputs, self.inputs)
             and self._checkAttributesCompatibility(self.nodeDesc.internalInputs, self.internalInputs)
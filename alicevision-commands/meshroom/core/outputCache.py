@@ -0,0 +1,395 @@
+"""
+Outputs of computed nodes shared between projects.
+
+The outputs of a node only depend on its UID (see Node._computeUid) and on the way its
+computation is split into chunks, so nodes computed in one project can be reused as is by
+identical nodes of other projects instead of being computed again. The OutputCache stores the
+files of the internal folder of each computed node under a key made of its UID and chunk
+ranges (MESHROOM_OUTPUT_CACHE). Before a chunk is computed, the cache is looked up and on a hit
+the stored files are hard-linked (or reflinked, or copied across file systems) into the
+internal folder of the node and the chunk is marked as computed.
+
+Chunks of a node write into the same folder, possibly at the same time, so their outputs
+cannot be told apart: an entry is stored once all the chunks of the node are computed, and
+restores the outputs of all of them.
+
+Entries are evicted in least recently used order when the cache exceeds its disk budget
+(MESHROOM_OUTPUT_CACHE_SIZE). The hits and misses per node type are kept in the cache index
+and can be printed with `python -m meshroom.core.outputCache`.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+from meshroom.env import EnvVar
+
+
+# Files written by Meshroom in the internal folder of a node, which are not outputs
+_internalFiles = re.compile(r"^((\d+\.)?(status|log|statistics)|values)$|\.writing\.")
+
+# ioctl request to clone a file (Linux)
+_FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """ Clone the content of src into dst without copying the data (copy-on-write file systems). """
+    import fcntl
+    try:
+        with open(src, "rb") as srcFile, open(dst, "wb") as dstFile:
+            fcntl.ioctl(dstFile.fileno(), _FICLONE, srcFile.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise
+
+
+def _linkFile(src, dst):
+    """ Hard-link src to dst, falling back to a reflink and then to a copy. """
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        _reflink(src, dst)
+        return
+    except (OSError, ImportError):
+        pass
+    shutil.copy2(src, dst)
+
+
+def _replaceFile(dst, create):
+    """ Create dst with the given function, next to it first so that it is replaced at once. """
+    tmp = f"{dst}.cache.{uuid.uuid4().hex}"
+    try:
+        create(tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _listOutputFiles(folder):
+    """ Return the path (relative to folder) and size of the output files within folder. """
+    files = []
+    for root, dirs, filenames in os.walk(folder):
+        dirs.sort()
+        for filename in sorted(filenames):
+            if root == folder and _internalFiles.search(filename):
+                continue
+            path = os.path.join(root, filename)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            files.append((os.path.relpath(path, folder).replace(os.path.sep, "/"), os.path.getsize(path)))
+    return files
+
+
+def detachOutputFiles(folder):
+    """
+    Replace the output files of folder that are hard-linked elsewhere (in the OutputCache) by
+    a copy of their own, so that computing the node again does not modify the shared files.
+    """
+    if not os.path.isdir(folder):
+        return
+    for relPath, _ in _listOutputFiles(folder):
+        path = os.path.join(folder, *relPath.split("/"))
+        if os.stat(path).st_nlink > 1:
+            _replaceFile(path, lambda tmp: shutil.copy2(path, tmp))
+
+
+def _formatSize(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class OutputCache:
+    """
+    Cache of the outputs of computed nodes, addressed by node UID and chunk ranges.
+
+    The files of each entry are stored in "entries/<key>" within the cache folder, and the
+    entries are indexed in a SQLite database in WAL mode, shared by all the processes
+    computing nodes.
+    """
+    databaseName = "index.db"
+
+    def __init__(self, folder, maxSize):
+        """
+        Args:
+            folder (str): the cache folder.
+            maxSize (int): the disk budget of the cache (in bytes).
+        """
+        self.folder = folder
+        self.maxSize = maxSize
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(self.folder, exist_ok=True)
+            connection = sqlite3.connect(os.path.join(self.folder, self.databaseName), timeout=30,
+                                         check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS entries ("
+                               "key TEXT PRIMARY KEY, nodeType TEXT NOT NULL, files TEXT NOT NULL, "
+                               "size INTEGER NOT NULL, elapsedTime REAL NOT NULL, nbChunks INTEGER NOT NULL, "
+                               "created REAL NOT NULL, lastUsed REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS entriesLastUsed ON entries(lastUsed)")
+            connection.execute("CREATE TABLE IF NOT EXISTS counters ("
+                               "nodeType TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0, "
+                               "misses INTEGER NOT NULL DEFAULT 0, stores INTEGER NOT NULL DEFAULT 0, "
+                               "evictions INTEGER NOT NULL DEFAULT 0, reusedSize INTEGER NOT NULL DEFAULT 0, "
+                               "savedTime REAL NOT NULL DEFAULT 0)")
+            self._connection = connection
+        return self._connection
+
+    def _count(self, connection, nodeType, **increments):
+        connection.execute("INSERT OR IGNORE INTO counters (nodeType) VALUES (?)", (nodeType,))
+        connection.execute(
+            f"UPDATE counters SET {', '.join(f'{name} = {name} + ?' for name in increments)} WHERE nodeType = ?",
+            (*increments.values(), nodeType))
+
+    def _entryFolder(self, key):
+        return os.path.join(self.folder, "entries", key[:2], key)
+
+    @staticmethod
+    def isCacheable(node):
+        """
+        Whether the outputs of the node can be reused from one project to another: it has to be
+        computed, without dynamic output values and with all its output files in its internal folder.
+        """
+        nodeDesc = node.nodeDesc
+        if node.isCompatibilityNode or nodeDesc is None or not node.isComputableType or not node._uid:
+            return False
+        if nodeDesc.hasDynamicOutputAttribute:
+            return False
+        from meshroom.core import desc
+        folder = os.path.abspath(node.internalFolder)
+        for attr in node.attributes:
+            if not attr.isOutput or not isinstance(attr.desc, desc.File):
+                continue
+            if not isinstance(attr.value, str):
+                return False
+            path = os.path.abspath(attr.value)
+            if path != folder and not path.startswith(os.path.join(folder, "")):
+                return False
+        return True
+
+    @staticmethod
+    def key(node):
+        """ Return the key of the outputs of the node: its UID and the ranges of its chunks. """
+        ranges = [[chunk.range.iteration, chunk.range.blockSize, chunk.range.fullSize] for chunk in node.chunks]
+        return hashlib.sha1(json.dumps([node._uid, ranges]).encode()).hexdigest()
+
+    def restore(self, node):
+        """
+        Link the outputs stored for the node into its internal folder.
+
+        Returns:
+            bool: whether the outputs have been found and restored.
+        """
+        key = self.key(node)
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT files, size, elapsedTime, nbChunks FROM entries WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None:
+                self._count(connection, node.nodeType, misses=1)
+                return False
+        files, _, elapsedTime, nbChunks = row
+        entryFolder = self._entryFolder(key)
+        folder = node.internalFolder
+        # The other chunks of the node may have restored the files already
+        reusedSize = 0
+        try:
+            for relPath, fileSize in json.loads(files):
+                src = os.path.join(entryFolder, *relPath.split("/"))
+                dst = os.path.join(folder, *relPath.split("/"))
+                if os.path.exists(dst) and os.path.samefile(src, dst):
+                    continue
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                _replaceFile(dst, lambda tmp: _linkFile(src, tmp))
+                reusedSize += fileSize
+        except OSError as e:
+            # The entry may have been evicted in the meantime
+            logging.warning(f"Failed to restore the outputs of {node.name} from the output cache: {e}")
+            with self._lock:
+                self._count(self._connect(), node.nodeType, misses=1)
+            return False
+        with self._lock:
+            connection = self._connect()
+            connection.execute("UPDATE entries SET lastUsed = ? WHERE key = ?", (time.time(), key))
+            # Hits are counted per chunk, as the lookups, and the size of the files where they are restored
+            self._count(connection, node.nodeType, hits=1, reusedSize=reusedSize,
+                        savedTime=elapsedTime / nbChunks)
+        return True
+
+    def store(self, node, elapsedTime=0.0):
+        """
+        Store the outputs of the computed node, and evict the least recently used entries if the
+        cache exceeds its disk budget.
+
+        Args:
+            node (Node): the node whose chunks are all computed.
+            elapsedTime (float): the time spent computing the chunks of the node (in seconds).
+        """
+        key = self.key(node)
+        folder = node.internalFolder
+        files = _listOutputFiles(folder)
+        size = sum(fileSize for _, fileSize in files)
+        if size > self.maxSize:
+            return
+        with self._lock:
+            if self._connect().execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone():
+                return
+
+        # Link the files aside and move them in place, so that an entry is never partially visible
+        entryFolder = self._entryFolder(key)
+        tmpFolder = os.path.join(self.folder, "tmp", uuid.uuid4().hex)
+        try:
+            for relPath, _ in files:
+                dst = os.path.join(tmpFolder, *relPath.split("/"))
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                _linkFile(os.path.join(folder, *relPath.split("/")), dst)
+            os.makedirs(tmpFolder, exist_ok=True)
+            os.makedirs(os.path.dirname(entryFolder), exist_ok=True)
+            try:
+                os.rename(tmpFolder, entryFolder)
+            except OSError:
+                # Stored by another process in the meantime
+                return
+        finally:
+            shutil.rmtree(tmpFolder, ignore_errors=True)
+
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (key, node.nodeType, json.dumps(files), size, elapsedTime,
+                                    max(len(node.chunks), 1), now, now))
+                self._count(connection, node.nodeType, stores=1)
+        logging.info(f"Outputs of {node.name} stored in the output cache ({_formatSize(size)})")
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache fits in its disk budget.
+
+        Args:
+            keep (str): the key of an entry not to remove.
+        """
+        with self._lock:
+            connection = self._connect()
+            totalSize = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if totalSize <= self.maxSize:
+                return
+            evicted = []
+            for key, nodeType, size in connection.execute(
+                    "SELECT key, nodeType, size FROM entries ORDER BY lastUsed").fetchall():
+                if totalSize <= self.maxSize:
+                    break
+                if key == keep:
+                    continue
+                evicted.append(key)
+                totalSize -= size
+                with connection:
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._count(connection, nodeType, evictions=1)
+        # Files still linked into project folders remain there
+        for key in evicted:
+            shutil.rmtree(self._entryFolder(key), ignore_errors=True)
+
+    def getStatistics(self):
+        """
+        Return the usage of the cache for each node type.
+
+        Returns:
+            list of dict: the hits, misses, stores, evictions, reused size and saved computation
+                          time of each node type, with its number of entries and their size.
+        """
+        with self._lock:
+            connection = self._connect()
+            entries = {nodeType: (count, size) for nodeType, count, size in connection.execute(
+                "SELECT nodeType, COUNT(*), SUM(size) FROM entries GROUP BY nodeType")}
+            rows = connection.execute("SELECT nodeType, hits, misses, stores, evictions, reusedSize, savedTime "
+                                      "FROM counters ORDER BY nodeType").fetchall()
+        names = ("nodeType", "hits", "misses", "stores", "evictions", "reusedSize", "savedTime")
+        statistics = []
+        for row in rows:
+            values = dict(zip(names, row))
+            values["entries"], values["size"] = entries.get(values["nodeType"], (0, 0))
+            statistics.append(values)
+        return statistics
+
+    def report(self):
+        """ Return a text report of the hits and misses of the cache per node type. """
+        statistics = self.getStatistics()
+        totalSize = sum(s["size"] for s in statistics)
+        lines = [f"Output cache '{self.folder}': {sum(s['entries'] for s in statistics)} entries, "
+                 f"{_formatSize(totalSize)} / {_formatSize(self.maxSize)}"]
+        header = ("Node type", "Hits", "Misses", "Hit rate", "Stores", "Evictions", "Reused", "Saved time")
+        rows = []
+        for s in statistics + [{
+            "nodeType": "Total", **{name: sum(s[name] for s in statistics)
+                                    for name in ("hits", "misses", "stores", "evictions", "reusedSize", "savedTime")}
+        }]:
+            lookups = s["hits"] + s["misses"]
+            rows.append((s["nodeType"], str(s["hits"]), str(s["misses"]),
+                         f"{100 * s['hits'] / lookups:.0f}%" if lookups else "-",
+                         str(s["stores"]), str(s["evictions"]), _formatSize(s["reusedSize"]),
+                         str(datetime.timedelta(seconds=round(s["savedTime"])))))
+        widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+        for row in [header] + rows:
+            lines.append("  ".join(value.ljust(width) if i == 0 else value.rjust(width)
+                                   for i, (value, width) in enumerate(zip(row, widths))))
+        return "\n".join(lines)
+
+
+_outputCaches = {}
+_outputCachesLock = threading.Lock()
+
+
+def getOutputCache():
+    """ Return the OutputCache stored at MESHROOM_OUTPUT_CACHE, None if the cache is disabled. """
+    folder = EnvVar.get(EnvVar.MESHROOM_OUTPUT_CACHE)
+    if not folder:
+        return None
+    maxSize = int(EnvVar.get(EnvVar.MESHROOM_OUTPUT_CACHE_SIZE) * 1024 ** 3)
+    key = (folder, maxSize)
+    with _outputCachesLock:
+        cache = _outputCaches.get(key)
+        if cache is None:
+            cache = _outputCaches[key] = OutputCache(folder, maxSize)
+    return cache
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Report the usage of the Meshroom output cache.")
+    parser.add_argument("--evict", action="store_true",
+                        help="Remove the least recently used entries exceeding the disk budget first.")
+    args = parser.parse_args()
+
+    cache = getOutputCache()
+    if cache is None:
+        parser.exit(1, "The output cache is disabled (MESHROOM_OUTPUT_CACHE is empty).\n")
+    if args.evict:
+        cache.evict()
+    print(cache.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Index of the node types defined in plugin packages, to register them without importing them.
+
+Loading the node types of a package imports each of its modules and validates the description of
+each node type, which makes up most of the startup time. The result is stored in an index file
+(MESHROOM_PLUGIN_INDEX), keyed by the modification time and size of the files of the package and of
+the node description code. While they are unchanged, the node types are registered from the index as
+LazyNodeType and their module is only imported when the node type is used.
+Packages with modules that could not be imported are not indexed, as the import may succeed once
+their dependencies are installed: they are imported on each start.
+"""
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+
+from meshroom.env import EnvVar
+
+
+# Version of the layout of the index file
+INDEX_VERSION = 1
+
+
+def _fingerprint(folder):
+    """ Return the (path, modification time, size) of the Python files within the folder. """
+    files = []
+    for root, dirs, filenames in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for filename in sorted(filenames):
+            if not filename.endswith(".py"):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append([os.path.relpath(path, folder), stat.st_mtime_ns, stat.st_size])
+    return files
+
+
+_descFingerprint = None
+
+
+def _getDescFingerprint():
+    """ The validation of the node descriptions depends on the node description code. """
+    global _descFingerprint
+    if _descFingerprint is None:
+        coreFolder = os.path.dirname(__file__)
+        # validateNodeDesc is defined in meshroom.core
+        stat = os.stat(os.path.join(coreFolder, "__init__.py"))
+        _descFingerprint = [list(sys.version_info[:2]), _fingerprint(os.path.join(coreFolder, "desc")),
+                            [stat.st_mtime_ns, stat.st_size]]
+    return _descFingerprint
+
+
+def _qualifiedName(cls):
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+class LazyNodeType:
+    """
+    Node type registered from the PluginIndex, standing for a node description class whose module
+    has not been imported yet.
+
+    The name, category and base classes are known from the index; accessing anything else imports
+    the module. NodeTypes replaces it with the actual class when it is looked up.
+    """
+    def __init__(self, folder, info, packageInfo, indexKey=None):
+        self.__name__ = info["name"]
+        self.category = info.get("category")
+        self.moduleName = info["module"]
+        self.baseClassNames = info["bases"]
+        self._folder = folder
+        self._packageInfo = packageInfo
+        self._indexKey = indexKey
+        self._nodeType = None
+
+    def __repr__(self):
+        return f"<LazyNodeType {self.moduleName}.{self.__name__}>"
+
+    def load(self):
+        """
+        Import the module of the node type and return its node description class.
+
+        Raises:
+            ImportError: if the module or the node type can not be imported anymore. The package is
+                         removed from the index to be imported again on the next start.
+        """
+        if self._nodeType is None:
+            from meshroom.core import add_to_path
+            try:
+                with add_to_path(self._folder):
+                    module = importlib.import_module(self.moduleName)
+                nodeType = getattr(module, self.__name__)
+            except Exception as e:
+                pluginIndex = getPluginIndex()
+                if pluginIndex is not None and self._indexKey is not None:
+                    pluginIndex.forget(self._indexKey)
+                    pluginIndex.save()
+                raise ImportError(f"Failed to import node type '{self.__name__}' from '{self.moduleName}' "
+                                  f"({type(e).__name__}): {e}") from e
+            nodeType.packageName = self._packageInfo["packageName"]
+            nodeType.packageVersion = self._packageInfo["packageVersion"]
+            nodeType.packagePath = self._packageInfo["packagePath"]
+            self._nodeType = nodeType
+        return self._nodeType
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+
+def isNodeTypeSubclass(nodeType, baseClass):
+    """ issubclass for node types that may not have been imported yet (LazyNodeType). """
+    if isinstance(nodeType, LazyNodeType):
+        return _qualifiedName(baseClass) in nodeType.baseClassNames
+    return issubclass(nodeType, baseClass)
+
+
+class NodeTypes(dict):
+    """
+    Registered node types by name, importing the LazyNodeType when they are looked up.
+
+    A LazyNodeType that can not be imported anymore is unregistered, as if it had never been.
+    """
+    def _resolve(self, name, nodeType):
+        if isinstance(nodeType, LazyNodeType):
+            try:
+                nodeType = nodeType.load()
+            except ImportError as e:
+                logging.error(f"{e}: node type '{name}' is unregistered.")
+                dict.__delitem__(self, name)
+                raise KeyError(name) from e
+            dict.__setitem__(self, name, nodeType)
+        return nodeType
+
+    def __getitem__(self, name):
+        return self._resolve(name, dict.__getitem__(self, name))
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def values(self):
+        return [nodeType for _, nodeType in self.items()]
+
+    def items(self):
+        items = []
+        for name in list(self.keys()):
+            try:
+                items.append((name, self[name]))
+            except KeyError:
+                pass
+        return items
+
+
+class PluginIndex:
+    """
+    Node types found in each plugin package, with the warnings raised while loading them.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._modified = False
+        try:
+            with open(path) as indexFile:
+                data = json.load(indexFile)
+            if data.get("version") == INDEX_VERSION:
+                self._entries = data.get("packages", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.debug(f"Failed to read the plugin index '{path}': {e}")
+
+    @staticmethod
+    def _key(folder, packageName):
+        return f"{os.path.abspath(folder)}|{packageName}"
+
+    @staticmethod
+    def _currentFingerprint(folder, packageName):
+        packageFolder = os.path.join(folder, *packageName.split("."))
+        if not os.path.isdir(packageFolder):
+            return None
+        return [_getDescFingerprint(), _fingerprint(packageFolder)]
+
+    def lookup(self, folder, packageName):
+        """
+        Get the node types of the package from the index, if the package has not changed.
+
+        Returns:
+            tuple: the list of LazyNodeType and the warning raised when loading them (None if none),
+                   or None if the package is not indexed or has changed.
+        """
+        entry = self._entries.get(self._key(folder, packageName))
+        if entry is None:
+            return None
+        fingerprint = self._currentFingerprint(folder, packageName)
+        if fingerprint is None or fingerprint != entry["fingerprint"]:
+            return None
+        key = self._key(folder, packageName)
+        nodeTypes = [LazyNodeType(os.path.abspath(folder), info, entry["package"], key) for info in entry["nodeTypes"]]
+        return nodeTypes, entry["warning"]
+
+    def record(self, folder, packageName, nodeTypes, warning, importFailed=False):
+        """
+        Store the node types loaded from the package along with the warning raised when loading them.
+
+        A package with modules that could not be imported is not stored, to import it again on the
+        next start.
+        """
+        if importFailed:
+            self.forget(self._key(folder, packageName))
+            return
+        fingerprint = self._currentFingerprint(folder, packageName)
+        if fingerprint is None:
+            return
+        package = {"packageName": packageName, "packageVersion": None, "packagePath": None}
+        if nodeTypes:
+            package = {
+                "packageName": nodeTypes[0].packageName,
+                "packageVersion": nodeTypes[0].packageVersion,
+                "packagePath": nodeTypes[0].packagePath,
+            }
+        self._entries[self._key(folder, packageName)] = {
+            "fingerprint": fingerprint,
+            "package": package,
+            "nodeTypes": [{
+                "name": nodeType.__name__,
+                "module": nodeType.__module__,
+                "category": getattr(nodeType, "category", None),
+                "bases": [_qualifiedName(base) for base in nodeType.__mro__],
+            } for nodeType in nodeTypes],
+            "warning": warning,
+        }
+        self._modified = True
+
+    def forget(self, key):
+        """ Remove the package stored under the given key (see _key) from the index. """
+        if self._entries.pop(key, None) is not None:
+            self._modified = True
+
+    def save(self):
+        if not self._modified:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Several processes may start at once: write aside and replace
+            writingPath = f"{self.path}.{os.getpid()}.writing"
+            with open(writingPath, "w") as indexFile:
+                json.dump({"version": INDEX_VERSION, "packages": self._entries}, indexFile)
+            os.replace(writingPath, self.path)
+            self._modified = False
+        except OSError as e:
+            logging.debug(f"Failed to write the plugin index '{self.path}': {e}")
+
+
+_pluginIndex = None
+_pluginIndexLock = threading.Lock()
+
+
+def getPluginIndex():
+    """ Return the PluginIndex stored at MESHROOM_PLUGIN_INDEX, None if the index is disabled. """
+    global _pluginIndex
+    path = EnvVar.get(EnvVar.MESHROOM_PLUGIN_INDEX)
+    if not path:
+        return None
+    with _pluginIndexLock:
+        if _pluginIndex is None or _pluginIndex.path != path:
+            _pluginIndex = PluginIndex(path)
+        return _pluginIndex
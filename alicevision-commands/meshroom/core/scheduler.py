@@ -0,0 +1,317 @@
+"""
+Resource-aware parallel computation of graph NodeChunks.
+
+The chunks of a node become ready once all the nodes it depends on have been computed.
+Ready chunks are computed concurrently in a pool of worker threads (each chunk mostly waits
+on its own subprocess), as long as the CPU, RAM and GPU levels declared by their node
+descriptions fit in the resources available to this process, cgroup limits included.
+"""
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import psutil
+
+from meshroom.core import cgroup
+from meshroom.core.desc.computation import Level
+from meshroom.env import EnvVar
+
+
+# Share of a resource that a chunk reserves for the level declared on its node description
+LEVEL_SHARE = {
+    Level.NONE: 0.0,
+    Level.NORMAL: 0.25,
+    Level.INTENSIVE: 1.0,
+}
+
+
+def getAvailableCpuCount():
+    """ Return the number of cores this process can use, based on its cgroup and CPU affinity. """
+    count = cgroup.getCgroupCpuCount()
+    if count > 0:
+        return count
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def getAvailableMemorySize():
+    """ Return the amount of memory (in bytes) this process can use, based on its cgroup. """
+    total = psutil.virtual_memory().total
+    size = cgroup.getCgroupMemorySize()
+    # Without a limit, the cgroup reports a value larger than the physical memory
+    if 0 < size < total:
+        return size
+    return total
+
+
+class Resources:
+    """
+    CPU cores, memory and GPU devices shared by the chunks computed concurrently.
+
+    A chunk reserves a share of each resource depending on the levels declared by its node
+    description (see LEVEL_SHARE). A chunk is always accepted when nothing else is running,
+    even if it requires more than what is available, so that no chunk waits forever.
+    """
+    def __init__(self, cpuCount=None, memorySize=None, gpuCount=1):
+        self.capacity = {
+            "cpu": cpuCount or getAvailableCpuCount(),
+            "ram": memorySize or getAvailableMemorySize(),
+            "gpu": gpuCount,
+        }
+        self.used = dict.fromkeys(self.capacity, 0.0)
+        self._reservations = 0
+
+    @property
+    def cpuCount(self):
+        return self.capacity["cpu"]
+
+    def requirements(self, node):
+        """ Return the amount of each resource needed to compute a chunk of the given node. """
+        nodeDesc = node.nodeDesc
+        levels = {
+            "cpu": getattr(nodeDesc, "cpu", Level.NORMAL),
+            "ram": getattr(nodeDesc, "ram", Level.NORMAL),
+            "gpu": getattr(nodeDesc, "gpu", Level.NONE),
+        }
+        requirements = {name: self.capacity[name] * LEVEL_SHARE[level] for name, level in levels.items()}
+        # Each chunk runs at least one process
+        requirements["cpu"] = max(requirements["cpu"], 1)
+        return requirements
+
+    def acquire(self, requirements):
+        """
+        Reserve the given resources if they are available.
+
+        Returns:
+            bool: whether the resources have been reserved.
+        """
+        if self._reservations and any(self.used[name] + amount > self.capacity[name] * (1 + 1e-9)
+                                      for name, amount in requirements.items()):
+            return False
+        for name, amount in requirements.items():
+            self.used[name] += amount
+        self._reservations += 1
+        return True
+
+    def setUsage(self, used, reservations):
+        """
+        Set the resources currently reserved, e.g. by chunks computed in other processes.
+
+        Args:
+            used (dict): the amount of each resource in use.
+            reservations (int): the number of chunks the resources are reserved for.
+        """
+        self.used = dict.fromkeys(self.capacity, 0.0)
+        self.used.update(used)
+        self._reservations = reservations
+
+    def release(self, requirements):
+        """ Release resources previously reserved with acquire. """
+        for name, amount in requirements.items():
+            self.used[name] = max(self.used[name] - amount, 0.0)
+        self._reservations -= 1
+
+
+class ChunkScheduler:
+    """
+    Compute the chunks of a set of nodes in parallel while respecting their dependencies.
+
+    Nodes are computed once all their input nodes (that are also scheduled) are computed.
+    When a chunk fails, the nodes depending on its node are cancelled and the independent
+    branches carry on. When a chunk is stopped, no new chunk is started.
+    """
+    # Interval (in seconds) at which new nodes are polled while chunks are running
+    pollInterval = 0.5
+
+    def __init__(self, graph, forceCompute=False, resources=None, maxWorkers=None):
+        """
+        Args:
+            graph (Graph): the graph the nodes to compute belong to.
+            forceCompute (bool): compute the chunks even if they are already computed.
+            resources (Resources): the resources shared by the chunks (detected if None).
+            maxWorkers (int): the maximum number of chunks computed at the same time
+                              (MESHROOM_MAX_PARALLEL_CHUNKS or the number of cores if None).
+        """
+        self._graph = graph
+        self._forceCompute = forceCompute
+        self._resources = resources or Resources()
+        self._maxWorkers = maxWorkers or EnvVar.get(EnvVar.MESHROOM_MAX_PARALLEL_CHUNKS) or self._resources.cpuCount
+        self._known = set()
+        # Node => chunks to compute
+        self._chunksToProcess = {}
+        # Node => input nodes that are not computed yet
+        self._waiting = {}
+        self._ready = deque()
+        # Future => (chunk, reserved resources)
+        self._running = {}
+        # Node => number of its chunks not computed yet
+        self._remainingChunks = {}
+        self._failedNodes = set()
+        self._nbStarted = 0
+        self._nbChunks = 0
+        self._stopRequested = threading.Event()
+        # Called with each node cancelled because one of its input nodes failed
+        self.onNodeCancelled = None
+        self.errors = []
+        self.stopped = False
+
+    def addNodes(self, nodes):
+        """ Add nodes to compute. Nodes that are already known are ignored. """
+        newNodes = []
+        for node in nodes:
+            if node in self._known:
+                continue
+            self._known.add(node)
+            if not self._forceCompute and node.isFinishedOrRunning():
+                continue
+            # If a node does not exist anymore, node.chunks becomes a PySide property
+            try:
+                chunks = list(node.chunks)
+            except TypeError:
+                continue
+            chunks = [chunk for chunk in chunks if self._forceCompute or not chunk.isFinishedOrRunning()]
+            if not chunks:
+                continue
+            self._chunksToProcess[node] = chunks
+            self._remainingChunks[node] = len(chunks)
+            self._nbChunks += len(chunks)
+            newNodes.append(node)
+
+        if not newNodes:
+            return
+
+        inputNodes = self._graph._getInputEdgesPerNode(dependenciesOnly=True)
+        for node in newNodes:
+            dependencies = {n for n in inputNodes[node] if n in self._remainingChunks}
+            if dependencies:
+                self._waiting[node] = dependencies
+            else:
+                self._startNode(node)
+
+    def requestStop(self):
+        """ Do not start any new chunk; the running ones are left to finish. """
+        self._stopRequested.set()
+
+    def run(self, pendingNodes=None, shouldContinue=None):
+        """
+        Compute the nodes added with addNodes until there is nothing left to compute.
+
+        Args:
+            pendingNodes (callable): returns the nodes to compute; polled for new nodes while running.
+            shouldContinue (callable): new chunks are only started while it returns True.
+
+        Returns:
+            bool: whether all the chunks have been computed successfully.
+        """
+        with ThreadPoolExecutor(max_workers=self._maxWorkers, thread_name_prefix="MeshroomChunk") as executor:
+            while True:
+                if pendingNodes is not None:
+                    self.addNodes(list(pendingNodes()))
+                if shouldContinue is not None and not shouldContinue():
+                    self.requestStop()
+                if self._stopRequested.is_set():
+                    self._ready.clear()
+                    self._waiting.clear()
+                self._startReadyChunks(executor)
+                if not self._running:
+                    break
+                done, _ = wait(list(self._running), return_when=FIRST_COMPLETED,
+                               timeout=self.pollInterval if pendingNodes is not None else None)
+                for future in done:
+                    self._onChunkDone(future)
+
+        if self._waiting:
+            logging.warning(f"Nodes not computed because of unresolved dependencies: "
+                            f"{[node.name for node in self._waiting]}")
+        return not self.errors and not self.stopped and not self._waiting
+
+    def _startNode(self, node):
+        try:
+            node.preprocess()
+        except Exception as e:
+            logging.error(f"Error on node preprocess: {e}")
+            self.errors.append((node, e))
+            self._onNodeFailed(node)
+            return
+        self._ready.extend(self._chunksToProcess[node])
+
+    def _startReadyChunks(self, executor):
+        while self._ready and len(self._running) < self._maxWorkers:
+            chunk = self._ready[0]
+            if chunk.node in self._failedNodes and self._remainingChunks.get(chunk.node) is None:
+                self._ready.popleft()
+                continue
+            if not self._forceCompute and chunk.isFinishedOrRunning():
+                self._ready.popleft()
+                self._onChunkFinished(chunk)
+                continue
+            requirements = self._resources.requirements(chunk.node)
+            if not self._resources.acquire(requirements):
+                # Keep the order: the first chunk waits for resources to be released rather than
+                # being overtaken by cheaper chunks.
+                break
+            self._ready.popleft()
+            self._nbStarted += 1
+            logging.info(f"[{self._nbStarted}/{self._nbChunks}] {chunk.name} ({chunk.node.nodeType})")
+            future = executor.submit(chunk.process, self._forceCompute)
+            self._running[future] = (chunk, requirements)
+
+    def _onChunkDone(self, future):
+        chunk, requirements = self._running.pop(future)
+        self._resources.release(requirements)
+        error = future.exception()
+        if error is None:
+            self._onChunkFinished(chunk)
+        elif chunk.isStopped():
+            self.stopped = True
+            self.requestStop()
+        else:
+            logging.error(f"Error on node computation: {error}.")
+            self.errors.append((chunk, error))
+            self._onNodeFailed(chunk.node)
+
+    def _onChunkFinished(self, chunk):
+        node = chunk.node
+        if node not in self._remainingChunks:
+            return
+        self._remainingChunks[node] -= 1
+        if self._remainingChunks[node] > 0:
+            return
+        del self._remainingChunks[node]
+        if node in self._failedNodes:
+            return
+        try:
+            node.postprocess()
+        except Exception as e:
+            logging.error(f"Error on node postprocess: {e}")
+            self.errors.append((node, e))
+            self._onNodeFailed(node)
+            return
+
+        for waitingNode, dependencies in list(self._waiting.items()):
+            dependencies.discard(node)
+            if not dependencies:
+                del self._waiting[waitingNode]
+                self._startNode(waitingNode)
+
+    def _onNodeFailed(self, node):
+        """ Cancel the computation of all the nodes depending on the failed node. """
+        self._failedNodes.add(node)
+        # The other chunks of the failed node are still computed
+        if not any(c.node is node for c in self._ready) and \
+                not any(c.node is node for c, _ in self._running.values()):
+            self._remainingChunks.pop(node, None)
+
+        nodesToRemove, _ = self._graph.dfsOnDiscover(startNodes=[node], reverse=True)
+        for n in nodesToRemove[1:]:  # exclude current node
+            if n not in self._remainingChunks or n in self._failedNodes:
+                continue
+            self._waiting.pop(n, None)
+            self._remainingChunks.pop(n, None)
+            self._failedNodes.add(n)
+            if self.onNodeCancelled is not None:
+                self.onNodeCancelled(n)
@@ -1,4 +1,7 @@
-from collections import defaultdict
+from array import array
+from bisect import bisect_left, bisect_right
+import json
+import math
 import subprocess
 import logging
 import psutil
@@ -28,7 +31,170 @@ def bytes2human(n):
     return f'{n:.2f} B'
 
 
+def _toNumber(value):
+    """ Return the value as a float, or None if it is not a number (e.g. a process status). """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SampleBuffer:
+    """
+    Samples of several curves sharing the same times, stored in arrays preallocated for `capacity`
+    samples.
+
+    Raw samples are averaged by groups of `stride` before being stored. When the buffer is full,
+    the stored samples are averaged by pairs and the stride is doubled: the buffer always covers the
+    whole duration, with a resolution decreasing over time, and its size never grows.
+
+    Each stored sample keeps the number of raw samples averaged into it (its weight), as a sample
+    flushed early or started before the stride was doubled holds fewer raw samples than `stride`.
+    The pairs are averaged by weight.
+    """
+    def __init__(self, capacity=1024):
+        if capacity < 2 or capacity % 2:
+            raise ValueError(f"SampleBuffer capacity must be an even number, got {capacity}.")
+        self.capacity = capacity
+        # Number of raw samples averaged in each stored sample
+        self.stride = 1
+        self._size = 0
+        self._times = array('d', [0.0]) * capacity
+        self._weights = array('d', [0.0]) * capacity
+        self._curves = {}
+        self._resetPending()
+
+    def __len__(self):
+        return self._size
+
+    def _resetPending(self):
+        self._pendingCount = 0
+        self._pendingTime = 0.0
+        self._pendingSums = {}
+
+    def add(self, t, values):
+        """
+        Add a raw sample.
+
+        Args:
+            t (float): the time of the sample.
+            values (dict): the value of each curve, curves can be missing.
+        Returns:
+            tuple: the stored sample (time, values, weight) if `stride` raw samples have been averaged into it,
+                   None otherwise.
+        """
+        self._pendingCount += 1
+        self._pendingTime += t
+        for key, value in values.items():
+            sums = self._pendingSums.get(key)
+            if sums is None:
+                self._pendingSums[key] = [value, 1]
+            else:
+                sums[0] += value
+                sums[1] += 1
+        if self._pendingCount < self.stride:
+            return None
+        return self.flush()
+
+    def flush(self):
+        """ Store the raw samples added since the last stored sample, see add. """
+        if not self._pendingCount:
+            return None
+        weight = self._pendingCount
+        t = self._pendingTime / weight
+        values = {key: total / count for key, (total, count) in self._pendingSums.items()}
+        self._resetPending()
+        self.append(t, values, weight)
+        return t, values, weight
+
+    def append(self, t, values, weight=1):
+        """
+        Store a sample as is, e.g. a sample already averaged and read back from a file.
+
+        Args:
+            weight (int): the number of raw samples averaged into the sample.
+        """
+        if self._size == self.capacity:
+            self._downsample()
+        index = self._size
+        self._times[index] = t
+        self._weights[index] = weight
+        for key, value in values.items():
+            if key not in self._curves:
+                self._curves[key] = array('d', [math.nan]) * self.capacity
+        for key, curve in self._curves.items():
+            curve[index] = values.get(key, math.nan)
+        self._size += 1
+
+    def _downsample(self):
+        half = self.capacity // 2
+        times = self._times
+        weights = self._weights
+        for curve in self._curves.values():
+            for i in range(half):
+                a, b = curve[2 * i], curve[2 * i + 1]
+                wa, wb = weights[2 * i], weights[2 * i + 1]
+                curve[i] = b if math.isnan(a) else a if math.isnan(b) else (a * wa + b * wb) / (wa + wb)
+        for i in range(half):
+            wa, wb = weights[2 * i], weights[2 * i + 1]
+            times[i] = (times[2 * i] * wa + times[2 * i + 1] * wb) / (wa + wb)
+            weights[i] = wa + wb
+        self._size = half
+        self.stride *= 2
+
+    def keys(self):
+        return list(self._curves)
+
+    def times(self):
+        return self._times[:self._size].tolist()
+
+    def weights(self):
+        return self._weights[:self._size].tolist()
+
+    def query(self, key, start=None, end=None, maxPoints=None):
+        """
+        Get the samples of a curve.
+
+        Args:
+            key (str): the name of the curve.
+            start (float): only return the samples from this time.
+            end (float): only return the samples up to this time.
+            maxPoints (int): average consecutive samples to return at most this number of samples.
+        Returns:
+            tuple: the list of times and the list of values (NaN where the curve has no value).
+        """
+        curve = self._curves.get(key)
+        if curve is None:
+            return [], []
+        times = self._times[:self._size]
+        first = bisect_left(times, start) if start is not None else 0
+        last = bisect_right(times, end) if end is not None else self._size
+        times = times[first:last].tolist()
+        values = curve[first:last].tolist()
+        if not maxPoints or len(times) <= maxPoints:
+            return times, values
+
+        step = math.ceil(len(times) / maxPoints)
+        groupTimes, groupValues = [], []
+        for i in range(0, len(times), step):
+            groupTimes.append(sum(times[i:i + step]) / len(times[i:i + step]))
+            numbers = [v for v in values[i:i + step] if not math.isnan(v)]
+            groupValues.append(sum(numbers) / len(numbers) if numbers else math.nan)
+        return groupTimes, groupValues
+
+
 class ComputerStatistics:
+    infoKeys = [
+        'nbCores',
+        'cpuFreq',
+        'ramTotal',
+        'ramAvailable',
+        'vramAvailable',
+        'swapAvailable',
+        'gpuMemoryTotal',
+        'gpuName',
+        ]
+
     def __init__(self):
         self.nbCores = 0
         self.cpuFreq = 0
@@ -38,7 +204,8 @@ class ComputerStatistics:
         self.swapAvailable = 0
         self.gpuMemoryTotal = 0
         self.gpuName = ''
-        self.curves = defaultdict(list)
+        # Values of the last sample, by curve name
+        self.values = {}
         self.nvidia_smi = None
         self._isInit = False
 
@@ -71,9 +238,12 @@ class ComputerStatistics:
             for ki, vi in enumerate(v):
                 self._addKV(k + '.' + str(ki), vi)
         else:
-            self.curves[k].append(v)
+            v = _toNumber(v)
+            if v is not None:
+                self.values[k] = v
 
     def update(self):
+        self.values = {}
         try:
             self.initOnFirstTime()
             # Interval=None => non-blocking (percentage since last call)
@@ -134,11 +304,12 @@ class ComputerStatistics:
             return
 
     def toDict(self):
-        return self.__dict__
+        return {k: getattr(self, k) for k in self.infoKeys}
 
     def fromDict(self, d):
         for k, v in d.items():
-            setattr(self, k, v)
+            if k in self.infoKeys:
+                setattr(self, k, v)
 
 
 class ProcStatistics:
@@ -181,7 +352,10 @@ class ProcStatistics:
         self.iterIndex = 0
         self.lastIterIndexWithFiles = -1
         self.duration = 0  # computation time set at the end of the execution
-        self.curves = defaultdict(list)
+        # Highest resident memory of the process over the samples (in bytes)
+        self.peakMemory = 0
+        # Values of the last sample, by curve name
+        self.values = {}
         self.openFiles = {}
 
     def _addKV(self, k, v):
@@ -192,15 +366,19 @@ class ProcStatistics:
             for ki, vi in enumerate(v):
                 self._addKV(k + '.' + str(ki), vi)
         else:
-            self.curves[k].append(v)
+            v = _toNumber(v)
+            if v is not None:
+                self.values[k] = v
 
     def update(self, proc):
         '''
         proc: psutil.Process object
         '''
+        self.values = {}
         data = proc.as_dict(self.dynamicKeys)
         for k, v in data.items():
             self._addKV(k, v)
+        self.peakMemory = max(self.peakMemory, int(self.values.get('memory_info.rss', 0)))
 
         # Note: Do not collect stats about open files for now,
         #        as there is bug in psutil-5.7.2 on Windows which crashes the application.
@@ -219,26 +397,46 @@ class ProcStatistics:
     def toDict(self):
         return {
             'duration': self.duration,
-            'curves': self.curves,
             'openFiles': self.openFiles,
         }
 
     def fromDict(self, d):
         self.duration = d.get('duration', 0)
-        self.curves = d.get('curves', defaultdict(list))
         self.openFiles = d.get('openFiles', {})
 
 
 class Statistics:
     """
+    Statistics of a chunk computation, sampled at a regular interval.
+
+    The curves of the computer and of the process are stored in a SampleBuffer, so the memory used
+    does not depend on the duration of the computation.
+
+    The statistics file contains one JSON object per line: a header with the information about the
+    computer, then the samples. The file is written once and the new samples are then appended to it,
+    and readers only parse the lines appended since their last read. As samples are downsampled over
+    time, the number of lines grows logarithmically with the duration.
     """
-    fileVersion = 2.0
+    fileVersion = 3.0
 
-    def __init__(self):
+    def __init__(self, capacity=1024):
         self.computer = ComputerStatistics()
         self.process = ProcStatistics()
-        self.times = []
+        self.samples = SampleBuffer(capacity)
         self.interval = 10  # refresh interval in seconds
+        # Stored samples not written to the statistics file yet
+        self._unsavedSamples = []
+        self._savedFilepath = None
+        self._savedInfo = None
+        # (filepath, inode, offset) of the statistics file read by load
+        self._readState = None
+        # Number of stored samples, to know whether the statistics changed
+        self._version = 0
+        self._loadedVersion = 0
+
+    @property
+    def times(self):
+        return self.samples.times()
 
     def update(self, proc):
         '''
@@ -246,16 +444,153 @@ class Statistics:
         '''
         if proc is None or not proc.is_running():
             return False
-        self.times.append(time.time())
+        t = time.time()
         self.computer.update()
         self.process.update(proc)
+        values = {'computer.' + k: v for k, v in self.computer.values.items()}
+        values.update(('process.' + k, v) for k, v in self.process.values.items())
+        self._onSampleStored(self.samples.add(t, values))
         return True
 
-    def toDict(self):
+    def flush(self):
+        """ Store the raw samples that have not been averaged into a stored sample yet. """
+        self._onSampleStored(self.samples.flush())
+
+    def _onSampleStored(self, sample):
+        if sample is not None:
+            self._unsavedSamples.append(sample)
+            self._version += 1
+
+    def curveNames(self):
+        """ Names of the curves, prefixed by 'computer.' or 'process.'. """
+        return self.samples.keys()
+
+    def query(self, name, start=None, end=None, maxPoints=None):
+        """
+        Get the samples of a curve, see SampleBuffer.query.
+
+        Args:
+            name (str): the name of the curve, e.g. 'computer.ramUsage' or 'process.memory_info.rss'.
+        """
+        return self.samples.query(name, start, end, maxPoints)
+
+    def _info(self):
         return {
-            'fileVersion': self.fileVersion,
+            'interval': self.interval,
             'computer': self.computer.toDict(),
             'process': self.process.toDict(),
+        }
+
+    @staticmethod
+    def _sampleLine(sample):
+        t, values, weight = sample
+        values = {k: v for k, v in values.items() if not math.isnan(v)}
+        entry = {'t': t, 'v': values}
+        if weight != 1:
+            entry['n'] = int(weight)
+        return json.dumps(entry, separators=(',', ':')) + '\n'
+
+    def save(self, filepath):
+        """
+        Write the statistics file.
+        The file is only written entirely the first time, the following samples are appended to it.
+        """
+        info = self._info()
+        if filepath != self._savedFilepath:
+            from meshroom.core.node import getWritingFilepath, renameWritingToFinalPath
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            header = dict(fileVersion=self.fileVersion, **info)
+            lines = [json.dumps(header) + '\n']
+            samples = zip(self.samples.times(), self._storedValues(), self.samples.weights())
+            lines += [self._sampleLine(sample) for sample in samples]
+            writingFilepath = getWritingFilepath(filepath)
+            with open(writingFilepath, 'w') as f:
+                f.writelines(lines)
+            renameWritingToFinalPath(writingFilepath, filepath)
+        elif self._unsavedSamples or info != self._savedInfo:
+            lines = [json.dumps(info) + '\n'] if info != self._savedInfo else []
+            lines += [self._sampleLine(sample) for sample in self._unsavedSamples]
+            with open(filepath, 'a') as f:
+                f.writelines(lines)
+        self._savedFilepath = filepath
+        self._savedInfo = info
+        self._unsavedSamples = []
+
+    def _storedValues(self):
+        curves = {key: self.samples.query(key)[1] for key in self.samples.keys()}
+        for i in range(len(self.samples)):
+            yield {key: values[i] for key, values in curves.items()}
+
+    def load(self, filepath):
+        """
+        Read the statistics file, only parsing the lines appended since the last call when possible.
+
+        Returns:
+            bool: whether the statistics changed since the last call.
+        """
+        if filepath == self._savedFilepath:
+            # Written by this instance, which is already up to date
+            changed = self._version != self._loadedVersion
+            self._loadedVersion = self._version
+            return changed
+
+        stat = os.stat(filepath)
+        offset = 0
+        if self._readState and self._readState[:2] == (filepath, stat.st_ino) and stat.st_size >= self._readState[2]:
+            offset = self._readState[2]
+            if stat.st_size == offset:
+                return False
+        with open(filepath, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        if not data:
+            return False
+
+        if offset == 0:
+            self._clear()
+            firstLine = data.split(b'\n', 1)[0]
+            try:
+                json.loads(firstLine)
+            except ValueError:
+                # Statistics file written as a single JSON document (fileVersion 2.0)
+                self.fromDict(json.loads(data))
+                self._readState = (filepath, stat.st_ino, len(data))
+                return True
+
+        # The last line may still be being written
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._readEntry(json.loads(line))
+        self._readState = (filepath, stat.st_ino, offset + end)
+        return end > 0
+
+    def _clear(self):
+        self.computer = ComputerStatistics()
+        self.process = ProcStatistics()
+        self.samples = SampleBuffer(self.samples.capacity)
+        self._unsavedSamples = []
+
+    def _readEntry(self, entry):
+        if 't' in entry:
+            self.samples.append(entry['t'], entry['v'], entry.get('n', 1))
+            return
+        version = entry.get('fileVersion')
+        if version is not None and version != self.fileVersion:
+            logging.debug(f'Statistics: file version was {version} and the current version is {self.fileVersion}.')
+        self.interval = entry.get('interval', self.interval)
+        self.computer.fromDict(entry.get('computer', {}))
+        self.process.fromDict(entry.get('process', {}))
+
+    def toDict(self):
+        curves = {'computer': {}, 'process': {}}
+        for key in self.samples.keys():
+            section, name = key.split('.', 1)
+            curves[section][name] = [None if math.isnan(v) else v for v in self.samples.query(key)[1]]
+        return {
+            'fileVersion': self.fileVersion,
+            'computer': dict(self.computer.toDict(), curves=curves['computer']),
+            'process': dict(self.process.toDict(), curves=curves['process']),
             'times': self.times,
             'interval': self.interval
             }
@@ -264,9 +599,8 @@ class Statistics:
         version = d.get('fileVersion', 0.0)
         if version != self.fileVersion:
             logging.debug(f'Statistics: file version was {version} and the current version is {self.fileVersion}.')
-        self.computer = ComputerStatistics()
-        self.process = ProcStatistics()
-        self.times = []
+        self._clear()
+        self.interval = d.get('interval', self.interval)
         try:
             self.computer.fromDict(d.get('computer', {}))
         except Exception as e:
@@ -276,7 +610,17 @@ class Statistics:
         except Exception as e:
             logging.debug(f'Failed while loading statistics: process: "{e}".')
         try:
-            self.times = d.get('times', [])
+            curves = {}
+            for section in ('computer', 'process'):
+                for name, values in d.get(section, {}).get('curves', {}).items():
+                    curves[section + '.' + name] = values
+            for i, t in enumerate(d.get('times', [])):
+                values = {}
+                for key, curve in curves.items():
+                    value = _toNumber(curve[i]) if i < len(curve) else None
+                    if value is not None:
+                        values[key] = value
+                self.samples.append(t, values)
         except Exception as e:
             logging.debug(f'Failed while loading statistics: times: "{e}".')
 
@@ -306,6 +650,8 @@ class StatisticsThread(threading.Thread):
                     # update stats one last time and exit main loop
                     if self.proc.is_running():
                         self.updateStats()
+                    self.chunk.statistics.flush()
+                    self.chunk.saveStatistics()
                     return
         except (KeyboardInterrupt, SystemError, GeneratorExit, psutil.NoSuchProcess):
             pass
@@ -0,0 +1,306 @@
+"""
+Storage of the status of NodeChunks.
+
+The status of each chunk is historically a JSON file in the internal folder of its node
+("status" or "<iteration>.status"). Reading them one by one on each graph update is costly for
+large graphs on network storage, so the status are read in batches through a StatusStore:
+ - FileStatusStore keeps the file layout, lists each node folder once and only loads the files
+   whose modification time or size changed since they were last read.
+ - SqliteStatusStore keeps all the status of a cache folder in a single SQLite database in WAL
+   mode, read with one query per batch of chunks. Status files written before switching to this
+   backend, or by processes still using the files backend, are imported when they change, and
+   exportStatusFiles writes the database back as status files
+   (python -m meshroom.core.statusStore <cacheDir>).
+
+The backend is selected with the MESHROOM_STATUS_BACKEND environment variable.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, namedtuple
+from enum import Enum
+
+from meshroom.env import EnvVar
+
+
+# key: identifies the version of the stored status (None if there is no status)
+# modTime: time of the last modification of the status (-1 if there is no status)
+# data: the status as a dict, None if it has not changed since the known key
+StatusEntry = namedtuple("StatusEntry", ["key", "modTime", "data"])
+
+MISSING_STATUS = StatusEntry(None, -1, None)
+
+
+class StatusStore:
+    """
+    Base class of the storages of chunks status, identified by the path of their status file.
+    """
+    def read(self, statusFile, knownKey=None):
+        """
+        Read the status stored for the given status file.
+
+        Args:
+            statusFile (str): the path to the status file.
+            knownKey: the key of the last version read, the data is not loaded again if unchanged.
+        Returns:
+            StatusEntry: the status entry.
+        """
+        return self.readMany({statusFile: knownKey})[statusFile]
+
+    def readMany(self, knownKeys):
+        """
+        Read the status stored for several status files at once.
+
+        Args:
+            knownKeys (dict): the key of the last version read for each status file path.
+        Returns:
+            dict: the StatusEntry for each status file path.
+        """
+        raise NotImplementedError()
+
+    def write(self, statusFile, data):
+        """ Store the status data for the given status file. """
+        raise NotImplementedError()
+
+    def removeFolder(self, folder):
+        """ Forget the status stored for the status files within the given folder. """
+        pass
+
+
+def _jsonDefault(obj):
+    if isinstance(obj, Enum):
+        return obj.name
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _writeJsonFile(filepath, data):
+    """ Write data as JSON next to filepath and then replace it, so readers never get a partial file. """
+    from meshroom.core.node import getWritingFilepath, renameWritingToFinalPath
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    writingFilepath = getWritingFilepath(filepath)
+    with open(writingFilepath, 'w') as jsonFile:
+        json.dump(data, jsonFile, indent=4, default=_jsonDefault)
+    renameWritingToFinalPath(writingFilepath, filepath)
+
+
+def _loadJsonFile(filepath):
+    try:
+        with open(filepath) as jsonFile:
+            return json.load(jsonFile)
+    except Exception as e:
+        logging.debug(f"Error while loading status file {filepath}: {e}")
+        return None
+
+
+class FileStatusStore(StatusStore):
+    """
+    Status stored as one JSON file per chunk.
+    """
+    def read(self, statusFile, knownKey=None):
+        try:
+            stat = os.stat(statusFile)
+        except OSError:
+            return MISSING_STATUS
+        return self._readFile(statusFile, stat, knownKey)
+
+    def readMany(self, knownKeys):
+        entries = {}
+        statusFilesPerFolder = defaultdict(list)
+        for statusFile in knownKeys:
+            statusFilesPerFolder[os.path.dirname(statusFile)].append(statusFile)
+
+        for folder, statusFiles in statusFilesPerFolder.items():
+            # List the folder once rather than checking each file
+            try:
+                with os.scandir(folder or '.') as it:
+                    folderEntries = {entry.name: entry for entry in it}
+            except OSError:
+                folderEntries = {}
+            for statusFile in statusFiles:
+                entry = folderEntries.get(os.path.basename(statusFile))
+                try:
+                    stat = entry.stat() if entry else None
+                except OSError:
+                    stat = None
+                if stat is None:
+                    entries[statusFile] = MISSING_STATUS
+                else:
+                    entries[statusFile] = self._readFile(statusFile, stat, knownKeys[statusFile])
+        return entries
+
+    @staticmethod
+    def _readFile(statusFile, stat, knownKey):
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key == knownKey:
+            return StatusEntry(key, stat.st_mtime, None)
+        data = _loadJsonFile(statusFile)
+        if data is None:
+            return MISSING_STATUS
+        return StatusEntry(key, stat.st_mtime, data)
+
+    def write(self, statusFile, data):
+        _writeJsonFile(statusFile, data)
+
+
+class SqliteStatusStore(StatusStore):
+    """
+    Status of all the chunks of a cache folder stored in a single SQLite database.
+
+    Status files are identified by their path relative to the cache folder, so the cache folder can
+    be moved. The database is in WAL mode so that it can be read while other processes (computing
+    chunks) write to it.
+    """
+    databaseName = "status.db"
+    # Maximum number of status read per query, below the SQLite limit of host parameters
+    readBatchSize = 500
+
+    def __init__(self, cacheDir, importFiles=True):
+        """
+        Args:
+            cacheDir (str): the cache folder containing the database.
+            importFiles (bool): read the status files of the chunks that are not in the database.
+        """
+        self._cacheDir = cacheDir
+        self._databasePath = os.path.join(cacheDir, self.databaseName)
+        self._importFiles = importFiles
+        # Key of the status files when they were last imported (None if there was none)
+        self._imported = {}
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self, create):
+        if self._connection is None:
+            if not create and not os.path.exists(self._databasePath):
+                return None
+            os.makedirs(self._cacheDir, exist_ok=True)
+            connection = sqlite3.connect(self._databasePath, timeout=30, check_same_thread=False,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS status ("
+                               "path TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                               "version INTEGER NOT NULL, modTime REAL NOT NULL)")
+            self._connection = connection
+        return self._connection
+
+    def _relativePath(self, statusFile):
+        path = os.path.relpath(os.path.abspath(statusFile), os.path.abspath(self._cacheDir))
+        return path.replace(os.path.sep, "/")
+
+    def readMany(self, knownKeys):
+        paths = {self._relativePath(statusFile): statusFile for statusFile in knownKeys}
+        entries = {}
+        with self._lock:
+            connection = self._connect(create=False)
+            relativePaths = list(paths) if connection else []
+            for start in range(0, len(relativePaths), self.readBatchSize):
+                batch = relativePaths[start:start + self.readBatchSize]
+                rows = connection.execute(
+                    "SELECT path, data, version, modTime FROM status "
+                    f"WHERE path IN ({', '.join('?' * len(batch))})", batch)
+                for path, data, version, modTime in rows:
+                    statusFile = paths[path]
+                    key = (version, modTime)
+                    entries[statusFile] = StatusEntry(
+                        key, modTime, None if key == knownKeys[statusFile] else json.loads(data))
+
+        if self._importFiles:
+            # Import the status files that are not in the database, or that changed since they were
+            # imported (written by a process using the files backend).
+            toImport = {statusFile: self._imported.get(statusFile) for statusFile in knownKeys
+                        if statusFile not in entries or statusFile in self._imported}
+            if toImport:
+                for statusFile, entry in FileStatusStore().readMany(toImport).items():
+                    self._imported[statusFile] = entry.key
+                    if entry.data is not None:
+                        entries[statusFile] = self._write(statusFile, entry.data, entry.modTime)
+
+        for statusFile in knownKeys:
+            entries.setdefault(statusFile, MISSING_STATUS)
+        return entries
+
+    def write(self, statusFile, data):
+        self._write(statusFile, data, time.time())
+
+    def _write(self, statusFile, data, modTime):
+        # Round trip through JSON, as done when reading the status file back
+        text = json.dumps(data, default=_jsonDefault)
+        with self._lock:
+            connection = self._connect(create=True)
+            path = self._relativePath(statusFile)
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.execute(
+                    "INSERT INTO status VALUES (?, ?, 1, ?) ON CONFLICT(path) DO UPDATE SET "
+                    "data = excluded.data, version = version + 1, modTime = excluded.modTime",
+                    (path, text, modTime))
+                version, = connection.execute("SELECT version FROM status WHERE path = ?", (path,)).fetchone()
+        return StatusEntry((version, modTime), modTime, json.loads(text))
+
+    def removeFolder(self, folder):
+        path = self._relativePath(folder)
+        with self._lock:
+            self._imported = {f: key for f, key in self._imported.items()
+                              if not self._relativePath(f).startswith(path + "/")}
+            connection = self._connect(create=False)
+            if connection:
+                connection.execute("DELETE FROM status WHERE path LIKE ? ESCAPE '\\'",
+                                   (path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "/%",))
+
+    def exportStatusFiles(self):
+        """
+        Write the status stored in the database as status files, the layout used by FileStatusStore.
+
+        Returns:
+            int: the number of status files written.
+        """
+        with self._lock:
+            connection = self._connect(create=False)
+            rows = connection.execute("SELECT path, data FROM status").fetchall() if connection else []
+        for path, data in rows:
+            _writeJsonFile(os.path.join(self._cacheDir, *path.split("/")), json.loads(data))
+        return len(rows)
+
+
+_stores = {}
+_storesLock = threading.Lock()
+
+
+def getStatusStore(cacheDir):
+    """
+    Return the StatusStore for the given cache folder, based on MESHROOM_STATUS_BACKEND.
+    """
+    backend = EnvVar.get(EnvVar.MESHROOM_STATUS_BACKEND)
+    if backend == "files" or (backend == "sqlite" and not cacheDir):
+        # Without cache folder, there is nowhere to put a database
+        backend, cacheDir = "files", ""
+    elif backend != "sqlite":
+        raise ValueError(f"Unknown status backend '{backend}', expected 'files' or 'sqlite'.")
+
+    key = (backend, cacheDir)
+    with _storesLock:
+        store = _stores.get(key)
+        if store is None:
+            store = FileStatusStore() if backend == "files" else SqliteStatusStore(cacheDir)
+            _stores[key] = store
+    return store
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Write the status stored in the SQLite database of a cache folder as status files, "
+                    "to switch back to the files backend.")
+    parser.add_argument("cacheDir", help="The cache folder of the project containing the status database.")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.cacheDir, SqliteStatusStore.databaseName)):
+        parser.exit(1, f"There is no status database in '{args.cacheDir}'.\n")
+    store = SqliteStatusStore(args.cacheDir, importFiles=False)
+    print(f"{store.exportStatusFiles()} status files written.")
+
+
+if __name__ == "__main__":
+    main()
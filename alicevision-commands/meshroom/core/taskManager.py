@@ -6,6 +6,7 @@ import meshroom
 from meshroom.common import BaseObject, DictModel, Property, Signal, Slot
 from meshroom.core.node import Status, Node
 from meshroom.core.graph import Graph
+from meshroom.core.scheduler import ChunkScheduler
 import meshroom.core.graph
 
 
@@ -22,7 +23,7 @@ class State(Enum):
 
 class TaskThread(Thread):
     """
-    A thread with a pile of nodes to compute
+    A thread with a pile of nodes to compute, whose chunks are computed in parallel (see ChunkScheduler)
     """
     def __init__(self, manager):
         Thread.__init__(self, target=self.run)
@@ -37,61 +38,27 @@ class TaskThread(Thread):
         """ Consume compute tasks. """
         self._state = State.RUNNING
 
-        stopAndRestart = False
+        # Nodes added to the manager while running are picked up by the scheduler
+        scheduler = ChunkScheduler(self._manager._graph, forceCompute=self.forceCompute)
+        scheduler.onNodeCancelled = self._onNodeCancelled
+        scheduler.run(pendingNodes=lambda: self._manager._nodesToProcess, shouldContinue=self.isRunning)
 
-        for nId, node in enumerate(self._manager._nodesToProcess):
-
-            # skip already finished/running nodes
-            if node.isFinishedOrRunning():
-                continue
-
-            # if a node does not exist anymore, node.chunks becomes a PySide property
-            try:
-                multiChunks = len(node.chunks) > 1
-            except TypeError:
-                continue
-
-            node.preprocess()
-            for cId, chunk in enumerate(node.chunks):
-                if chunk.isFinishedOrRunning() or not self.isRunning():
-                    continue
-
-                if multiChunks:
-                    logging.info('[{node}/{nbNodes}]({chunk}/{nbChunks}) {nodeName}'.format(
-                        node=nId+1, nbNodes=len(self._manager._nodesToProcess),
-                        chunk=cId+1, nbChunks=len(node.chunks), nodeName=node.nodeType))
-                else:
-                    logging.info('[{node}/{nbNodes}] {nodeName}'.format(
-                        node=nId+1, nbNodes=len(self._manager._nodesToProcess), nodeName=node.nodeType))
-                try:
-                    chunk.process(self.forceCompute)
-                except Exception as e:
-                    if chunk.isStopped():
-                        stopAndRestart = True
-                        break
-                    else:
-                        logging.error(f"Error on node computation: {e}.")
-                        nodesToRemove, _ = self._manager._graph.dfsOnDiscover(startNodes=[node], reverse=True)
-                        # remove following nodes from the task queue
-                        for n in nodesToRemove[1:]:  # exclude current node
-                            try:
-                                self._manager._nodesToProcess.remove(n)
-                            except ValueError:
-                                # Node already removed (for instance a global clear of _nodesToProcess)
-                                pass
-                            n.clearSubmittedChunks()
-            node.postprocess()
-
-            if stopAndRestart:
-                break
-
-        if stopAndRestart:
+        if scheduler.stopped:
             self._state = State.STOPPED
             self._manager.restartRequested.emit()
         else:
             self._manager._nodesToProcess = []
             self._state = State.DEAD
 
+    def _onNodeCancelled(self, node):
+        """ Remove a node following a failed node from the task queue. """
+        try:
+            self._manager._nodesToProcess.remove(node)
+        except ValueError:
+            # Node already removed (for instance a global clear of _nodesToProcess)
+            pass
+        node.clearSubmittedChunks()
+
 
 class TaskManager(BaseObject):
     """
@@ -0,0 +1,284 @@
+"""
+Execution trace of the computation of a graph.
+
+The status of each chunk records when it was submitted, started and ended, and the peak memory of
+its process as sampled by the statistics (see ProcStatistics). The ExecutionTrace gathers them to
+show where the wall time of a computation went:
+ - the time each chunk waited for resources once its input nodes were computed,
+ - the critical path: the chain of dependent nodes bounding the computation time, however many
+   chunks are computed in parallel,
+and exports them as Chrome trace events (chrome://tracing, https://ui.perfetto.dev) along with a
+text summary, with `python -m meshroom.core.trace <project.mg>`.
+"""
+import datetime
+import json
+import logging
+
+from meshroom.core.graph import Visitor
+from meshroom.core.node import Status, StatusData
+
+
+def _parseDateTime(value):
+    """ Return the timestamp of a date time of a StatusData, None if it is not set. """
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, StatusData.dateTimeFormatting).timestamp()
+    except ValueError:
+        return None
+
+
+def _formatDuration(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours}:{minutes:02d}:{seconds:04.1f}"
+
+
+def _formatMemory(size):
+    return f"{size / 1024 ** 3:.2f} GB" if size else "-"
+
+
+class ChunkTrace:
+    """
+    Timings of the computation of a NodeChunk, read from its status.
+    """
+    def __init__(self, chunk):
+        status = chunk.status
+        self.name = chunk.name
+        self.node = chunk.node
+        self.index = chunk.index
+        self.status = status.status
+        self.hostname = status.hostname
+        self.submitTime = _parseDateTime(status.submitDateTime)
+        self.startTime = _parseDateTime(status.startDateTime)
+        self.endTime = _parseDateTime(status.endDateTime)
+        self.peakMemory = status.peakMemory
+        # Time from which the chunk could have been computed, set by the ExecutionTrace
+        self.readyTime = self.submitTime
+
+    @property
+    def isComplete(self):
+        return self.startTime is not None and self.endTime is not None and self.endTime >= self.startTime
+
+    @property
+    def duration(self):
+        return self.endTime - self.startTime
+
+    @property
+    def queueWait(self):
+        """ Time spent waiting for resources once the chunk could be computed. """
+        if self.readyTime is None:
+            return 0.0
+        return max(0.0, self.startTime - self.readyTime)
+
+
+class ExecutionTrace:
+    """
+    Timings of the chunks of a graph computed in its current cache folder.
+    """
+    def __init__(self, graph, nodes=None):
+        """
+        Args:
+            graph (Graph): the computed graph.
+            nodes (list of Node): only trace these nodes (all nodes if None).
+        """
+        self.graph = graph
+        graph.updateStatusFromCache(force=True)
+        self.chunks = {}
+        for node in nodes or graph.nodes:
+            chunks = [ChunkTrace(chunk) for chunk in node.chunks]
+            chunks = [chunk for chunk in chunks if chunk.isComplete and chunk.status != Status.RUNNING]
+            if chunks:
+                self.chunks[node] = chunks
+
+        # A chunk can be computed once it is submitted and all its input nodes are computed
+        for node, chunks in self.chunks.items():
+            inputEnds = [self.nodeEnd(inputNode)
+                         for inputNode in graph.getInputNodes(node, recursive=False, dependenciesOnly=True)
+                         if inputNode in self.chunks]
+            for chunk in chunks:
+                times = [t for t in [chunk.submitTime] + inputEnds if t is not None]
+                chunk.readyTime = max(times) if times else None
+
+    def allChunks(self):
+        return [chunk for chunks in self.chunks.values() for chunk in chunks]
+
+    def nodeStart(self, node):
+        return min(chunk.startTime for chunk in self.chunks[node])
+
+    def nodeEnd(self, node):
+        return max(chunk.endTime for chunk in self.chunks[node])
+
+    def nodeSpan(self, node):
+        """ Wall time of the node, from the start of its first chunk to the end of its last chunk. """
+        if node not in self.chunks:
+            return 0.0
+        return self.nodeEnd(node) - self.nodeStart(node)
+
+    def nodeSelfTime(self, node):
+        """ Computation time of the node, summed over its chunks. """
+        return sum(chunk.duration for chunk in self.chunks.get(node, []))
+
+    def criticalPath(self):
+        """
+        Return the longest chain of dependent nodes, weighted by their wall time.
+
+        Returns:
+            tuple: the list of nodes of the path, from the graph roots to the leaves, and its length (in seconds).
+        """
+        pathEnds = {}
+        bestInputs = {}
+        visitor = Visitor(reverse=False, dependenciesOnly=True)
+
+        def finishEdge(edge, graph):
+            # The input node v is finished: the path to u may go through it
+            u, v = edge
+            if u not in bestInputs or pathEnds[v] > pathEnds[bestInputs[u]]:
+                bestInputs[u] = v
+
+        def finishVertex(vertex, graph):
+            bestInput = bestInputs.get(vertex)
+            pathEnds[vertex] = (pathEnds[bestInput] if bestInput is not None else 0.0) + self.nodeSpan(vertex)
+
+        visitor.finishEdge = finishEdge
+        visitor.finishVertex = finishVertex
+        self.graph.dfs(visitor=visitor, startNodes=list(self.chunks) or None)
+        if not pathEnds:
+            return [], 0.0
+
+        node = max(pathEnds, key=lambda n: pathEnds[n])
+        length = pathEnds[node]
+        path = []
+        while node is not None:
+            path.append(node)
+            node = bestInputs.get(node)
+        path.reverse()
+        return [node for node in path if node in self.chunks], length
+
+    def _lanes(self, chunks):
+        """ Assign each chunk to the first lane of its host free at its start time. """
+        lanes = {}
+        lanesEnd = {}
+        for chunk in sorted(chunks, key=lambda c: (c.startTime, c.endTime)):
+            ends = lanesEnd.setdefault(chunk.hostname, [])
+            for lane, end in enumerate(ends):
+                if end <= chunk.startTime:
+                    break
+            else:
+                lane = len(ends)
+                ends.append(0.0)
+            ends[lane] = chunk.endTime
+            lanes[chunk] = lane
+        return lanes
+
+    def toChromeTrace(self):
+        """
+        Return the chunks as Chrome trace events: one process per host and one thread per lane of
+        chunks computed in parallel. The chunks of the critical path are in the "criticalPath" category.
+        """
+        chunks = self.allChunks()
+        if not chunks:
+            return {"traceEvents": [], "displayTimeUnit": "ms"}
+        origin = min(chunk.startTime for chunk in chunks)
+        criticalNodes = set(self.criticalPath()[0])
+        lanes = self._lanes(chunks)
+        hosts = {hostname: i + 1 for i, hostname in enumerate(sorted({chunk.hostname for chunk in chunks}))}
+
+        events = []
+        for hostname, pid in hosts.items():
+            events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": hostname or "localhost"}})
+        for (hostname, lane) in sorted({(chunk.hostname, lanes[chunk]) for chunk in chunks}):
+            events.append({"name": "thread_name", "ph": "M", "pid": hosts[hostname], "tid": lane,
+                           "args": {"name": f"Lane {lane}"}})
+        for chunk in sorted(chunks, key=lambda c: c.startTime):
+            categories = [chunk.node.nodeType] + (["criticalPath"] if chunk.node in criticalNodes else [])
+            events.append({
+                "name": chunk.name,
+                "cat": ",".join(categories),
+                "ph": "X",
+                "ts": (chunk.startTime - origin) * 1e6,
+                "dur": chunk.duration * 1e6,
+                "pid": hosts[chunk.hostname],
+                "tid": lanes[chunk],
+                "args": {
+                    "node": chunk.node.name,
+                    "chunk": chunk.index,
+                    "status": chunk.status.name,
+                    "queueWait": chunk.queueWait,
+                    "peakMemory": chunk.peakMemory,
+                },
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def saveChromeTrace(self, filepath):
+        with open(filepath, "w") as f:
+            json.dump(self.toChromeTrace(), f)
+
+    def summary(self, top=10):
+        """ Return a text summary: the nodes taking the most time, and the critical path. """
+        chunks = self.allChunks()
+        if not chunks:
+            return "No computed chunk to trace."
+        wallTime = max(chunk.endTime for chunk in chunks) - min(chunk.startTime for chunk in chunks)
+        computeTime = sum(chunk.duration for chunk in chunks)
+        path, pathLength = self.criticalPath()
+        lines = [
+            f"Wall time: {_formatDuration(wallTime)}, computation time: {_formatDuration(computeTime)} "
+            f"in {len(chunks)} chunks (average parallelism: {computeTime / wallTime if wallTime else 1:.1f})",
+            f"Critical path: {_formatDuration(pathLength)} through {len(path)} nodes, "
+            f"queue wait: {_formatDuration(sum(c.queueWait for c in chunks))}",
+        ]
+
+        def table(title, header, rows):
+            lines.extend(["", title])
+            widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+            for row in [header] + rows:
+                lines.append("  ".join(value.ljust(width) if i == 0 else value.rjust(width)
+                                       for i, (value, width) in enumerate(zip(row, widths))))
+
+        def nodeRow(node, time, total):
+            nodeChunks = self.chunks[node]
+            return (node.name, str(len(nodeChunks)), _formatDuration(time),
+                    f"{100 * time / total:.0f}%" if total else "-",
+                    _formatDuration(sum(c.queueWait for c in nodeChunks)),
+                    _formatMemory(max(c.peakMemory for c in nodeChunks)))
+
+        header = ("Node", "Chunks", "Time", "Share", "Queue wait", "Peak memory")
+        bySelfTime = sorted(self.chunks, key=self.nodeSelfTime, reverse=True)[:top]
+        table(f"Top {len(bySelfTime)} nodes by computation time",
+              header, [nodeRow(node, self.nodeSelfTime(node), computeTime) for node in bySelfTime])
+        byContribution = sorted(path, key=self.nodeSpan, reverse=True)[:top]
+        table(f"Top {len(byContribution)} nodes by critical path contribution",
+              header, [nodeRow(node, self.nodeSpan(node), pathLength) for node in byContribution])
+        return "\n".join(lines)
+
+
+def main():
+    import argparse
+    from meshroom.core.graph import loadGraph
+    parser = argparse.ArgumentParser(description="Summarize where the computation time of a Meshroom project went.")
+    parser.add_argument("graphFile", help="Meshroom project file (.mg).")
+    parser.add_argument("--node", metavar="NODE_NAME", action="append",
+                        help="Only trace this node (can be repeated).")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Export the chunks as Chrome trace events (chrome://tracing) to this JSON file.")
+    parser.add_argument("--top", type=int, default=10, help="Number of nodes listed in the summary.")
+    args = parser.parse_args()
+
+    import meshroom.core
+    meshroom.setupEnvironment()
+    meshroom.core.initNodes()
+    meshroom.core.initPlugins()
+    graph = loadGraph(args.graphFile)
+    nodes = None
+    if args.node:
+        nodes = graph.findNodes(args.node)
+    trace = ExecutionTrace(graph, nodes)
+    if args.trace:
+        trace.saveChromeTrace(args.trace)
+        logging.info(f"Chrome trace written to '{args.trace}'.")
+    print(trace.summary(args.top))
+
+
+if __name__ == "__main__":
+    main()
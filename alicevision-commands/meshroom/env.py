@@ -47,6 +47,34 @@ class EnvVar(Enum):
     MESHROOM_SUBMITTERS_PATH = VarDefinition(str, "", "Paths to set of submitters folders")
     MESHROOM_PIPELINE_TEMPLATES_PATH = VarDefinition(str, "", "Paths to et of pipeline templates folders")
     MESHROOM_TEMP_PATH = VarDefinition(str, tempfile.gettempdir(), "Path to the temporary folder")
+    MESHROOM_PLUGIN_INDEX = VarDefinition(
+        str, os.path.join(os.path.expanduser("~"), ".meshroom", "pluginIndex.json"),
+        "Path to the index of the node types found in plugins, to register them without importing them (empty: disabled)"
+    )
+    MESHROOM_STATUS_BACKEND = VarDefinition(
+        str, "files", "Storage of the nodes status: 'files' (one file per chunk) or 'sqlite' (one database per cache folder)"
+    )
+    MESHROOM_MAX_PARALLEL_CHUNKS = VarDefinition(
+        int, "0", "Maximum number of chunks computed in parallel locally (0: number of available cores)"
+    )
+    MESHROOM_OUTPUT_CACHE = VarDefinition(
+        str, "", "Path to the cache of node outputs shared between projects (empty: disabled)"
+    )
+    MESHROOM_OUTPUT_CACHE_SIZE = VarDefinition(
+        float, "100", "Disk budget of the shared cache of node outputs (in GB)"
+    )
+
+    # Submitters
+    MESHROOM_LOCALPOOL_QUEUE = VarDefinition(
+        str, os.path.join(os.path.expanduser("~"), ".meshroom", "localPool.db"),
+        "Path to the job queue database of the LocalPool submitter"
+    )
+    MESHROOM_LOCALPOOL_WORKERS = VarDefinition(
+        int, "0", "Number of worker processes of the LocalPool submitter (0: number of available cores)"
+    )
+    MESHROOM_LOCALPOOL_MAX_ATTEMPTS = VarDefinition(
+        int, "3", "Number of times the LocalPool submitter tries to compute a task before giving up"
+    )
 
 
     @staticmethod
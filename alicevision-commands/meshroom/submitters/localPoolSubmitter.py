@@ -0,0 +1,492 @@
+#!/usr/bin/env python
+"""
+Submitter computing the nodes on the local machine with a pool of worker processes.
+
+Submitted jobs are stored in a SQLite database (MESHROOM_LOCALPOOL_QUEUE) as tasks: the preprocess
+of each node, each of its chunks and its postprocess, with their dependencies. The worker processes
+are detached from Meshroom and pull the tasks whose dependencies are done, so the jobs carry on when
+Meshroom is closed, and the workers are started again when Meshroom starts with pending tasks.
+
+Each chunk task reserves the CPU, RAM and GPU shares declared by the levels of its node description
+(see meshroom.core.scheduler.Resources), and a worker only claims a task if it fits in what the tasks
+running in the other workers leave available, so that the machine is not oversubscribed.
+
+A failed task is retried up to MESHROOM_LOCALPOOL_MAX_ATTEMPTS times, after which the tasks depending
+on it are cancelled. A task whose worker stopped sending heartbeats (e.g. it has been killed) is given
+to another worker.
+
+A worker can also be started by hand:
+    python -m meshroom.submitters.localPoolSubmitter <queue database>
+"""
+
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+import meshroom
+from meshroom.core.submitter import BaseSubmitter
+from meshroom.env import EnvVar
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    filepath TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    job INTEGER NOT NULL REFERENCES jobs(id),
+    node TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    cpu REAL NOT NULL DEFAULT 0,
+    ram REAL NOT NULL DEFAULT 0,
+    gpu REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    maxAttempts INTEGER NOT NULL,
+    worker TEXT,
+    heartbeat REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS dependencies (
+    task INTEGER NOT NULL REFERENCES tasks(id),
+    dependsOn INTEGER NOT NULL REFERENCES tasks(id)
+);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    pid INTEGER,
+    heartbeat REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status);
+CREATE INDEX IF NOT EXISTS dependencies_task ON dependencies(task);
+CREATE INDEX IF NOT EXISTS dependencies_dependsOn ON dependencies(dependsOn);
+"""
+
+# Status of the tasks
+WAITING = "waiting"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Kinds of tasks
+PREPROCESS = "preprocess"
+CHUNK = "chunk"
+POSTPROCESS = "postprocess"
+
+Task = namedtuple("Task", ["id", "job", "filepath", "node", "kind", "iteration", "attempts"])
+
+
+class JobQueue:
+    """
+    Jobs and their tasks, stored in a SQLite database shared by Meshroom and the workers.
+    """
+    # Time (in seconds) after which a task or a worker without heartbeat is considered dead
+    leaseTimeout = 60
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        # Queues created before the tasks had requirements
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(tasks)")}
+        for column in ("cpu", "ram", "gpu"):
+            if column not in columns:
+                self._connection.execute(f"ALTER TABLE tasks ADD COLUMN {column} REAL NOT NULL DEFAULT 0")
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def addJob(self, name, filepath, tasks, dependencies, maxAttempts):
+        """
+        Add a job to compute.
+
+        Args:
+            name (str): the name of the job.
+            filepath (str): the path to the Meshroom file of the graph.
+            tasks (list): (node name, kind, iteration, requirements) of each task, with the
+                          requirements as returned by Resources.requirements (None for none).
+            dependencies (list): (task index, index of the task it depends on) in the list of tasks.
+            maxAttempts (int): the number of times each task is tried before giving up.
+        Returns:
+            int: the id of the job.
+        """
+        with self._transaction() as connection:
+            jobId = connection.execute("INSERT INTO jobs (name, filepath, created) VALUES (?, ?, ?)",
+                                       (name, filepath, time.time())).lastrowid
+            taskIds = []
+            for nodeName, kind, iteration, requirements in tasks:
+                requirements = requirements or {}
+                taskIds.append(connection.execute(
+                    "INSERT INTO tasks (job, node, kind, iteration, cpu, ram, gpu, status, maxAttempts) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (jobId, nodeName, kind, iteration, requirements.get("cpu", 0), requirements.get("ram", 0),
+                     requirements.get("gpu", 0), WAITING, maxAttempts)).lastrowid)
+            connection.executemany("INSERT INTO dependencies VALUES (?, ?)",
+                                   [(taskIds[task], taskIds[dependsOn]) for task, dependsOn in dependencies])
+        return jobId
+
+    def claimTask(self, worker, resources=None):
+        """
+        Give the first waiting task whose dependencies are done to the given worker.
+
+        Args:
+            worker (str): the name of the worker.
+            resources (Resources): the resources of the machine; if given, the task is only given
+                                   if its requirements fit next to the running tasks.
+        Returns:
+            Task: the task to compute, None if no task is ready.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            self._requeueExpiredTasks(connection, now)
+            row = connection.execute(
+                "SELECT t.id, t.job, j.filepath, t.node, t.kind, t.iteration, t.attempts + 1, t.cpu, t.ram, t.gpu "
+                "FROM tasks t JOIN jobs j ON j.id = t.job WHERE t.status = ? AND NOT EXISTS ("
+                "SELECT 1 FROM dependencies d JOIN tasks p ON p.id = d.dependsOn "
+                "WHERE d.task = t.id AND p.status != ?) ORDER BY t.id LIMIT 1", (WAITING, DONE)).fetchone()
+            if row is None:
+                return None
+            # Keep the order: the first task waits for resources to be released rather than
+            # being overtaken by cheaper tasks.
+            if resources is not None and not self._reserveResources(connection, resources, row[-3:]):
+                return None
+            row = row[:-3]
+            connection.execute("UPDATE tasks SET status = ?, worker = ?, heartbeat = ?, attempts = attempts + 1 "
+                               "WHERE id = ?", (RUNNING, worker, now, row[0]))
+        return Task(*row)
+
+    @staticmethod
+    def _reserveResources(connection, resources, requirements):
+        """ Whether the requirements fit in the resources left by the running tasks of all the workers. """
+        count, cpu, ram, gpu = connection.execute("SELECT COUNT(*), TOTAL(cpu), TOTAL(ram), TOTAL(gpu) "
+                                                  "FROM tasks WHERE status = ?", (RUNNING,)).fetchone()
+        resources.setUsage({"cpu": cpu, "ram": ram, "gpu": gpu}, count)
+        return resources.acquire(dict(zip(("cpu", "ram", "gpu"), requirements)))
+
+    def _requeueExpiredTasks(self, connection, now):
+        expired = connection.execute("SELECT id, attempts, maxAttempts FROM tasks WHERE status = ? AND heartbeat < ?",
+                                     (RUNNING, now - self.leaseTimeout)).fetchall()
+        for taskId, attempts, maxAttempts in expired:
+            logging.warning(f"LocalPool: task {taskId} has no heartbeat anymore, its worker may have been killed.")
+            self._onTaskFailed(connection, taskId, attempts < maxAttempts, "Worker lost")
+        connection.execute("DELETE FROM workers WHERE heartbeat < ?", (now - self.leaseTimeout,))
+
+    def heartbeat(self, worker, taskId=None):
+        """ Signal that the worker, and the task it computes, are alive. """
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute("UPDATE workers SET heartbeat = ? WHERE name = ?", (now, worker))
+            if taskId is not None:
+                connection.execute("UPDATE tasks SET heartbeat = ? WHERE id = ?", (now, taskId))
+
+    def completeTask(self, taskId):
+        with self._transaction() as connection:
+            connection.execute("UPDATE tasks SET status = ?, error = NULL WHERE id = ?", (DONE, taskId))
+
+    def failTask(self, taskId, error):
+        """
+        Retry the task if it has attempts left, otherwise cancel the tasks depending on it.
+
+        Returns:
+            list: the (Meshroom file, node name) of the cancelled tasks.
+        """
+        with self._transaction() as connection:
+            attempts, maxAttempts = connection.execute("SELECT attempts, maxAttempts FROM tasks WHERE id = ?",
+                                                       (taskId,)).fetchone()
+            return self._onTaskFailed(connection, taskId, attempts < maxAttempts, error)
+
+    @staticmethod
+    def _onTaskFailed(connection, taskId, retry, error):
+        if retry:
+            connection.execute("UPDATE tasks SET status = ?, worker = NULL, error = ? WHERE id = ?",
+                               (WAITING, error, taskId))
+            return []
+        connection.execute("UPDATE tasks SET status = ?, error = ? WHERE id = ?", (FAILED, error, taskId))
+        downstream = "WITH RECURSIVE downstream(id) AS (" \
+                     "SELECT task FROM dependencies WHERE dependsOn = ? UNION " \
+                     "SELECT d.task FROM dependencies d JOIN downstream ON d.dependsOn = downstream.id) "
+        cancelled = connection.execute(
+            downstream + "SELECT DISTINCT j.filepath, t.node FROM tasks t JOIN jobs j ON j.id = t.job "
+            "WHERE t.id IN downstream AND t.status = ?", (taskId, WAITING)).fetchall()
+        connection.execute(downstream + "UPDATE tasks SET status = ? WHERE id IN downstream AND status = ?",
+                           (taskId, CANCELLED, WAITING))
+        return cancelled
+
+    def cancelJob(self, jobId):
+        """ Cancel the tasks of the job that are not running yet. """
+        with self._transaction() as connection:
+            connection.execute("UPDATE tasks SET status = ? WHERE job = ? AND status = ?", (CANCELLED, jobId, WAITING))
+
+    def jobStatus(self, jobId):
+        """ Return the number of tasks of the job per status. """
+        with self._lock:
+            return dict(self._connection.execute("SELECT status, COUNT(*) FROM tasks WHERE job = ? GROUP BY status",
+                                                 (jobId,)).fetchall())
+
+    def hasPendingTasks(self):
+        """ Whether some tasks are waiting or running. """
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM tasks WHERE status IN (?, ?) LIMIT 1",
+                                            (WAITING, RUNNING)).fetchone() is not None
+
+    def registerWorker(self, name, pid=None):
+        with self._transaction() as connection:
+            connection.execute("INSERT OR REPLACE INTO workers VALUES (?, ?, ?)", (name, pid, time.time()))
+
+    def unregisterWorker(self, name):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM workers WHERE name = ?", (name,))
+
+    def aliveWorkers(self):
+        """ Return the number of workers that sent a heartbeat recently. """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM workers WHERE heartbeat >= ?",
+                                            (time.time() - self.leaseTimeout,)).fetchone()[0]
+
+
+class Worker:
+    """
+    Compute the tasks of a JobQueue until there is nothing left to compute.
+    """
+    # Interval (in seconds) at which the queue is polled when no task is ready
+    pollInterval = 1
+    heartbeatInterval = 10
+    # Time (in seconds) after which a worker without pending tasks exits
+    idleTimeout = 30
+
+    def __init__(self, queue, name=None, resources=None):
+        from meshroom.core.scheduler import Resources
+        self.queue = queue
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.resources = resources or Resources()
+        self._currentTask = None
+        self._stopFlag = threading.Event()
+        # Meshroom file => (modification time, Graph)
+        self._graphs = {}
+
+    def run(self):
+        self.queue.registerWorker(self.name, os.getpid())
+        heartbeatThread = threading.Thread(target=self._sendHeartbeats, daemon=True)
+        heartbeatThread.start()
+        idleSince = time.time()
+        try:
+            while True:
+                task = self.queue.claimTask(self.name, self.resources)
+                if task is None:
+                    if self.queue.hasPendingTasks():
+                        idleSince = time.time()
+                    elif time.time() - idleSince > self.idleTimeout:
+                        break
+                    time.sleep(self.pollInterval)
+                    continue
+                self._currentTask = task.id
+                try:
+                    self._runTask(task)
+                except Exception as e:
+                    logging.error(f"LocalPool: {task.kind} of {task.node} failed (attempt {task.attempts}): {e}")
+                    self._resetCancelledNodes(self.queue.failTask(task.id, str(e)))
+                else:
+                    self.queue.completeTask(task.id)
+                finally:
+                    self._currentTask = None
+                idleSince = time.time()
+        finally:
+            self._stopFlag.set()
+            self.queue.unregisterWorker(self.name)
+
+    def _sendHeartbeats(self):
+        while not self._stopFlag.wait(self.heartbeatInterval):
+            try:
+                self.queue.heartbeat(self.name, self._currentTask)
+            except sqlite3.Error as e:
+                logging.warning(f"LocalPool: failed to send heartbeat: {e}")
+
+    def _getGraph(self, filepath):
+        from meshroom.core.graph import loadGraph
+        modTime = os.path.getmtime(filepath)
+        cached = self._graphs.get(filepath)
+        if cached is None or cached[0] != modTime:
+            cached = (modTime, loadGraph(filepath))
+            self._graphs[filepath] = cached
+        return cached[1]
+
+    def _runTask(self, task):
+        graph = self._getGraph(task.filepath)
+        node = graph.node(task.node)
+        if node is None:
+            raise RuntimeError(f"Node '{task.node}' not found in '{task.filepath}'.")
+        # Other workers may have computed chunks of this node
+        node.updateStatusFromCache()
+        logging.info(f"LocalPool: {task.kind} of {task.node}" +
+                     (f" ({task.iteration})" if task.kind == CHUNK else ""))
+        if task.kind == PREPROCESS:
+            node.preprocess()
+        elif task.kind == POSTPROCESS:
+            node.postprocess()
+        else:
+            node.chunks[task.iteration].process()
+
+    def _resetCancelledNodes(self, cancelled):
+        """ Reset the status of the nodes that will not be computed, as they are shown as submitted. """
+        from meshroom.core.node import Status
+        for filepath, nodeName in cancelled:
+            try:
+                node = self._getGraph(filepath).node(nodeName)
+                for chunk in node.chunks:
+                    chunk.updateStatusFromCache()
+                    if chunk.status.status == Status.SUBMITTED:
+                        chunk.upgradeStatusTo(Status.NONE)
+            except Exception as e:
+                logging.warning(f"LocalPool: failed to reset the status of {nodeName}: {e}")
+
+
+def getQueuePath():
+    return EnvVar.get(EnvVar.MESHROOM_LOCALPOOL_QUEUE)
+
+
+class LocalPoolSubmitter(BaseSubmitter):
+    """
+    Compute the submitted nodes with worker processes on the local machine.
+    """
+    def __init__(self, parent=None):
+        super().__init__(name='LocalPool', parent=parent)
+        self.queuePath = getQueuePath()
+        self.maxAttempts = max(EnvVar.get(EnvVar.MESHROOM_LOCALPOOL_MAX_ATTEMPTS), 1)
+        self.nbWorkers = EnvVar.get(EnvVar.MESHROOM_LOCALPOOL_WORKERS)
+        if not self.nbWorkers:
+            from meshroom.core.scheduler import getAvailableCpuCount
+            self.nbWorkers = getAvailableCpuCount()
+
+        # Resume the jobs submitted before Meshroom was closed
+        if os.path.exists(self.queuePath):
+            try:
+                self.startWorkers()
+            except Exception as e:
+                logging.warning(f"LocalPool: failed to resume the pending jobs: {e}")
+
+    def submit(self, nodes, edges, filepath, submitLabel="{projectName}"):
+        projectName = os.path.splitext(os.path.basename(filepath))[0]
+        name = submitLabel.format(projectName=projectName)
+
+        tasks = []
+        dependencies = []
+        # Node => index of its preprocess and postprocess tasks
+        preprocessTask = {}
+        postprocessTask = {}
+
+        from meshroom.core.scheduler import Resources
+        resources = Resources()
+
+        def addTask(node, kind, iteration=-1, dependsOn=()):
+            # Only the chunks run the node's command, the preprocess and postprocess are light
+            requirements = resources.requirements(node) if kind == CHUNK else None
+            tasks.append((node.name, kind, iteration, requirements))
+            dependencies.extend((len(tasks) - 1, index) for index in dependsOn)
+            return len(tasks) - 1
+
+        for node in nodes:
+            preprocessTask[node] = addTask(node, PREPROCESS)
+            chunkTasks = [addTask(node, CHUNK, i, [preprocessTask[node]]) for i in range(len(node.chunks))]
+            postprocessTask[node] = addTask(node, POSTPROCESS, dependsOn=chunkTasks or [preprocessTask[node]])
+
+        # u depends on v
+        for u, v in edges:
+            dependencies.append((preprocessTask[u], postprocessTask[v]))
+
+        queue = JobQueue(self.queuePath)
+        try:
+            jobId = queue.addJob(name, filepath, tasks, dependencies, self.maxAttempts)
+            logging.info(f"LocalPool: job {jobId} '{name}' submitted with {len(tasks)} tasks.")
+            self.startWorkers(queue)
+        finally:
+            queue.close()
+        return True
+
+    def startWorkers(self, queue=None):
+        """
+        Start worker processes, up to the number of workers, if there are tasks to compute.
+
+        Returns:
+            int: the number of workers started.
+        """
+        ownQueue = queue is None
+        queue = queue or JobQueue(self.queuePath)
+        try:
+            if not queue.hasPendingTasks():
+                return 0
+            nbWorkers = self.nbWorkers - queue.aliveWorkers()
+            for _ in range(nbWorkers):
+                workerName = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+                # Registered before it starts, so that it is counted if workers are started again meanwhile
+                queue.registerWorker(workerName)
+                self._spawnWorker(workerName)
+            return max(nbWorkers, 0)
+        finally:
+            if ownQueue:
+                queue.close()
+
+    def _spawnWorker(self, workerName):
+        env = os.environ.copy()
+        # Make this meshroom package importable by the worker
+        rootDir = os.path.dirname(os.path.dirname(os.path.abspath(meshroom.__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(p for p in [rootDir, env.get("PYTHONPATH", "")] if p)
+        logFile = os.path.join(os.path.dirname(os.path.abspath(self.queuePath)), f"localPool-{workerName}.log")
+        kwargs = {}
+        if sys.platform == "win32":
+            kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            # Keep computing when Meshroom is closed
+            kwargs["start_new_session"] = True
+        with open(logFile, "a") as log:
+            subprocess.Popen([sys.executable, "-m", "meshroom.submitters.localPoolSubmitter", self.queuePath,
+                              "--name", workerName],
+                             env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the tasks of the LocalPool submitter queue.")
+    parser.add_argument("queue", nargs="?", default=getQueuePath(), help="Path to the job queue database.")
+    parser.add_argument("--name", default=None, help="Name of the worker.")
+    args = parser.parse_args()
+
+    import meshroom.core
+    meshroom.setupEnvironment()
+    meshroom.core.initNodes()
+    meshroom.core.initPlugins()
+
+    queue = JobQueue(args.queue)
+    try:
+        Worker(queue, args.name).run()
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+import pytest
+
+from meshroom.core.scheduler import Resources
+from meshroom.submitters.localPoolSubmitter import CHUNK, JobQueue
+
+
+INTENSIVE = {"cpu": 8, "ram": 16, "gpu": 1}
+NORMAL = {"cpu": 2, "ram": 4, "gpu": 0}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "localPool.db"))
+    yield queue
+    queue.close()
+
+
+def addJob(queue, requirements):
+    tasks = [(f"Node{i}", CHUNK, 0, r) for i, r in enumerate(requirements)]
+    return queue.addJob("job", "job.mg", tasks, [], maxAttempts=1)
+
+
+def test_claimTaskWithinResources(queue):
+    addJob(queue, [NORMAL, NORMAL, NORMAL, NORMAL, NORMAL])
+    resources = Resources(cpuCount=8, memorySize=16)
+
+    claimed = [queue.claimTask(f"worker{i}", resources) for i in range(5)]
+    assert all(task is not None for task in claimed[:4])
+    assert claimed[4] is None
+
+    queue.completeTask(claimed[0].id)
+    assert queue.claimTask("worker4", resources) is not None
+
+
+def test_intensiveTaskRunsAlone(queue):
+    addJob(queue, [NORMAL, INTENSIVE, NORMAL])
+    resources = Resources(cpuCount=8, memorySize=16)
+
+    first = queue.claimTask("worker0", resources)
+    # The intensive task waits for the running one rather than being overtaken
+    assert queue.claimTask("worker1", resources) is None
+
+    queue.completeTask(first.id)
+    intensive = queue.claimTask("worker1", resources)
+    assert intensive.node == "Node1"
+    assert queue.claimTask("worker2", resources) is None
+
+
+def test_taskLargerThanResources(queue):
+    addJob(queue, [{"cpu": 32, "ram": 64, "gpu": 2}])
+    # Accepted when nothing else is running, so that it does not wait forever
+    assert queue.claimTask("worker0", Resources(cpuCount=8, memorySize=16)) is not None
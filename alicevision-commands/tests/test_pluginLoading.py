@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+import sys
+
+import pytest
+
+import meshroom.core
+from meshroom.core import desc, loadClasses, loadNodes
+
+
+GOOD_MODULE = """
+from meshroom.core import desc
+
+
+class GoodNode(desc.Node):
+    inputs = []
+    outputs = []
+"""
+
+BROKEN_MODULE = """
+import meshroomMissingDependency
+"""
+
+
+@pytest.fixture(autouse=True)
+def unloadPluginPackages():
+    yield
+    for name in list(sys.modules):
+        if name.split(".")[0] in ("pluginPackage", "brokenPackage"):
+            del sys.modules[name]
+
+
+@pytest.fixture
+def pluginFolder(tmp_path):
+    package = tmp_path / "pluginPackage"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "good.py").write_text(GOOD_MODULE)
+    (package / "broken.py").write_text(BROKEN_MODULE)
+    return tmp_path
+
+
+@pytest.fixture(params=[False, True], ids=["noIndex", "index"])
+def pluginIndex(request, tmp_path, monkeypatch):
+    path = str(tmp_path / "pluginIndex.json") if request.param else ""
+    monkeypatch.setenv("MESHROOM_PLUGIN_INDEX", path)
+    return path
+
+
+def test_loadClassesSkipsBrokenModule(pluginFolder):
+    classes = loadClasses(str(pluginFolder), "pluginPackage", desc.Node)
+    assert [c.__name__ for c in classes] == ["GoodNode"]
+
+
+def test_loadNodesSkipsBrokenModule(pluginFolder, pluginIndex):
+    nodeTypes = loadNodes(str(pluginFolder), "pluginPackage")
+    assert [n.__name__ for n in nodeTypes] == ["GoodNode"]
+    # A package with modules that failed to import is imported again on the next start
+    nodeTypes = loadNodes(str(pluginFolder), "pluginPackage")
+    assert [n.__name__ for n in nodeTypes] == ["GoodNode"]
+    assert not any(isinstance(n, meshroom.core.pluginIndex.LazyNodeType) for n in nodeTypes)
+
+
+def test_loadNodesFromPackageFailingToImport(tmp_path, pluginIndex):
+    package = tmp_path / "brokenPackage"
+    package.mkdir()
+    (package / "__init__.py").write_text(BROKEN_MODULE)
+    assert loadNodes(str(tmp_path), "brokenPackage") == []
+    assert loadClasses(str(tmp_path), "brokenPackage", desc.Node) == []
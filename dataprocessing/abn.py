@@ -5,19 +5,55 @@ https://data.gov.au/dataset/ds-dga-5bd7fcab-e315-42cb-8daf-50b7efc2027e/
 
 For details see: bulkextract.xsd
 
+The extract is made up of multiple XML files across two zips which are
+several gigabytes in total. The records are read with iterparse() so only
+one record is in memory at a time, and convert() converts the XML files in
+parallel to a Parquet dataset partitioned by state. This requires pyarrow.
+
 TODO:
     Utilise the metadata() function to provide a download command.
 """
 
 import argparse
+import concurrent.futures
+import datetime
 import json
+import os
+import pathlib
 import urllib.request
+import zipfile
 
 from lxml import etree
 
 DATASET_ID = '5bd7fcab-e315-42cb-8daf-50b7efc2027e'
 
 
+def schema():
+    """Return the columns extracted from each record (ABR element).
+
+    The postcode is a string as they may start with a zero.
+
+    pyarrow is only imported here as it is only needed for converting.
+    """
+    import pyarrow
+
+    return pyarrow.schema([
+        ('abn', pyarrow.string()),
+        ('abn_status', pyarrow.string()),
+        ('abn_status_from', pyarrow.date32()),
+        ('record_last_updated', pyarrow.date32()),
+        ('entity_type', pyarrow.string()),
+        ('entity_type_text', pyarrow.string()),
+        ('name', pyarrow.string()),
+        ('given_names', pyarrow.string()),
+        ('family_name', pyarrow.string()),
+        ('state', pyarrow.string()),
+        ('postcode', pyarrow.string()),
+        ('gst_status', pyarrow.string()),
+        ('other_names', pyarrow.list_(pyarrow.string())),
+    ])
+
+
 def metadata():
     """Request the metadata for the dataset that this operates on.
 
@@ -65,6 +101,209 @@ def parse(path):
     return tree.xpath('/Transfer/ABR')
 
 
+def _date(value: str | None) -> datetime.date | None:
+    """Convert the date in the form YYYYMMDD."""
+    if not value:
+        return None
+    return datetime.date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+
+
+def _record(element) -> dict:
+    """Extract the columns (see schema()) from a ABR element."""
+    abn = element.find('ABN')
+    gst = element.find('GST')
+
+    # This is either MainEntity (for non-individuals) or LegalEntity (for
+    # individuals).
+    entity = element.find('MainEntity')
+    if entity is None:
+        entity = element.find('LegalEntity')
+
+    given_names = family_name = name = state = postcode = None
+    if entity is not None:
+        individual = entity.find('IndividualName')
+        if individual is not None:
+            given_names = ' '.join(
+                given.text for given in individual.iterfind('GivenName')
+                if given.text) or None
+            family_name = individual.findtext('FamilyName')
+            name = ' '.join(part for part in (given_names, family_name)
+                            if part)
+        else:
+            name = entity.findtext('NonIndividualName/NonIndividualNameText')
+
+        address = entity.find('BusinessAddress/AddressDetails')
+        if address is not None:
+            state = address.findtext('State')
+            postcode = address.findtext('Postcode')
+
+    return {
+        'abn': abn.text if abn is not None else None,
+        'abn_status': abn.get('status') if abn is not None else None,
+        'abn_status_from': _date(
+            abn.get('ABNStatusFromDate') if abn is not None else None),
+        'record_last_updated': _date(element.get('recordLastUpdatedDate')),
+        'entity_type': element.findtext('EntityType/EntityTypeInd'),
+        'entity_type_text': element.findtext('EntityType/EntityTypeText'),
+        'name': name,
+        'given_names': given_names,
+        'family_name': family_name,
+        'state': state,
+        'postcode': postcode,
+        'gst_status': gst.get('status') if gst is not None else None,
+        'other_names': [
+            other.text
+            for other in element.iterfind(
+                'OtherEntity/NonIndividualName/NonIndividualNameText')
+            if other.text
+        ],
+    }
+
+
+def iter_records(source, entity_types: set[str] | None = None):
+    """Read the records from the ABN bulk extract one at a time.
+
+    Unlike parse() this doesn't read the whole file into memory.
+
+    Parameters
+    ----------
+    source
+        The path or file object to the XML file.
+    entity_types
+        The entity types (EntityTypeInd) to include, for example IND for
+        individuals (sole traders). If None then all records are included.
+
+    Yields
+    ------
+    dict
+        The columns of the record as described by schema().
+    """
+    for _, element in etree.iterparse(source, events=('end',), tag='ABR'):
+        if entity_types is None or \
+                element.findtext('EntityType/EntityTypeInd') in entity_types:
+            yield _record(element)
+
+        # Free the memory for the elements that have been processed.
+        element.clear(keep_tail=False)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def find_sources(paths) -> list[tuple[str, str | None]]:
+    """Find the XML files given paths to XML files, zips or directories.
+
+    A directory is searched for XML files and zips (not recursively).
+
+    Returns
+    -------
+    list
+        A list of the path and the name of the XML file within it if the path
+        is a zip otherwise None.
+    """
+    sources = []
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            sources.extend(find_sources(
+                sorted(child for child in path.iterdir()
+                       if child.suffix.lower() in ('.xml', '.zip'))))
+        elif zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as opened_zip:
+                sources.extend(
+                    (os.fspath(path), name)
+                    for name in opened_zip.namelist()
+                    if name.lower().endswith('.xml'))
+        else:
+            sources.append((os.fspath(path), None))
+    return sources
+
+
+def convert_source(path: str, member: str | None, output_directory: str,
+                   entity_types: set[str] | None = None,
+                   batch_size: int = 100_000) -> int:
+    """Convert a XML file of the extract to Parquet files.
+
+    The files are partitioned by state, and named after the XML file so
+    several can be converted in parallel.
+
+    Returns the number of records written.
+    """
+    import pyarrow
+    import pyarrow.parquet
+
+    stem = pathlib.PurePath(member or path).stem
+    table_schema = schema()
+    columns = {name: [] for name in table_schema.names}
+    count = 0
+    batch_index = 0
+
+    def _write():
+        nonlocal batch_index
+        table = pyarrow.Table.from_pydict(columns, schema=table_schema)
+        pyarrow.parquet.write_to_dataset(
+            table,
+            output_directory,
+            partition_cols=['state'],
+            basename_template=f'{stem}-{batch_index}-{{i}}.parquet',
+        )
+        batch_index += 1
+        for values in columns.values():
+            values.clear()
+
+    def _convert(source):
+        nonlocal count
+        for record in iter_records(source, entity_types):
+            for name, value in record.items():
+                columns[name].append(value)
+            count += 1
+            if count % batch_size == 0:
+                _write()
+        if columns['abn']:
+            _write()
+
+    if member is None:
+        _convert(path)
+    else:
+        with zipfile.ZipFile(path) as opened_zip:
+            with opened_zip.open(member) as reader:
+                _convert(reader)
+    return count
+
+
+def convert(paths, output_directory, entity_types: set[str] | None = None,
+            workers: int | None = None) -> int:
+    """Convert the ABN bulk extract to a Parquet dataset partitioned by state.
+
+    The XML files are converted in parallel.
+
+    Parameters
+    ----------
+    paths
+        The paths to the zips, XML files or a directory containing them.
+    output_directory
+        The directory to write the dataset to.
+    entity_types
+        The entity types (EntityTypeInd) to include, for example IND for
+        individuals (sole traders). If None then all records are included.
+    workers
+        The number of worker processes, by default this is the number of
+        processors.
+
+    Returns
+    -------
+    int
+        The number of records written.
+    """
+    sources = find_sources(paths)
+    output_directory = os.fspath(output_directory)
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(convert_source, path, member, output_directory,
+                            entity_types)
+            for path, member in sources
+        ]
+        return sum(future.result() for future in futures)
+
+
 def sole_traders(data):
     """Limit the results for businesses that refer to sole traders."""
 
@@ -89,17 +328,41 @@ if __name__ == '__main__':
         'Report information from the ABN bulk extract dataset.')
     parser.add_argument(
         'path', nargs='+',
-        help='The path to the XML file for the dataset',
+        help='The path to the XML file for the dataset, the zips containing '
+        'them or a directory containing either.',
         # As of 2023, the dataset is broken down into multiple XML files
-        # across two zips. With that in mind need to consider making this
-        # accept a directory instead.
+        # across two zips.
+    )
+    parser.add_argument(
+        '--parquet',
+        metavar='DIRECTORY',
+        help='Convert the records to a Parquet dataset in this directory '
+        'rather than printing the names of sole traders.',
+    )
+    parser.add_argument(
+        '--entity-type',
+        action='append',
+        dest='entity_types',
+        help='Only include records with this entity type, for example IND. '
+        'This may be given multiple times.',
     )
 
     arguments = parser.parse_args()
 
-    # The default behaviour is to print the names of sole traders as that is
-    # all I've written so-far.
-    for path in arguments.path:
-        for name, details in sole_traders(parse(path)):
-            print(name)
-
+    if arguments.parquet:
+        entity_types = set(arguments.entity_types or ()) or None
+        count = convert(arguments.path, arguments.parquet, entity_types)
+        print(f'Wrote {count} records to {arguments.parquet}')
+    else:
+        # The default behaviour is to print the names of sole traders as that
+        # is all I've written so-far.
+        for path, member in find_sources(arguments.path):
+            if member is None:
+                records = iter_records(path, entity_types={'IND'})
+                for record in records:
+                    print(record['name'])
+            else:
+                with zipfile.ZipFile(path) as opened_zip:
+                    with opened_zip.open(member) as reader:
+                        for record in iter_records(reader, {'IND'}):
+                            print(record['name'])
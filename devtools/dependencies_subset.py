@@ -1,6 +1,6 @@
 """Extract a subset of dynamic link libraries based on one's dependencies.
 
-Using Dependencies by lucasg find dependencies of a set of DLLs.
+The dependencies are found from the import tables of the DLLs.
 
 This is intended to be used when several higher level DLLs are present.
 
@@ -1,18 +1,35 @@
-"""Using Dependencies by lucasg find dependencies of a set of DLLs.
+"""Find dependencies of a set of DLLs from their import tables.
 
 Build a graph of those dependencies.
+
+The import tables are read with PEFile from peparser3 (in the peparser
+directory of this repository).
 """
 
+import concurrent.futures
 import enum
+import hashlib
 import json
+import logging
 import os
 import pathlib
+import sqlite3
+import struct
 import subprocess
+import sys
 import urllib.request
 import zipfile
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "peparser"))
+
+from peparser3 import PEFile  # noqa: E402
+
+LOGGER = logging.getLogger(__name__)
+
 WORK_DIRECTORY = pathlib.Path("work_area")
-TOOL_DOWNLOAD_URI = "https://github.com/lucasg/Dependencies/releases/download/v1.11.1/Dependencies_x64_Release.zip"
+SYSTEM_DIRECTORY = pathlib.Path(
+    os.environ.get("SystemRoot", "C:\\Windows"), "System32")
+"""The directory the system DLLs are found in."""
 GRAPHVIZ_DOWNLOAD_URI = "https://gitlab.com/api/v4/projects/4207231/packages/generic/graphviz-releases/10.0.1/windows_10_cmake_Release_Graphviz-10.0.1-win64.zip"
 
 
@@ -54,7 +71,8 @@ class Graph:
         This may actually be the Sigma.js format that Gephi used.
         """
         # Consider using dot instead to layout the nodes (assign X/Y).
-        node_to_id = {node: str(node_id) for node_id, node in enumerate(self.nodes)}
+        nodes = sorted(self.nodes)
+        node_to_id = {node: str(node_id) for node_id, node in enumerate(nodes)}
         return {
             "edges": [
                 {
@@ -66,7 +84,7 @@ class Graph:
             "nodes": [
                 # "color": "rgb(229,67,164)",
                 {"label": node, "id": str(node_id)}
-                for node_id, node in enumerate(self.nodes)
+                for node_id, node in enumerate(nodes)
             ],
         }
 
@@ -74,84 +92,121 @@ class Graph:
     def merge(cls, graphs: list):
         """Merge the given graphs together, deduplicating nodes and edges."""
         merged_graph = cls()
+        seen_edges = set()
         for graph in graphs:
             merged_graph.nodes.update(graph.nodes)
-            merged_graph.edges.extend(
-                edge for edge in graph.edges if edge not in merged_graph.edges
-            )
+            for edge in graph.edges:
+                if edge not in seen_edges:
+                    seen_edges.add(edge)
+                    merged_graph.edges.append(edge)
         return merged_graph
 
 
-def find_dependencies(
-    dlls: list[pathlib.Path],
-    work_directory: pathlib.Path,
-    *,
-    cache_result: bool = True,
-) -> Graph:
-    """Find dependencies between libraries.
 
-    If cache_result is True then the results look-up of the dependencies will
-    be cached and used if cached.
+def file_sha256(path: pathlib.Path) -> str:
+    """Compute the SHA-256 of the file's contents as a hexadecimal string."""
+    digest = hashlib.sha256()
+    with path.open("rb") as reader:
+        while chunk := reader.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    The caching feature is purely done based on file-name so its not suitable
-    if you comparing different versions. This could be expended to compute the
-    hash of the source DLL and include that in the filename or go nested
-    in the form filename/<hash>.json if multi-versions of DLL is likely.
-    """
-    # Options:
-    # 1) Use Rust code to read the DLLs and extract the information
-    # 2) Rely on "dumpbin /dependents" and read output
-    # 3) Reply on Dependencies.exe (by lucasg) and use:
-    #   - Dependencies.exe -chain mydll.dll -depth 1
-    # 40 Read the information straight from the DLL here - this requires a
-    #    third party package.
-    #
-    # This has used the 3rd option.
 
-    def _setup_tooling() -> pathlib.Path:
-        work_directory.mkdir(exist_ok=True)
+class DependencyCache:
+    """Cache the names of the libraries each library imports by the hash of
+    its contents.
 
-        tool_zip = work_directory / "Dependencies_x64_Release.zip"
-        if not tool_zip.exists():
-            urllib.request.urlretrieve(TOOL_DOWNLOAD_URI, filename=tool_zip)
+    The imports are stored in a single SQLite database, so if a library
+    changes (such as a different version with the same name) its imports are
+    read again. The graph is built from the imports of each library, so a
+    change to a dependency is picked up even if the library using it is
+    unchanged.
 
-        executable = work_directory / "Dependencies" / "Dependencies.exe"
-        if not executable.is_file():
-            with zipfile.ZipFile(tool_zip) as opened_zip:
-                opened_zip.extractall(executable.parent)
-        return executable
+    This is only to be used from the thread that created it.
+    """
 
-    tool_exe = _setup_tooling()
+    def __init__(self, path: pathlib.Path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS imports ("
+            "sha256 TEXT PRIMARY KEY, name TEXT, imports TEXT)"
+        )
 
-    graphs = []
+    def close(self):
+        self.connection.close()
 
-    for dll in dlls:
-        cache_result_path = work_directory / dll.with_suffix(".json").name
+    def __enter__(self):
+        return self
 
-        if cache_result and cache_result_path.exists():
-            with cache_result_path.open("r") as reader:
-                chain_as_json = json.load(reader)
-        else:
-            output = subprocess.check_output(
-                [
-                    os.fspath(tool_exe),
-                    "-json",
-                    "-depth", "2",
-                    "-chain", os.fspath(dll),
-                ],
-                text=True,
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, sha256: str) -> list[str] | None:
+        """Return the imports of the library with the given hash if cached."""
+        row = self.connection.execute(
+            "SELECT imports FROM imports WHERE sha256 = ?", (sha256,)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, sha256: str, name: str, imports: list[str]):
+        """Store the imports of the library with the given hash."""
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO imports VALUES (?, ?, ?)",
+                (sha256, name, json.dumps(imports)),
             )
 
-            if cache_result:
-                with cache_result_path.open("w") as writer:
-                    writer.write(output)
 
-            chain_as_json = json.loads(output)
+def find_dependencies(
+    dlls: list[pathlib.Path],
+    work_directory: pathlib.Path,
+    *,
+    cache_result: bool = True,
+    workers: int | None = None,
+) -> Graph:
+    """Find dependencies between libraries.
 
-        graph = _dependencies_chain_to_graph(chain_as_json)
-        graphs.append(graph)
+    The dependencies of each library and of the dependencies found next to
+    it are read from their import tables, see read_dependencies().
 
-    return Graph.merge(graphs)
+    If cache_result is True then the imports read from each library will be
+    cached and used if cached.
+
+    The cache is keyed by the SHA-256 of each library so it is suitable if
+    you are comparing different versions with the same name. It is stored in
+    dependencies.sqlite within the work_directory.
+
+    The libraries that aren't cached are read in parallel using up to the
+    given number of worker processes, which by default is based on the number
+    of processors.
+
+    The edges of the resulting graph are sorted so the output doesn't depend
+    on the order the libraries were read in.
+    """
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        if not cache_result:
+            def _imports(paths):
+                return list(executor.map(read_imports, paths))
+            return _build_graph(dlls, _imports)
+
+        work_directory.mkdir(exist_ok=True)
+        with DependencyCache(work_directory / "dependencies.sqlite") as cache, \
+                concurrent.futures.ThreadPoolExecutor(workers) as hasher:
+            def _cached_imports(paths):
+                # Hashing is I/O bound and hashlib releases the GIL.
+                hashes = list(hasher.map(file_sha256, paths))
+                imports = [cache.get(sha256) for sha256 in hashes]
+                missing = [index for index, found in enumerate(imports)
+                           if found is None]
+                read = executor.map(
+                    read_imports, [paths[index] for index in missing])
+                for index, found in zip(missing, read):
+                    if found is not None:
+                        cache.put(hashes[index], paths[index].name, found)
+                    imports[index] = found
+                return imports
+
+            return _build_graph(dlls, _cached_imports)
 
 
 class GraphOutputType(enum.Enum):
@@ -251,42 +306,106 @@ def render_graph(
     return output_path
 
 
-def _dependencies_chain_to_graph(
-    chain_json: dict,
+def _find_library(name: str, directory: pathlib.Path) -> pathlib.Path | None:
+    """Find the library with the given name next to the library importing it
+    (in directory) and then in the system directory.
+
+    Returns None if the library isn't found.
+    """
+    for candidate_directory in (directory, SYSTEM_DIRECTORY):
+        candidate = candidate_directory / name
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def _is_system_library(name: str, path: pathlib.Path | None) -> bool:
+    """Return True if the library is part of Windows."""
+    # The API sets are virtual libraries that are resolved by the loader.
+    if name.lower().startswith(("api-ms-", "ext-ms-")):
+        return True
+    return path is not None and path.parent == SYSTEM_DIRECTORY
+
+
+def read_imports(path: pathlib.Path) -> list[str] | None:
+    """Read the names of the libraries imported by the library.
+
+    Returns None if the library can't be read or isn't a Portable Executable.
+    """
+    try:
+        with PEFile(path) as executable:
+            return [library.name for library in executable.imports()]
+    except (OSError, ValueError, struct.error) as error:
+        LOGGER.warning("Unable to read the imports of %s: %s", path, error)
+        return None
+
+
+def _build_graph(
+    dlls: list[pathlib.Path],
+    imports_of,
     *,
+    depth: int = 2,
     exclude_system_dlls: bool = True,
 ) -> Graph:
-    """Generate list of nodes and edges for dot.
+    """Build the graph of the dependencies of the libraries.
 
-    chain_json is expected to come from the -json and -chain options of
-    Dependencies by lucasg.
+    The libraries are visited breadth-first, the dependencies found next to
+    a library have their imports read as well, up to the given depth.
+    imports_of is called with the paths of the libraries at each level and
+    returns the names of the libraries each imports, None if unreadable.
     """
-    dependencies_to_check = [chain_json["Root"]]
-
-    def _exclude_depend(depend: dict):
-        return (
-            exclude_system_dlls
-            and depend["Filepath"]
-            and depend["Filepath"].startswith("C:\\Windows\\")
-        )
-
     graph = Graph()
     visited = set()
-    while dependencies_to_check:
-        current = dependencies_to_check.pop()
-        if current["ModuleName"] in visited:
-            continue
-        visited.add(current["ModuleName"])
-        graph.add_node(current["ModuleName"])
-        for depend in current["Dependencies"]:
-            if not _exclude_depend(depend):
-                graph.add_node(depend["ModuleName"])
-                graph.add_edge(current["ModuleName"], depend["ModuleName"])
-                dependencies_to_check.append(depend)
-
+    level = [(dll.name, dll) for dll in dlls]
+    for _ in range(depth):
+        to_read = []
+        for name, path in level:
+            graph.add_node(name)
+            if path is not None and name.lower() not in visited:
+                visited.add(name.lower())
+                to_read.append((name, path))
+        if not to_read:
+            break
+
+        level = []
+        for (name, path), imported_names in zip(
+                to_read, imports_of([path for _, path in to_read])):
+            for depend_name in imported_names or ():
+                depend_path = _find_library(depend_name, path.parent)
+                if exclude_system_dlls and \
+                        _is_system_library(depend_name, depend_path):
+                    continue
+                graph.add_node(depend_name)
+                graph.add_edge(name, depend_name)
+                level.append((depend_name, depend_path))
+
+    graph.edges.sort()
     return graph
 
 
+def read_dependencies(
+    dll: pathlib.Path,
+    *,
+    depth: int = 2,
+    exclude_system_dlls: bool = True,
+) -> Graph:
+    """Read the dependencies of the library from its import table.
+
+    The dependencies found next to the library have their dependencies read
+    as well, up to the given depth. Libraries that can't be found or aren't
+    Portable Executables are still nodes of the graph, with no dependencies.
+
+    If exclude_system_dlls is True then the libraries that are part of
+    Windows are left out of the graph.
+    """
+    return _build_graph(
+        [dll],
+        lambda paths: [read_imports(path) for path in paths],
+        depth=depth,
+        exclude_system_dlls=exclude_system_dlls,
+    )
+
+
 def example(directory: pathlib.Path) -> Graph:
     """Provides an example of using this module."""
     work_directory = WORK_DIRECTORY
@@ -48,13 +48,20 @@ Disk layout
 - ...
 - data zones  (zone count - first data size) <<< log_zone_size.
 
+Caching
+- Blocks are kept in a least-recently used cache, unless the image is memory
+  mapped in which case the operating system's page cache is relied on.
+- I-nodes are cached once read, as the file system is read-only.
+- Paths are cached to their i-node number (a dentry cache), so looking up a
+  path doesn't re-read every directory from the root.
+- Runs of contiguous blocks are coalesced into a single read.
+
 TODO
-- Modify/write to the file system.
+- Modify/write to the file system. The caches will need invalidating when
+  this is done.
 - Write a tool that converted a `tar` to a Minix formatted disk image.
 - Separate block handling / device handling out - i.e. try a more layered
   approach
-- Handle indirect and second-level indirect files.
-- Handle reading part of a file and across blocks.
 
 In-progress
 - Implement fsspec over which provides a more common interface over it the
@@ -64,12 +71,18 @@ In-progress
 Done
 - Add a walk function to walk over the entire file system, similar to
   os.walk(). Completed 2025-12-24.
+- Handle indirect and second-level indirect files.
+- Handle reading part of a file and across blocks.
 """
 
+import collections
 import enum
+import itertools
+import mmap
 import os
 import pathlib
 import struct
+import threading
 import typing
 from dataclasses import dataclass
 
@@ -83,9 +96,21 @@ BLOCK_SIZE: int = 1024
 INODES_PER_BLOCK: int = BLOCK_SIZE // INODE_SIZE
 """The size of a block in bytes."""
 
+INODE_FORMAT: str = "<HHLLBB7HHH"
+"""The format of an i-node on disk for the struct module."""
+
 ROOT_INODE: int = 1
 """The i-node number for the root i-node."""
 
+ZONE_NUMBER_SIZE: int = 2
+"""The size of a zone number in an indirect block in bytes."""
+
+ZONES_PER_INDIRECT_BLOCK: int = BLOCK_SIZE // ZONE_NUMBER_SIZE
+"""The number of zone numbers in an indirect block."""
+
+BLOCK_CACHE_SIZE: int = 1024
+"""The default number of blocks to keep in the block cache."""
+
 
 def _read_short(reader: typing.IO[bytes]) -> int:
     """Read an unsigned short from the reader."""
@@ -271,12 +296,16 @@ class IndexNode:
 
     @classmethod
     def from_bytes(cls, content: bytes, offset: int = 0):
-        format = "<HHLLBB7HHH"
-        assert struct.calcsize(format) == INODE_SIZE, (
-            struct.calcsize(format),
+        assert struct.calcsize(INODE_FORMAT) == INODE_SIZE, (
+            struct.calcsize(INODE_FORMAT),
             INODE_SIZE,
         )
-        data = struct.unpack_from(format, content, offset)
+        data = struct.unpack_from(INODE_FORMAT, content, offset)
+        return cls.from_unpacked(data)
+
+    @classmethod
+    def from_unpacked(cls, data: tuple):
+        """Create the i-node from the values unpacked with INODE_FORMAT."""
         zone_numbers = data[6:13]
         return cls(*data[:6], zone_numbers, *data[13:])
 
@@ -317,11 +346,6 @@ class FileIO(typing.BinaryIO):
                 "Not a regular file - only regular files are supported for now."
             )
 
-        if inode.indirect != 0:
-            raise ValueError("File with indirect i-nodes is NYI.")
-        if inode.double_index != 0:
-            raise ValueError("Files with double-index i-nodes are NYI.")
-
         self._mode = mode
         self._name = name
         self._inode = inode
@@ -369,24 +393,24 @@ class FileIO(typing.BinaryIO):
         if self.closed:
             raise ValueError("I/O operation on closed file.")
 
-        # TODO: partial reads are NYI.
-        n = self._inode.file_size if n < 0 else min(n, self._inode.file_size)
-        data = self._read(position=self._position, size=n)
-        self._position += n
+        remaining = max(self._inode.file_size - self._position, 0)
+        n = remaining if n < 0 else min(n, remaining)
+        data = self._system.read_file(self._inode, self._position, n)
+        self._position += len(data)
         return data
 
-    def _read(self, position: int, size: int) -> bytes:
-        """Read the given number of bytes (size) starting at position."""
-        file_size = self._inode.file_size
-        if position >= file_size:
-            return b""
-        block_number = self._system._position_to_block_number(self._inode, position)
-        block = self._system.get_block(block_number)
-        if len(block) < size:
-            message = f"Only reading the first block is supported ({size})"
-            raise ValueError(message)
+    def readinto(self, buffer) -> int:
+        """Read bytes into a pre-allocated, writable bytes-like object.
+
+        Returns the number of bytes read (0 for EOF). The data is copied
+        straight into the buffer from the image.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
 
-        return block[position : min(position + size, file_size)]
+        count = self._system.readinto_file(self._inode, self._position, buffer)
+        self._position += count
+        return count
 
     def seekable(self) -> bool:
         """Return whether object supports random access.
@@ -405,10 +429,22 @@ class FileIO(typing.BinaryIO):
             self._position = offset
             return self._position
 
-        # * 1 -- current stream position; offset may be negative
-        # * 2 -- end of stream; offset is usually negative
+        if whence == 1:
+            # Current stream position; offset may be negative
+            self._position = max(self._position + offset, 0)
+            return self._position
+
+        if whence == 2:
+            # End of stream; offset is usually negative
+            self._position = max(self._inode.file_size + offset, 0)
+            return self._position
+
         raise ValueError("Unhandled value for whence")
 
+    def tell(self) -> int:
+        """Return the current stream position."""
+        return self._position
+
     def writable(self) -> bool:
         """Return whether object was opened for writing.
 
@@ -434,20 +470,56 @@ class LoadedSystem:
     # inode_map_blocks: list
     # # The length of this list is equal to super_block.inode_map_block_count
 
-    def __init__(self, super_block: SuperBlock, reader: typing.IO[bytes]):
+    def __init__(
+        self,
+        super_block: SuperBlock,
+        reader: typing.IO[bytes],
+        block_cache_size: int = BLOCK_CACHE_SIZE,
+        use_mmap: bool = False,
+    ):
         self.super_block = super_block
         self.inode_map_blocks = []
         self.zone_map_blocks = []
         self.root_inode: IndexNode | None = None
 
         self._reader = reader
+        self._reader_lock = threading.Lock()
+        """Guards the position of the reader and the block cache so the
+        system can be shared between threads."""
+
+        self._mmap: mmap.mmap | None = None
+        if use_mmap:
+            self._mmap = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._block_cache: collections.OrderedDict[int, bytes] = (
+            collections.OrderedDict()
+        )
+        self._block_cache_size = block_cache_size
+
+        self._inode_cache: dict[int, IndexNode] = {}
+        """The i-nodes that have been read keyed by their number."""
+
+        self._dentry_cache: dict[pathlib.PurePosixPath, int] = {
+            pathlib.PurePosixPath("/"): ROOT_INODE,
+        }
+        """The i-node number for paths that have been looked up."""
 
     @classmethod
-    def from_reader(cls, reader: typing.IO[bytes]):
+    def from_reader(
+        cls,
+        reader: typing.IO[bytes],
+        block_cache_size: int = BLOCK_CACHE_SIZE,
+        use_mmap: bool = False,
+    ):
+        """Load the file system from the reader.
+
+        If use_mmap is True then the reader must be a real file, which will
+        be memory mapped rather than read with seek() and read().
+        """
         reader.seek(SuperBlock.OFFSET)
         super_block = SuperBlock.from_reader(reader)
 
-        loaded_system = cls(super_block, reader)
+        loaded_system = cls(super_block, reader, block_cache_size, use_mmap)
         loaded_system.load_bit_maps()
         loaded_system.root_inode = loaded_system.get_inode(ROOT_INODE)
 
@@ -456,9 +528,77 @@ class LoadedSystem:
 
         return loaded_system
 
+    def close(self):
+        """Release the memory map if there is one.
+
+        The reader is owned by the caller so is not closed.
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._block_cache.clear()
+
+    def _inode_block_number(self, inode_number: int) -> int:
+        """Return the number of the block that the i-node resides in."""
+        return (
+            (inode_number - 1) // INODES_PER_BLOCK
+            + self.super_block.inode_map_block_count
+            + self.super_block.zone_map_block_count
+            + 2
+        )
+
+    def load_inodes(self, inode_numbers: typing.Iterable[int]) -> dict[int, IndexNode]:
+        """Load the given i-nodes into the i-node cache in bulk.
+
+        Rather than reading the i-node block for each i-node, the blocks of
+        the i-node table that hold them are read once (contiguous blocks with
+        a single read) and every i-node within them is decoded and cached.
+
+        Returns the i-nodes that were requested keyed by their number.
+        """
+        inode_numbers = list(inode_numbers)
+        missing_blocks = sorted(
+            {
+                self._inode_block_number(inode_number)
+                for inode_number in inode_numbers
+                if inode_number not in self._inode_cache
+            }
+        )
+
+        first_table_block = self._inode_block_number(1)
+        for first_block, count in self._coalesce(missing_blocks):
+            blocks = self.read_blocks(first_block, count)
+            first_inode_number = (
+                first_block - first_table_block
+            ) * INODES_PER_BLOCK + 1
+            for index, data in enumerate(struct.iter_unpack(INODE_FORMAT, blocks)):
+                inode_number = first_inode_number + index
+                if inode_number > self.super_block.inode_count:
+                    break
+                if inode_number not in self._inode_cache:
+                    inode = IndexNode.from_unpacked(data)
+                    inode.number = inode_number
+                    self._inode_cache[inode_number] = inode
+
+        return {
+            inode_number: self.get_inode(inode_number) for inode_number in inode_numbers
+        }
+
+    def load_all_inodes(self) -> dict[int, IndexNode]:
+        """Load every i-node in the i-node table.
+
+        This is intended for indexing the entire image, the table is read in
+        a single read.
+        """
+        return self.load_inodes(range(1, self.super_block.inode_count + 1))
+
     def get_inode(self, inode_number: int):
-        # TODO: There is typically an i-node cache here.
-        return self.rw_inode(inode_number, ReadWriteFlag.READING)
+        inode = self._inode_cache.get(inode_number)
+        if inode is None:
+            inode = self.rw_inode(inode_number, ReadWriteFlag.READING)
+            inode.number = inode_number
+            self._inode_cache[inode_number] = inode
+        return inode
 
     def rw_inode(self, inode_number: int, rw_flags: ReadWriteFlag):
         """Transfer an i-node between memory and disk.
@@ -485,12 +625,7 @@ class LoadedSystem:
             raise ValueError("NYI")
 
         # Determine which block the i-node resides in.
-        block_number = (
-            (inode_number - 1) // INODES_PER_BLOCK
-            + self.super_block.inode_map_block_count
-            + self.super_block.zone_map_block_count
-            + 2
-        )
+        block_number = self._inode_block_number(inode_number)
         block = self.get_block(block_number)
 
         # TODO: Find the i-node in the block
@@ -501,13 +636,205 @@ class LoadedSystem:
         # raw_data = block[offset_in_block_bytes:offset_in_block_bytes + INODE_SIZE]
         return IndexNode.from_bytes(block, offset=offset_in_block_bytes)
 
-    def get_block(self, block_number: int):
-        # Typically, there would be a cache for for the blocks loaded in,
-        # however since this is is intended to simply run on an existing
-        # system, rely on their file system cache instead. This may be
-        # revisited later.
-        self._reader.seek(BLOCK_SIZE * block_number)
-        return self._reader.read(BLOCK_SIZE)
+    def get_block(self, block_number: int) -> bytes:
+        """Return the contents of the given block.
+
+        When the image is memory mapped, the operating system's page cache is
+        used rather than the block cache.
+        """
+        if self._mmap is not None:
+            offset = BLOCK_SIZE * block_number
+            return self._mmap[offset : offset + BLOCK_SIZE]
+
+        with self._reader_lock:
+            block = self._block_cache.get(block_number)
+            if block is not None:
+                self._block_cache.move_to_end(block_number)
+                return block
+
+            self._reader.seek(BLOCK_SIZE * block_number)
+            block = self._reader.read(BLOCK_SIZE)
+
+            self._block_cache[block_number] = block
+            if len(self._block_cache) > self._block_cache_size:
+                self._block_cache.popitem(last=False)
+            return block
+
+    def read_blocks(self, block_number: int, count: int) -> bytes:
+        """Read count contiguous blocks starting at block_number at once.
+
+        The blocks are not added to the block cache as this is intended for
+        reading the contents of files, which would otherwise evict the
+        directories and i-nodes that are more likely to be used again.
+        """
+        if count == 1:
+            return self.get_block(block_number)
+
+        offset = BLOCK_SIZE * block_number
+        if self._mmap is not None:
+            return self._mmap[offset : offset + BLOCK_SIZE * count]
+
+        with self._reader_lock:
+            self._reader.seek(offset)
+            return self._reader.read(BLOCK_SIZE * count)
+
+    def _zone_to_block_numbers(self, zone_number: int) -> range:
+        """Return the block numbers that make up the zone."""
+        first_block = zone_number << self.super_block.log_zone_size
+        return range(first_block, first_block + (1 << self.super_block.log_zone_size))
+
+    def _indirect_zone_numbers(self, zone_number: int) -> tuple[int, ...]:
+        """Return the zone numbers stored in an indirect zone."""
+        if zone_number == 0:
+            # A hole, where every zone it refers to is also a hole.
+            return (0,) * ZONES_PER_INDIRECT_BLOCK
+        block = self.get_block(zone_number << self.super_block.log_zone_size)
+        return struct.unpack_from(f"<{ZONES_PER_INDIRECT_BLOCK}H", block)
+
+    def zone_numbers(
+        self, inode: IndexNode, first_zone_index: int = 0
+    ) -> typing.Iterator[int]:
+        """Yield the zone numbers of the file's contents in order.
+
+        This covers the direct zones followed by the zones from the indirect
+        zone and then the second-level (double) indirect zone. It stops at
+        the end of the file. A zone number of 0 is a hole in the file which
+        reads as zeros.
+
+        Parameters
+        ----------
+        inode
+            The i-node of the file.
+        first_zone_index
+            The index of the first zone to yield, this allows starting part
+            way through the file without reading the indirect zones that
+            aren't needed.
+        """
+        zone_size = BLOCK_SIZE << self.super_block.log_zone_size
+        zone_count = (inode.file_size + zone_size - 1) // zone_size
+        direct_count = len(inode.zone_numbers)
+
+        index = first_zone_index
+        while index < min(zone_count, direct_count):
+            yield inode.zone_numbers[index]
+            index += 1
+
+        # Single indirect.
+        start = direct_count
+        end = start + ZONES_PER_INDIRECT_BLOCK
+        if index < min(zone_count, end):
+            zones = self._indirect_zone_numbers(inode.indirect)
+            while index < min(zone_count, end):
+                yield zones[index - start]
+                index += 1
+
+        # Double indirect.
+        start = end
+        while index < zone_count:
+            outer = (index - start) // ZONES_PER_INDIRECT_BLOCK
+            if outer >= ZONES_PER_INDIRECT_BLOCK:
+                raise ValueError("The file is larger than the maximum size.")
+            double_zones = self._indirect_zone_numbers(inode.double_index)
+            zones = self._indirect_zone_numbers(double_zones[outer])
+            first = start + outer * ZONES_PER_INDIRECT_BLOCK
+            end = min(zone_count, first + ZONES_PER_INDIRECT_BLOCK)
+            while index < end:
+                yield zones[index - first]
+                index += 1
+
+    def block_numbers(
+        self, inode: IndexNode, first_block_index: int = 0
+    ) -> typing.Iterator[int]:
+        """Yield the block numbers of the file's contents in order.
+
+        A block number of 0 is a hole in the file which reads as zeros.
+        """
+        log_zone_size = self.super_block.log_zone_size
+        blocks_per_zone = 1 << log_zone_size
+        skip = first_block_index - (
+            (first_block_index >> log_zone_size) << log_zone_size
+        )
+        for zone_number in self.zone_numbers(inode, first_block_index >> log_zone_size):
+            for block_offset in range(skip, blocks_per_zone):
+                if zone_number == 0:
+                    yield 0
+                else:
+                    yield (zone_number << log_zone_size) + block_offset
+            skip = 0
+
+    def readinto_file(self, inode: IndexNode, position: int, buffer) -> int:
+        """Read the contents of a file starting at position into the buffer.
+
+        The runs of contiguous blocks are copied straight into the buffer
+        with a single read (or a single copy from the memory map) per run.
+
+        Returns the number of bytes read, which is less than the length of
+        the buffer if the end of the file is reached.
+        """
+        destination = memoryview(buffer).cast("B")
+        size = min(len(destination), max(inode.file_size - position, 0))
+        if size == 0:
+            return 0
+
+        first_block_index = position // BLOCK_SIZE
+        last_block_index = (position + size - 1) // BLOCK_SIZE
+        block_numbers = self.block_numbers(inode, first_block_index)
+        block_count = last_block_index - first_block_index + 1
+
+        # The offset within the first block to start from.
+        skip = position - first_block_index * BLOCK_SIZE
+        written = 0
+        runs = self._coalesce(itertools.islice(block_numbers, block_count))
+        for first_block, count in runs:
+            run_size = min(count * BLOCK_SIZE - skip, size - written)
+            target = destination[written : written + run_size]
+            if first_block == 0:
+                target[:] = bytes(run_size)
+            else:
+                offset = first_block * BLOCK_SIZE + skip
+                if self._mmap is not None:
+                    target[:] = self._mmap[offset : offset + run_size]
+                else:
+                    with self._reader_lock:
+                        self._reader.seek(offset)
+                        self._reader.readinto(target)
+            written += run_size
+            skip = 0
+
+        return written
+
+    def read_file(self, inode: IndexNode, position: int, size: int) -> bytes:
+        """Read up to size bytes from the file starting at position."""
+        size = min(size, max(inode.file_size - position, 0))
+        buffer = bytearray(size)
+        count = self.readinto_file(inode, position, buffer)
+        del buffer[count:]
+        return bytes(buffer)
+
+    @staticmethod
+    def _coalesce(block_numbers: typing.Iterable[int]):
+        """Yield (first block number, count) for each run of contiguous blocks.
+
+        This allows a run of blocks to be read with a single read rather than
+        a read per block. A run of holes (block number 0) is also coalesced.
+        """
+        first = None
+        count = 0
+        for block_number in block_numbers:
+            if first is not None:
+                if (first == 0 and block_number == 0) or (
+                    first != 0 and block_number == first + count
+                ):
+                    count += 1
+                    continue
+
+            if first is not None:
+                yield first, count
+            first = block_number
+            count = 1
+
+        if first is not None:
+            yield first, count
 
     def load_bit_maps(self):
         """Fetch the bit maps for the file system.
@@ -532,15 +859,14 @@ class LoadedSystem:
         if not inode.is_directory:
             raise ValueError("The inode should be a directory but wasn't.")
 
-        if inode.indirect != 0:
-            raise ValueError("Directories with indirect i-nodes is NYI.")
-        if inode.double_index != 0:
-            raise ValueError("Directories with double-index i-nodes are NYI.")
-
+        # The zones are typically allocated contiguously so the blocks of the
+        # directory are read in as few reads as possible.
         entries = []
-        for zone in inode.zone_numbers:
-            block = self.get_block(zone)
-            for child_inode, name in struct.iter_unpack("<H14s", block):
+        for first_block, count in self._coalesce(self.block_numbers(inode)):
+            if first_block == 0:
+                continue  # A hole in the directory.
+            blocks = self.read_blocks(first_block, count)
+            for child_inode, name in struct.iter_unpack("<H14s", blocks):
                 if child_inode != 0:
                     terminator = name.find(b"\0")
                     if terminator >= 0:
@@ -554,10 +880,21 @@ class LoadedSystem:
             raise ValueError("Relative paths is NYI or supported.")
 
         assert path.parts[0] == "/", "Only absolute paths are supported"
-        parts = path.parts[1:]
-        current_node = self.root_inode
-        current_node.number = ROOT_INODE
-        path_so_far = pathlib.PurePosixPath("/")
+
+        inode_number = self._dentry_cache.get(path)
+        if inode_number is not None:
+            return self.get_inode(inode_number)
+
+        # Start from the longest parent that has already been looked up.
+        start = pathlib.PurePosixPath("/")
+        for parent in path.parents:
+            if parent in self._dentry_cache:
+                start = parent
+                break
+
+        parts = path.parts[len(start.parts) :]
+        current_node = self.get_inode(self._dentry_cache[start])
+        path_so_far = start
         for part in parts:
             children = self.read_directory(current_node).entries
             path_so_far = path_so_far / part
@@ -573,7 +910,7 @@ class LoadedSystem:
 
             # Look-up the inode.
             current_node = self.get_inode(part_inode_number)
-            current_node.number = part_inode_number
+            self._dentry_cache[path_so_far] = part_inode_number
 
         return current_node
 
@@ -597,17 +934,23 @@ class LoadedSystem:
         if not inode.is_directory:
             raise NotADirectoryError(f"The directory name is invalid: {path}")
 
-        # This could be reworked to replace read_directory(), granted that
-        # function doesn't currently need to look-up the inodes of the
-        # children, so in a way it is lazier then this function.
-        children = self.read_directory(inode).entries
+        # The i-nodes of the children are loaded in bulk, so each DirEntry
+        # has its stat result already rather than reading an i-node block
+        # for each child.
+        children = [
+            child
+            for child in self.read_directory(inode).entries
+            if child.filename not in (b".", b"..")
+        ]
+        inodes = self.load_inodes(child.inode_number for child in children)
         for child in children:
-            if child.filename in (b".", b".."):
-                continue
+            child_path = path / child.filename.decode("utf-8")
+            self._dentry_cache[child_path] = child.inode_number
             yield DirEntry(
-                path / child.filename.decode("utf-8"),
+                child_path,
                 child.inode_number,
                 system=self,
+                inode=inodes[child.inode_number],
             )
 
     def stat(self, path: os.PathLike | str) -> os.stat_result:
@@ -621,16 +964,13 @@ class LoadedSystem:
         """Given the position within the file return the block number in
         which that position is found.
 
-        This is the block not zone number.
+        This is the block not zone number. The block number is 0 if the
+        position is within a hole in the file.
         """
+        if position >= inode.file_size:
+            raise ValueError("The position is beyond the end of the file.")
         block_index = position // BLOCK_SIZE
-        zone_index = block_index >> self.super_block.log_zone_size
-        block_offset = block_index - (zone_index << self.super_block.log_zone_size)
-        assert zone_index < len(inode.zone_numbers)
-        zone_number = inode.zone_numbers[zone_index]
-        if zone_number == 0:
-            raise ValueError("No zone or block number")
-        return (zone_number << self.super_block.log_zone_size) + block_offset
+        return next(self.block_numbers(inode, block_index))
 
 
 class DirEntry:
@@ -640,13 +980,19 @@ class DirEntry:
     """
 
     def __init__(
-        self, path: pathlib.PurePosixPath, inode_number: int, system: LoadedSystem
+        self,
+        path: pathlib.PurePosixPath,
+        inode_number: int,
+        system: LoadedSystem,
+        inode: IndexNode | None = None,
     ):
         self._path = path
         self._inode_number = inode_number
         self._system = system
-        self._cached_inode: IndexNode | None = None
+        self._cached_inode: IndexNode | None = inode
         self._cached_stat: os.stat_result | None = None
+        if inode is not None:
+            self._cached_stat = inode.stat(inode_number)
 
     @property
     def name(self) -> str:
@@ -687,23 +1033,28 @@ class DirEntry:
         return f"{self.__class__.__qualname__}('{self._path}', {self.inode()})"
 
 
-def walk(path: os.PathLike | str, system: LoadedSystem):
+def walk(path: os.PathLike | str, system: LoadedSystem, breadth_first: bool = False):
     """Directory tree generator.
 
     For each directory in the directory tree rooted at top (including top
     itself, but excluding '.' and '..'), yields a 3-tuple
 
         dirpath, dirnames, filenames
+
+    If breadth_first is True, then every directory at one depth is yielded
+    before the directories at the next depth. This allows the directories at
+    each depth to be read in block order and the i-nodes of all their
+    children to be loaded at once.
     """
 
     path = pathlib.PurePosixPath(os.fspath(path))
 
+    if breadth_first:
+        yield from _walk_breadth_first(path, system)
+        return
+
     # This is based on the os.walk() function, it would be better if it yield
     # the DirEntry items instead of the names only.
-    #
-    # if there was a version of scandir() that took the inode numbers or even
-    # the inodes then this would be simpler as scandir() already loads the
-    # IndexNode to determine if it is a directory or not.
     directories = []
     non_directories = []
 
@@ -721,6 +1072,64 @@ def walk(path: os.PathLike | str, system: LoadedSystem):
         yield from walk(path / directory, system)
 
 
+def _walk_breadth_first(path: pathlib.PurePosixPath, system: LoadedSystem):
+    """Directory tree generator which visits one depth at a time.
+
+    As with walk(), removing an item from dirnames prevents it from being
+    visited.
+    """
+    inode = system._path_to_inode(path)
+    if not inode.is_directory:
+        raise NotADirectoryError(f"The directory name is invalid: {path}")
+
+    level = [(path, inode.number)]
+    while level:
+        inodes = system.load_inodes(inode_number for _, inode_number in level)
+
+        # Read the directories in the order of their first block, so the reads
+        # sweep through the image rather than jump back and forth.
+        def _first_block(item):
+            return next(system.block_numbers(inodes[item[1]]), 0)
+
+        children_per_directory = {}
+        for directory_path, inode_number in sorted(level, key=_first_block):
+            children_per_directory[directory_path] = [
+                child
+                for child in system.read_directory(inodes[inode_number]).entries
+                if child.filename not in (b".", b"..")
+            ]
+
+        child_inodes = system.load_inodes(
+            child.inode_number
+            for children in children_per_directory.values()
+            for child in children
+        )
+
+        next_level = []
+        for directory_path, _ in level:
+            directories = []
+            non_directories = []
+            directory_inode_numbers = {}
+            for child in children_per_directory[directory_path]:
+                name = child.filename.decode("utf-8")
+                system._dentry_cache[directory_path / name] = child.inode_number
+                if child_inodes[child.inode_number].is_directory:
+                    directories.append(name)
+                    directory_inode_numbers[name] = child.inode_number
+                else:
+                    non_directories.append(name)
+
+            yield directory_path, directories, non_directories
+
+            next_level.extend(
+                (directory_path / name, directory_inode_numbers[name])
+                for name in directories
+                if name in directory_inode_numbers
+            )
+
+        level = next_level
+
+
 def open_image(path: pathlib.Path):
     """Open an image that was formatted as the Minix file system.
 
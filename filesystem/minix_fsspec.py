@@ -6,11 +6,11 @@ spin this out as its own Python package with a the right entry point.
 Write-support would be great as that would make it easier to write tests.
 
 
+File access is provided by _open() returning a buffered file whose
+_fetch_range() reads the whole range at once from the image and cat_file()
+which reads straight from the image without the buffering.
+
 TODO:
-- File access
-    - cat() requires _fetch_range()
-    - Alternative is provide a better file-like  returned by _open() instead of
-      the abstract buffered file one. This simply has to provide io.IOBase.
 - Write support - required write support in the minix module first.
 """
 
@@ -19,6 +19,19 @@ import pathlib
 
 import minix
 import fsspec
+import fsspec.spec
+
+
+class MinixBufferedFile(fsspec.spec.AbstractBufferedFile):
+    """A read-only file from a disk image formatted as the Minix file system."""
+
+    def __init__(self, fs, path, inode: minix.IndexNode, **kwargs):
+        self.inode = inode
+        super().__init__(fs, path, size=inode.file_size, **kwargs)
+
+    def _fetch_range(self, start, end):
+        """Get the specified set of bytes from the image."""
+        return self.fs.system.read_file(self.inode, start, end - start)
 
 
 class MinixFileSystem(fsspec.AbstractFileSystem):
@@ -33,7 +46,7 @@ class MinixFileSystem(fsspec.AbstractFileSystem):
         # file to the garbage collector.
 
         self.reader = image_path.open("rb")
-        self.system = minix.LoadedSystem.from_reader(self.reader)
+        self.system = minix.LoadedSystem.from_reader(self.reader, use_mmap=True)
 
     def ls(self, path, detail=True):
 
@@ -66,6 +79,45 @@ class MinixFileSystem(fsspec.AbstractFileSystem):
             return {"name": path, "size": 0, "type": "directory"}
         return {"name": path, "size": inode.file_size, "type": "file"}
 
+    def _open(self, path, mode="rb", block_size=None, autocommit=True,
+              cache_options=None, **kwargs):
+        if mode != "rb":
+            raise NotImplementedError("Only reading is supported.")
+
+        inode = self.system._path_to_inode(pathlib.PurePosixPath(path))
+        if inode.is_directory:
+            raise IsADirectoryError(f"Is a directory: '{path}'.")
+
+        return MinixBufferedFile(
+            self,
+            path,
+            inode,
+            mode=mode,
+            block_size=block_size or "default",
+            autocommit=autocommit,
+            cache_options=cache_options,
+            **kwargs,
+        )
+
+    def cat_file(self, path, start=None, end=None, **kwargs):
+        """Get the content of a file.
+
+        This reads the range straight from the image rather than going
+        through the buffered file.
+        """
+        inode = self.system._path_to_inode(pathlib.PurePosixPath(path))
+        if inode.is_directory:
+            raise IsADirectoryError(f"Is a directory: '{path}'.")
+
+        size = inode.file_size
+        start = 0 if start is None else start
+        end = size if end is None else end
+        if start < 0:
+            start = max(size + start, 0)
+        if end < 0:
+            end = max(size + end, 0)
+        return self.system.read_file(inode, start, max(end - start, 0))
+
 
 if __name__ == "__main__":
     fs = MinixFileSystem(pathlib.Path.cwd() / "minixfs.raw")
@@ -109,9 +161,11 @@ if __name__ == "__main__":
     print("Root information", fs.info("/"))
     print("Disk usage of /", fs.disk_usage("/"))
 
-    # TODO: Handle this
-    # welcome = fs.cat_file("/users/ast/welcome")
-    # print(welcome)
+    welcome = fs.cat_file("/users/ast/welcome")
+    print(welcome)
+
+    welcome = fs.cat("/users/ast/welcome")
+    print(welcome)
 
-    # welcome = fs.cat("/users/ast/welcome")
-    # print(welcome)
+    with fs.open("/users/ast/books") as books:
+        print(books.read())
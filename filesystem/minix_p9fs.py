@@ -4,6 +4,18 @@ The implementation for pyroute2 looks better however that package is heavily
 non-Windows, so uses https://github.com/pbchekin/p9fs-py/blob/main/src/py9p
 maintained by pbchekin.
 
+Each connection is handled by its own thread (ThreadedServer) so multiple
+clients mounting the same image can read concurrently. The i-node that a fid
+refers to is cached on the fid when it is walked to, so subsequent requests
+on that fid don't need to resolve the path again. The path to i-node lookups
+are cached by the minix module which is shared across the clients.
+
+To try it out, start the server then use a 9P client such as the fsspec one
+from p9fs (or run this module with --client while the server is running):
+    fs = p9fs.P9FileSystem(host="127.0.0.1", port=8999, username="root",
+                           version="9P2000")
+    print(fs.ls("/"))
+
 TODO:
 - Write support - required write support in the minix module first.
 - Extend the logging to include include where the requests came from,.which is
@@ -16,11 +28,14 @@ TODO:
 # ]
 # ///
 
+import argparse
 import logging
 import os
 import pathlib
 import posixpath
+import socket
 import stat as stat_module
+import threading
 
 import minix
 from p9fs import py9p
@@ -31,17 +46,75 @@ LOGGER = logging.getLogger(
 )
 
 
+class ThreadedServer(py9p.Server):
+    """A 9P server which handles each connection on its own thread.
+
+    The base server handles every request from every connection on a single
+    thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+
+    def serve(self):
+        while True:
+            connection, address = self.sock.accept()
+            LOGGER.info("Accepted connection from %s", address)
+            self.serve_connection(connection, address)
+
+    def serve_connection(
+        self, connection: socket.socket, address=None
+    ) -> threading.Thread:
+        """Handle the requests from the connection on a new thread.
+
+        This is how accepted connections are handled, it can also be given
+        one end of a socket pair.
+        """
+        sock = py9p.Sock(connection, self.dotu, self.chatty)
+        with self._lock:
+            self.activesocks[connection] = sock
+        thread = threading.Thread(
+            target=self._serve_connection,
+            args=(connection, sock),
+            name=f"9p-{address}",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def _serve_connection(self, connection: socket.socket, sock: py9p.Sock):
+        """Handle the requests from a single connection until it closes."""
+        try:
+            while True:
+                self.fromnet(sock)
+        except py9p.EofError:
+            LOGGER.info("Connection closed")
+        except OSError as error:
+            LOGGER.warning("Socket error: %s", error)
+        except Exception:
+            LOGGER.exception("Error handling request, dropping connection")
+        finally:
+            with self._lock:
+                if connection in self.activesocks:
+                    self.shutdown(connection)
+                else:
+                    connection.close()
+
+
 class MinixFs:
     def __init__(self, image_path: pathlib.Path):
         self.reader = image_path.open("rb")
-        self.system = minix.LoadedSystem.from_reader(self.reader)
+        self.system = minix.LoadedSystem.from_reader(self.reader, use_mmap=True)
         self.root = self.pathtodir("/")
         self.root.localpath = pathlib.PurePosixPath("/")
         self.files = {
             self.root.qid.path: self.root,
         }
+        self._files_lock = threading.Lock()
 
     def close(self):
+        self.system.close()
         self.system = None
         self.reader.close()
 
@@ -60,6 +133,18 @@ class MinixFs:
         stat = self.system.stat(path)
         return self.stat_to_dir(path, stat)
 
+    def _fid_inode(self, fid, f) -> minix.IndexNode:
+        """Return the i-node that the fid refers to.
+
+        The i-node is cached on the fid when it is walked to, the root (from
+        attach) is looked-up once then cached as well.
+        """
+        inode = getattr(fid, "inode", None)
+        if inode is None:
+            inode = self.system._path_to_inode(f.localpath)
+            fid.inode = inode
+        return inode
+
     def stat_to_dir(self, path: os.PathLike | str, stat: os.stat_result) -> py9p.Dir:
         """Convert a stat_result to the plan 9 dir type."""
         if stat.st_uid == 0:
@@ -102,17 +187,17 @@ class MinixFs:
             return
 
         LOGGER.info(f"open [%s]", f.localpath)
-        stat = self.system.stat(f.localpath)
-        if (req.ifcall.mode & 3) == py9p.OWRITE:
+        if (req.ifcall.mode & 3) in (py9p.OWRITE, py9p.ORDWR):
             srv.respond(req, "read-only file server")
             return
-        elif (req.ifcall.mode & 3) == py9p.ORDWR:
-            srv.respond(req, "read-only file server")
-        else:  # py9p.OREAD and otherwise
-            m = "rb"
 
-        if not (f.qid.type & py9p.QTDIR) and not stat_module.S_ISLNK(stat.st_mode):
-            f.fd = self.system.open(f.localpath, m)
+        inode = self._fid_inode(req.fid, f)
+        if (
+            not inode.is_directory
+            and (inode.mode & minix.INODE_TYPE_MASK) != minix.ModeFlags.REGULAR
+        ):
+            srv.respond(req, "only regular files are supported")
+            return
 
         srv.respond(req, None)
 
@@ -122,6 +207,7 @@ class MinixFs:
             srv.respond(req, "unknown file")
             return
 
+        inode = None
         npath = f.localpath
         for path in req.ifcall.wname:
             # The normpath() handles collapsing .. and . as the pure paths
@@ -135,28 +221,36 @@ class MinixFs:
                 qid = f.parent.qid
                 req.ofcall.wqid.append(qid)
                 f = f.parent
+                inode = None
             else:
                 try:
-                    d = self.pathtodir(npath)
+                    # The path look-up is cached by the minix module so this
+                    # only reads the directories that haven't been seen.
+                    inode = self.system._path_to_inode(npath)
+                    d = self.stat_to_dir(npath, inode.stat(inode.number))
                 except:
                     LOGGER.warning("File not found: %s", npath)
                     srv.respond(req, "file not found")
                     return
 
-                nf = self.getfile(d.qid.path)
-                if nf:
-                    # already exists, just append to req
-                    req.ofcall.wqid.append(d.qid)
-                    f = nf
-                else:
-                    d.localpath = npath
-                    d.basedir = d.localpath.parent
-                    # "/".join(npath.split("/")[:-1])
-                    d.parent = f
-                    self.files[d.qid.path] = d
-                    req.ofcall.wqid.append(d.qid)
-                    f = d
-
+                with self._files_lock:
+                    nf = self.getfile(d.qid.path)
+                    if nf:
+                        # already exists, just append to req
+                        req.ofcall.wqid.append(d.qid)
+                        f = nf
+                    else:
+                        d.localpath = npath
+                        d.basedir = d.localpath.parent
+                        # "/".join(npath.split("/")[:-1])
+                        d.parent = f
+                        self.files[d.qid.path] = d
+                        req.ofcall.wqid.append(d.qid)
+                        f = d
+
+        # Cache the i-node on the new fid so open, read and stat don't need
+        # to resolve the path again.
+        req.newfid.inode = inode
         req.ofcall.nwqid = len(req.ofcall.wqid)
         srv.respond(req, None)
 
@@ -177,11 +271,8 @@ class MinixFs:
         if not f:
             srv.respond(req, 'unknown file')
             return
-        f = self.files[req.fid.qid.path]
-        if hasattr(f, 'fd') and f.fd is not None:
-            LOGGER.info("close [%s]", f.localpath)
-            f.fd.close()
-            f.fd = None
+        LOGGER.info("close [%s]", f.localpath)
+        req.fid.inode = None
         srv.respond(req, None)
 
     def stat(self, srv, req):
@@ -190,7 +281,10 @@ class MinixFs:
         if not f:
             srv.respond(req, "unknown file")
             return
-        req.ofcall.stat.append(self.pathtodir(f.localpath))
+        inode = self._fid_inode(req.fid, f)
+        req.ofcall.stat.append(
+            self.stat_to_dir(f.localpath, inode.stat(inode.number))
+        )
         srv.respond(req, None)
 
     def wstat(self, srv, req):
@@ -202,39 +296,81 @@ class MinixFs:
             srv.respond(req, "unknown file")
             return
 
-        inode = self.system._path_to_inode(f.localpath)
+        inode = self._fid_inode(req.fid, f)
         if f.qid.type & py9p.QTDIR:
             LOGGER.info("read directory: %s", f.localpath)
-            directory = self.system.read_directory(inode)
 
             # no need to add anything to self.files yet
             # wait until they walk to it
-            l = filter(
-                lambda entry: entry.filename not in (b".", b".."), directory.entries
-            )
-            # The performance of this could be improved to skip the path
-            # look-up and use the inodes, or have a stat_to_dir().
-            # path / child.filename.decode("utf-8"),
+            #
+            # The i-nodes of the children are loaded in bulk by scandir(),
+            # rather than looking up the path of each child.
             req.ofcall.stat = [
-                self.pathtodir(f.localpath / entry.filename.decode("utf-8"))
-                for entry in l
+                self.stat_to_dir(entry.path, entry.stat())
+                for entry in self.system.scandir(f.localpath)
             ]
         else:
             LOGGER.info("read file: %s", f.localpath)
-            f.fd.seek(req.ifcall.offset)
-            req.ofcall.data = f.fd.read(req.ifcall.count)
+            # The whole request is served with one read from the image rather
+            # than a read per block, and as it is a positional read the fid
+            # doesn't need its own file object.
+            req.ofcall.data = self.system.read_file(
+                inode, req.ifcall.offset, req.ifcall.count
+            )
         srv.respond(req, None)
 
     def write(self, srv, req):
         LOGGER.info("write")
 
 
+def _example_client(host: str, port: int):
+    """Read every file from the server with several concurrent clients."""
+    import concurrent.futures
+    import p9fs
+
+    def _read_all(client_number):
+        fs = p9fs.P9FileSystem(
+            host=host, port=port, username="root", version="9P2000"
+        )
+        total = 0
+        for path in fs.find("/"):
+            total += len(fs.cat_file(path))
+        return client_number, total
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        for client_number, total in executor.map(_read_all, range(4)):
+            print(f"Client {client_number} read {total} bytes")
+
+
 if __name__ == "__main__":
-    srv = py9p.Server(listen=("0.0.0.0", 8999), chatty=False)
+    parser = argparse.ArgumentParser(
+        description="Serve an image of the Minix file system over 9P.",
+    )
+    parser.add_argument(
+        "image",
+        nargs="?",
+        type=pathlib.Path,
+        default=pathlib.Path.cwd() / "minixfs.raw",
+        help="The path to the image formatted with the Minix file system.",
+    )
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument(
+        "--client",
+        action="store_true",
+        help="Run several clients against a server that is already running "
+        "rather than starting the server.",
+    )
+    arguments = parser.parse_args()
+
+    if arguments.client:
+        _example_client("127.0.0.1", arguments.port)
+        raise SystemExit(0)
+
+    srv = ThreadedServer(listen=("0.0.0.0", arguments.port), chatty=False)
     if not srv.chatty:
         logging.basicConfig(level=logging.INFO)
     assert not srv.dotu, "NYI"
-    with MinixFs(pathlib.Path.cwd() / "minixfs.raw") as fs:
+    with MinixFs(arguments.image) as fs:
         srv.mount(fs)
         if not srv.chatty:
             print(f"Listening {srv.host} on port {srv.port}")
@@ -0,0 +1,131 @@
+"""Tests the 9P server for Minix images with a client over a socket pair.
+
+The image is built here rather than with mkfs.minix, as adding files to it
+would require mounting it.
+"""
+
+import pathlib
+import socket
+import struct
+import tempfile
+import unittest
+
+import minix
+import minix_p9fs
+from p9fs import py9p
+
+
+def _write_image(path: pathlib.Path, files: dict[str, bytes]):
+    """Write an image with the given files in its root directory.
+
+    Each file is at most 7 blocks so it only needs direct zones.
+    """
+    block_size = minix.BLOCK_SIZE
+    inode_count = minix.INODES_PER_BLOCK
+    inode_map_block = 2
+    zone_map_block = 3
+    inode_table_block = 4
+    root_zone = 5
+    first_zone = root_zone
+
+    # The i-nodes, data zones and directory entries after the root.
+    inodes = []
+    zones = {}
+    entries = [(minix.ROOT_INODE, b"."), (minix.ROOT_INODE, b"..")]
+    next_zone = root_zone + 1
+    for inode_number, (name, content) in enumerate(files.items(), start=2):
+        file_zones = []
+        for offset in range(0, len(content), block_size):
+            zones[next_zone] = content[offset:offset + block_size]
+            file_zones.append(next_zone)
+            next_zone += 1
+        inodes.append((inode_number, minix.ModeFlags.REGULAR | 0o644,
+                       len(content), 1, file_zones))
+        entries.append((inode_number, name.encode("utf-8")))
+
+    zones[root_zone] = b"".join(
+        struct.pack("<H14s", number, name) for number, name in entries)
+    inodes.insert(0, (minix.ROOT_INODE, minix.ModeFlags.DIRECTORY | 0o755,
+                      len(zones[root_zone]), 2, [root_zone]))
+
+    zone_count = next_zone
+    image = bytearray(zone_count * block_size)
+    struct.pack_into(
+        "<HHHHHHLHH", image, minix.SuperBlock.OFFSET,
+        inode_count, zone_count, 1, 1, first_zone, 0, 7 * block_size,
+        minix.SuperBlock.MAGIC, 1)
+
+    # Bit 0 of both bit maps is reserved.
+    image[inode_map_block * block_size] = (1 << (len(inodes) + 1)) - 1
+    for zone in range(zone_count - first_zone + 1):
+        image[zone_map_block * block_size + zone // 8] |= 1 << (zone % 8)
+
+    for number, mode, size, links, file_zones in inodes:
+        struct.pack_into(
+            minix.INODE_FORMAT, image,
+            inode_table_block * block_size + (number - 1) * minix.INODE_SIZE,
+            mode, 0, size, 0, 0, links,
+            *(file_zones + [0] * (7 - len(file_zones))), 0, 0)
+
+    for zone, content in zones.items():
+        image[zone * block_size:zone * block_size + len(content)] = content
+
+    path.write_bytes(image)
+
+
+class ServerTests(unittest.TestCase):
+    FILES = {
+        "welcome": b"Hello\n",
+        # This spans several blocks so a single read covers several zones.
+        "books": b"OS: Design and Implementation\n" * 100,
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        image_path = pathlib.Path(directory.name) / "minixfs.raw"
+        _write_image(image_path, self.FILES)
+
+        fs = minix_p9fs.MinixFs(image_path)
+        self.addCleanup(fs.close)
+
+        self.server = minix_p9fs.ThreadedServer(listen=("127.0.0.1", 0))
+        self.addCleanup(self.server.sock.close)
+        self.server.mount(fs)
+
+    def _connect(self) -> py9p.Client:
+        server_end, client_end = socket.socketpair()
+        thread = self.server.serve_connection(server_end)
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(client_end.close)
+        return py9p.Client(client_end, py9p.Credentials("root"))
+
+    def test_read_file(self):
+        client = self._connect()
+        for name, content in self.FILES.items():
+            client.open("/" + name)
+            data = b""
+            while chunk := client.read(4096):
+                data += chunk
+            client.close()
+            self.assertEqual(data, content)
+
+    def test_concurrent_clients(self):
+        clients = [self._connect() for _ in range(3)]
+        for client in clients:
+            client.open("/books")
+        for client in clients:
+            self.assertEqual(client.read(30), self.FILES["books"][:30])
+            client.close()
+
+    def test_connection_closed(self):
+        server_end, client_end = socket.socketpair()
+        thread = self.server.serve_connection(server_end)
+        client_end.close()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertNotIn(server_end, self.server.activesocks)
+
+
+if __name__ == "__main__":
+    unittest.main()
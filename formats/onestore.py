@@ -13,10 +13,12 @@ abandoned.
 # construct package (https://github.com/construct/construct/) before.
 
 import argparse
+import collections.abc
 import dataclasses
 import enum
 import io
 import logging
+import mmap
 import struct
 import typing
 import uuid
@@ -80,6 +82,19 @@ class ExtendedGuid:
     def __repr__(self):
         return f"{{{self.guid}}}, n={self.n}"
 
+    def __eq__(self, other):
+        if not isinstance(other, ExtendedGuid):
+            return NotImplemented
+        return self.guid == other.guid and self.n == other.n
+
+    def __hash__(self):
+        return hash((self.guid, self.n))
+
+    @property
+    def is_zero(self) -> bool:
+        """True if this is the all zero ExtendedGuid, which means none."""
+        return self.guid.int == 0 and self.n == 0
+
 
 @dataclasses.dataclass
 class CompactID:
@@ -161,6 +176,52 @@ class FileChunkReference:
         return io.BytesIO(reader.read(self.size))
 
 
+class BufferReader:
+    """A readable stream over a region of a buffer, such as a memory map.
+
+    Unlike io.BytesIO this doesn't copy the region, so it is cheap to create
+    one for each fragment and only the bytes that are read are copied.
+    """
+
+    def __init__(self, buffer: memoryview, start: int = 0,
+                 end: int | None = None):
+        self.buffer = buffer
+        self.position = start
+        self.end = len(buffer) if end is None else end
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = self.end - self.position
+        start = self.position
+        self.position = min(start + size, self.end)
+        return bytes(self.buffer[start:self.position])
+
+    def unpack(self, format_string: str) -> tuple:
+        """Unpack the values at the current position and advance past them.
+
+        This avoids copying the bytes out of the buffer first.
+        """
+        size = struct.calcsize(format_string)
+        if self.position + size > self.end:
+            raise struct.error(
+                f'unpack requires {size} bytes but only '
+                f'{self.end - self.position} remain')
+        values = struct.unpack_from(format_string, self.buffer, self.position)
+        self.position += size
+        return values
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.end
+        self.position = offset
+        return self.position
+
+
 class FileChunkReference64x32(FileChunkReference):
     """File chunk reference that is 64-bits and 32-bits.
 
@@ -375,7 +436,10 @@ class FileNodeHeader:
         InvalidFileNode
             If this is not a file node (the 432-bit value is all zeros).
         """
-        raw_header, = struct.unpack('<I', reader.read(4))
+        if isinstance(reader, BufferReader):
+            raw_header, = reader.unpack('<I')
+        else:
+            raw_header, = struct.unpack('<I', reader.read(4))
         if raw_header == 0 or raw_header & 0x3FF == 0:
             raise InvalidFileNode("Not a a file node.")
         if raw_header & 0x3FF == 255:
@@ -403,6 +467,9 @@ class FileNode:
     children: list['FileNode'] = dataclasses.field(repr=False)
     """The child nodes."""
 
+    offset: int | None = dataclasses.field(default=None, repr=False)
+    """The offset from the start of the file to the file node."""
+
 
 @dataclasses.dataclass
 class GlobalIdTableStart2FND:
@@ -1307,8 +1374,11 @@ def read_file_node_chunk_reference(
     """
     format_string = '<' + node_header.stp_format.to_struct_format() + \
         node_header.cb_format.to_struct_format()
-    size = struct.calcsize(format_string)
-    stp, cb = struct.unpack(format_string, reader.read(size))
+    if isinstance(reader, BufferReader):
+        stp, cb = reader.unpack(format_string)
+    else:
+        size = struct.calcsize(format_string)
+        stp, cb = struct.unpack(format_string, reader.read(size))
 
     # To uncompress multiple value by 8.
     if node_header.stp_format in (FileNodeHeader.StpFormat.COMPRESSED_2_BYTES,
@@ -1332,6 +1402,8 @@ def read_file_node(reader, file_reader) -> FileNode:
     file_reader
         This is the reader over the entire file, this required for reading
         file chunk references which are outside the current chunk.
+        If this is a OneStoreFile then the file node lists that are
+        referenced are only read when the children are first accessed.
 
     Raises
     ------
@@ -1365,7 +1437,7 @@ def read_file_node(reader, file_reader) -> FileNode:
             odcs_default = int.from_bytes(reader.read(2), byteorder='little')
             manifest = RevisionManifestStart6FND(
                 guid, dependant_guid, revision_role, odcs_default,
-                ),
+                )
 
             if header.is_file_node(RevisionManifestStart7FND):
                 context_id = ExtendedGuid(reader.read(20))
@@ -1492,6 +1564,9 @@ def read_file_node(reader, file_reader) -> FileNode:
             message = f"Situation not encountered yet: {header.type_name}"
             raise ValueError(message)
 
+        if isinstance(file_reader, OneStoreFile):
+            return FileNode(header, data, file_reader.lazy_file_list(reference))
+
         children = []
         current_position = file_reader.tell()
         children.extend(read_file_List(file_reader, reference))
@@ -1565,10 +1640,13 @@ def read_fragment(
         chunk_reader.read(struct.calcsize("<QII"))
         file_nodes = []
         while True:
+            offset = reference.offset + chunk_reader.tell()
             try:
-                file_nodes.append(read_file_node(chunk_reader, reader))
+                node = read_file_node(chunk_reader, reader)
             except InvalidFileNode:
                 break
+            node.offset = offset
+            file_nodes.append(node)
 
         next_fragment = next_fragment if next_fragment.size > 0 else None
         return file_nodes, next_fragment
@@ -1584,13 +1662,443 @@ def read_file_List(reader, reference: FileChunkReference) -> list:
     return file_nodes
 
 
+class LazyFileNodeList(collections.abc.Sequence):
+    """A file node list which is only read when it is first accessed.
+
+    This is used for the children of file nodes that reference another file
+    node list, so the whole tree isn't read up-front.
+    """
+
+    def __init__(self, store: 'OneStoreFile', reference: FileChunkReference):
+        self.store = store
+        self.reference = reference
+        self._nodes = None
+
+    @property
+    def is_loaded(self) -> bool:
+        """True if the file node list has been read."""
+        return self._nodes is not None
+
+    @property
+    def nodes(self) -> list[FileNode]:
+        if self._nodes is None:
+            self._nodes = self.store.read_file_list(self.reference)
+        return self._nodes
+
+    def __getitem__(self, index):
+        return self.nodes[index]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __repr__(self):
+        if self._nodes is None:
+            return f'{self.__class__.__name__}({self.reference!r})'
+        return repr(self._nodes)
+
+
+class OneStoreFile:
+    """A OneNote revision store file that is read through a memory map.
+
+    Compared to read_file_List() on a file object this doesn't copy each
+    fragment, decodes the structures at their offsets within the map and
+    only reads the file node lists referenced by a file node when its
+    children are accessed. The object property sets are cached by their
+    offset.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self.buffer = memoryview(self._mmap)
+        self.header = Header(BufferReader(self.buffer, 0, 1024))
+        self._property_sets = {}
+        self._root_file_nodes = self.lazy_file_list(
+            self.header.file_node_list_root_reference)
+
+    def close(self):
+        self.buffer.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def root_file_nodes(self) -> LazyFileNodeList:
+        """The file nodes in the root file node list."""
+        return self._root_file_nodes
+
+    def lazy_file_list(self, reference: FileChunkReference) -> LazyFileNodeList:
+        """Return the file node list which will be read on first access."""
+        return LazyFileNodeList(self, reference)
+
+    def read_fragment(
+            self,
+            reference: FileChunkReference,
+            ) -> tuple[list, FileChunkReference | None]:
+        """Read the file nodes from a FileNodeListFragment.
+
+        See read_fragment() for the description of the format.
+        """
+        logger = LOG.getChild("FileNodeListFragment")
+        logger.info(
+            "Reading fragment at offset=%-8d, size=%d",
+            reference.offset,
+            reference.size,
+            )
+
+        if reference.end > len(self.buffer):
+            raise ValueError(
+                'The FileNodeListFragment extends past the end of the file.')
+
+        magic, file_node_list_id, fragment_sequence_count = \
+            struct.unpack_from("<QII", self.buffer, reference.offset)
+
+        if magic != 0xA4567AB1F5F7F4C4:
+            raise ValueError(
+                'FileNodeListHeader did not start with the magic number.')
+
+        if file_node_list_id < 0x00000010:
+            raise ValueError(
+                'FileNodeListID must be equal to or greater than 0x00000010.')
+
+        next_offset, next_size, footer = struct.unpack_from(
+            "<QIQ", self.buffer, reference.end - 20)
+        if footer != 0x8BC215C38233BA4B:
+            raise ValueError(
+                'The FileNodeListFragment did not end with the magic number '
+                'for the footer.')
+
+        logger.debug("Fragment Sequence Count: %d", fragment_sequence_count)
+
+        chunk_reader = BufferReader(
+            self.buffer,
+            reference.offset + struct.calcsize("<QII"),
+            reference.end,
+            )
+        file_nodes = []
+        while True:
+            offset = chunk_reader.tell()
+            try:
+                node = read_file_node(chunk_reader, self)
+            except (InvalidFileNode, struct.error):
+                break
+            node.offset = offset
+            file_nodes.append(node)
+
+        if next_size > 0:
+            return file_nodes, FileChunkReference(next_offset, next_size)
+        return file_nodes, None
+
+    def read_file_list(self, reference: FileChunkReference) -> list[FileNode]:
+        """Read the file nodes from every fragment of the file node list."""
+        file_nodes = []
+        next_fragment = reference
+        while next_fragment:
+            nodes_from_fragment, next_fragment = self.read_fragment(
+                next_fragment)
+            file_nodes.extend(nodes_from_fragment)
+        return file_nodes
+
+    def read_chunk(self, reference: FileChunkReference) -> BufferReader:
+        """Return a reader over the file chunk specified by the reference."""
+        return BufferReader(self.buffer, reference.offset, reference.end)
+
+    def property_set(
+            self,
+            reference: FileChunkReference,
+            ) -> ObjectSpaceObjectPropSet:
+        """Decode the ObjectSpaceObjectPropSet at the given reference.
+
+        This is cached by the offset as objects with more than one
+        declaration refer to the same property set.
+        """
+        property_set = self._property_sets.get(reference.offset)
+        if property_set is None:
+            property_set = ObjectSpaceObjectPropSet.decode(
+                self.read_chunk(reference))
+            self._property_sets[reference.offset] = property_set
+        return property_set
+
+    def object_spaces(self):
+        """Yield the reference to the manifest list of each object space.
+
+        This only reads the root file node list.
+        """
+        for node in self.root_file_nodes:
+            if isinstance(node.data, ObjectSpaceManifestListReferenceFND):
+                yield node.data
+
+
 def find_types(nodes: list, file_node_type: type):
-    next_nodes = nodes[:]
-    while next_nodes:
-        node = next_nodes.pop()
+    """Yield the data of the file nodes of the given type in file order.
+
+    This walks the whole tree, use OneStoreIndex when querying more than
+    once.
+    """
+    iterators = [iter(nodes)]
+    while iterators:
+        node = next(iterators[-1], None)
+        if node is None:
+            iterators.pop()
+            continue
         if isinstance(node.data, file_node_type):
             yield node.data
-        next_nodes.extend(node.children)
+        if node.header.base_type == 2:
+            iterators.append(iter(node.children))
+
+
+OBJECT_DECLARATION_TYPES = (
+    ObjectDeclaration2RefCountFND,
+    ReadOnlyObjectDeclaration2RefCountFND,
+    ReadOnlyObjectDeclaration2LargeRefCountFND,
+)
+"""The file nodes that declare an object and have an ObjectDeclaration2Body.
+"""
+
+REVISION_MANIFEST_START_TYPES = (
+    RevisionManifestStart4FND,
+    RevisionManifestStart6FND,
+    RevisionManifestStart7FND,
+)
+"""The file nodes that start a revision manifest."""
+
+
+def object_declaration_body(data) -> ObjectDeclaration2Body:
+    """Return the body of an object declaration file node."""
+    if isinstance(data, (ReadOnlyObjectDeclaration2RefCountFND,
+                         ReadOnlyObjectDeclaration2LargeRefCountFND)):
+        return data.base.body
+    return data.body
+
+
+def jcid_value(body: ObjectDeclaration2Body) -> int:
+    """Return the JCID of the object declaration as an unsigned integer."""
+    return int.from_bytes(body.type_id, byteorder='little')
+
+
+@dataclasses.dataclass
+class Revision:
+    """A revision from a revision manifest list and the objects it declares.
+
+    See [MS-ONESTORE] Section 2.1.8.
+    """
+
+    revision_id: ExtendedGuid
+    """Specifies the identity of the revision."""
+
+    dependent_revision_id: ExtendedGuid | None
+    """The identity of the revision this revision depends on if any."""
+
+    object_space_id: ExtendedGuid | None
+    """The identity of the object space containing this revision."""
+
+    offset: int | None
+    """The offset of the file node that starts the revision manifest."""
+
+    global_ids: dict[int, Guid] = dataclasses.field(default_factory=dict)
+    """The global identification table of the revision manifest.
+
+    The object groups of the revision have their own global identification
+    table which resolves the CompactIDs of the objects declared in them.
+    """
+
+    object_ids: set[ExtendedGuid] = dataclasses.field(default_factory=set)
+    """The identity of the objects declared by this revision."""
+
+    root_objects: dict[int, ExtendedGuid] = dataclasses.field(
+        default_factory=dict)
+    """The identity of the root object of this revision by its role."""
+
+    def resolve(self, compact_id: CompactID) -> ExtendedGuid:
+        """Resolve the CompactID to an ExtendedGuid using this revision's
+        global identification table.
+
+        Raises
+        ------
+        KeyError
+            If the index is not in the global identification table.
+        """
+        return resolve_compact_id(self.global_ids, compact_id)
+
+
+def resolve_compact_id(global_ids: dict[int, Guid],
+                       compact_id: CompactID) -> ExtendedGuid:
+    """Resolve the CompactID to an ExtendedGuid using the given global
+    identification table.
+
+    Raises
+    ------
+    KeyError
+        If the index is not in the global identification table.
+    """
+    guid = global_ids[compact_id.guid_index]
+    return ExtendedGuid(
+        guid.raw + compact_id.n.to_bytes(4, byteorder='little'))
+
+
+class OneStoreIndex:
+    """An index over the file nodes of a revision store file.
+
+    This is built by walking the file nodes once, after which the file nodes
+    can be looked up by type, the objects by their identity or JCID and the
+    revisions by their identity without walking the tree again.
+    """
+
+    def __init__(self):
+        self.nodes: dict[int, FileNode] = {}
+        """The file nodes by their offset."""
+
+        self.offsets_by_type: dict[int, list[int]] = \
+            collections.defaultdict(list)
+        """The offsets of the file nodes by the file node ID (type)."""
+
+        self.offsets_by_object_id: dict[ExtendedGuid, list[int]] = \
+            collections.defaultdict(list)
+        """The offsets of the declarations of each object in file order."""
+
+        self.offsets_by_jcid: dict[int, list[int]] = \
+            collections.defaultdict(list)
+        """The offsets of the object declarations by their JCID."""
+
+        self.revisions: dict[ExtendedGuid, Revision] = {}
+        """The revisions by their identity."""
+
+    @classmethod
+    def build(cls, file_nodes) -> typing.Self:
+        """Build the index from the root file node list.
+
+        This reads every file node list, for a OneStoreFile this is
+        store.root_file_nodes.
+        """
+        index = cls()
+        index._add_list(file_nodes, None, None, {})
+        return index
+
+    def _add_list(self, file_nodes, object_space_id: ExtendedGuid | None,
+                  revision: Revision | None, global_ids: dict[int, Guid]):
+        """Add the file nodes of a file node list and of its children.
+
+        global_ids is the global identification table in scope from the
+        enclosing list. A list that starts its own table (for example an
+        object group) resolves the CompactIDs of its objects against it and
+        passes it down to its children, without changing the enclosing table.
+        """
+        # Whether the revision was started by this list, in which case its
+        # global identification table is the one of the revision.
+        owns_revision = False
+        # Whether global_ids was started by this list rather than inherited.
+        owns_global_ids = False
+        for node in file_nodes:
+            data = node.data
+            if node.offset is not None:
+                self.nodes[node.offset] = node
+                self.offsets_by_type[node.header.file_node_id].append(
+                    node.offset)
+
+            if isinstance(data, ObjectSpaceManifestListReferenceFND):
+                object_space_id = data.gosid
+            elif isinstance(data, REVISION_MANIFEST_START_TYPES):
+                start = data.base if isinstance(
+                    data, RevisionManifestStart7FND) else data
+                dependent = start.revision_id_dependent
+                revision = Revision(
+                    start.revision_id,
+                    None if dependent.is_zero else dependent,
+                    object_space_id,
+                    node.offset,
+                )
+                self.revisions[revision.revision_id] = revision
+                owns_revision = True
+                global_ids = revision.global_ids
+                owns_global_ids = True
+            elif node.header.file_node_id == 0x01C:  # RevisionManifestEndFND
+                revision = None
+            elif revision is None:
+                pass
+            elif isinstance(data, GlobalIdTableStart2FND):
+                global_ids = {}
+                owns_global_ids = True
+                if owns_revision:
+                    revision.global_ids = global_ids
+            elif isinstance(data, GlobalIdTableEntryFNDX):
+                if not owns_global_ids:
+                    # The entries are not preceded by the start of a table.
+                    global_ids = dict(global_ids)
+                    owns_global_ids = True
+                global_ids[data.index] = data.guid
+            elif isinstance(data, RootObjectReference3FND):
+                revision.root_objects[data.root_role] = data.object_id_root
+            elif isinstance(data, OBJECT_DECLARATION_TYPES):
+                body = object_declaration_body(data)
+                try:
+                    object_id = resolve_compact_id(global_ids, body.object_id)
+                except KeyError:
+                    LOG.warning("Object at %s has an unknown CompactID %s",
+                                node.offset, body.object_id)
+                else:
+                    revision.object_ids.add(object_id)
+                    self.offsets_by_object_id[object_id].append(node.offset)
+                self.offsets_by_jcid[jcid_value(body)].append(node.offset)
+
+            if node.header.base_type == 2:
+                self._add_list(node.children, object_space_id, revision,
+                               global_ids)
+
+    def nodes_of_type(self, file_node_type: type) -> list[FileNode]:
+        """Return the file nodes of the given type in file order."""
+        return [
+            self.nodes[offset]
+            for offset in self.offsets_by_type.get(
+                file_node_type.FILE_NODE_ID, ())
+        ]
+
+    def object(self, object_id: ExtendedGuid) -> FileNode:
+        """Return the last declaration of the object with the given identity.
+
+        Raises
+        ------
+        KeyError
+            If there is no object with the given identity.
+        """
+        offsets = self.offsets_by_object_id.get(object_id)
+        if not offsets:
+            raise KeyError(object_id)
+        return self.nodes[offsets[-1]]
+
+    def objects_with_jcid(self, jcid: int) -> list[FileNode]:
+        """Return the declarations of the objects with the given JCID."""
+        return [self.nodes[offset]
+                for offset in self.offsets_by_jcid.get(jcid, ())]
+
+    def revision_objects(self, revision_id: ExtendedGuid,
+                         include_dependencies: bool = True,
+                         ) -> set[ExtendedGuid]:
+        """Return the identity of the objects in the given revision.
+
+        If include_dependencies is true then this includes the objects of
+        the revisions it depends on.
+        """
+        object_ids = set()
+        seen = set()
+        next_revision_id = revision_id
+        while next_revision_id is not None and next_revision_id not in seen:
+            seen.add(next_revision_id)
+            revision = self.revisions[next_revision_id]
+            object_ids.update(revision.object_ids)
+            if not include_dependencies:
+                break
+            next_revision_id = revision.dependent_revision_id
+        return object_ids
 
 
 if __name__ == '__main__':
@@ -1602,8 +2110,8 @@ if __name__ == '__main__':
         nargs='?',
         )
     arguments = parser.parse_args()
-    with open(arguments.path, 'rb') as reader:
-        header = Header(reader)
+    with OneStoreFile(arguments.path) as store:
+        header = store.header
 
         # A GUID, as specified by [MS-DTYP], that specifies that the file is a
         # revision store file. MUST be "{109ADD3F-911B-49F5-A5D0-1791EDC8AED8}"
@@ -1617,8 +2125,7 @@ if __name__ == '__main__':
         # Must have one object space manifest root (ObjectSpaceManifestListStartFND)
         # Zero or one FileDataStoreListReference.
 
-        reference = header.file_node_list_root_reference
-        file_nodes = read_file_List(reader, reference)
+        file_nodes = store.root_file_nodes
         for node in file_nodes:
             print(node)
             for child in node.children:
@@ -1629,17 +2136,15 @@ if __name__ == '__main__':
                     else:
                         print(f"        {c}")
 
+        print()
+        index = OneStoreIndex.build(file_nodes)
+        for revision in index.revisions.values():
+            print(f"Revision {revision.revision_id} with "
+                  f"{len(revision.object_ids)} objects")
+
         print()
         # Start decoding a file node.
-        for group_list in find_types(file_nodes, ObjectGroupListReferenceFND):
-            first_node_in_group = group_list.reference
-            object_group_nodes = read_file_List(reader, first_node_in_group)
-            for node in object_group_nodes:
-                if isinstance(node.data, ObjectDeclaration2RefCountFND):
-                    # The reference points to an ObjectSpaceObjectPropSet
-                    # structure.
-                    chunk = node.data.blob_reference.read_chunk(reader)
-                    property_set = ObjectSpaceObjectPropSet.decode(chunk)
-                    print(property_set)
-                else:
-                    print(node)
+        for node in index.nodes_of_type(ObjectDeclaration2RefCountFND):
+            # The reference points to an ObjectSpaceObjectPropSet structure.
+            property_set = store.property_set(node.data.blob_reference)
+            print(property_set)
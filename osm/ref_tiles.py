@@ -1,22 +1,65 @@
-"""Produces a command/shell script to convert PNG to Geo-referenced TIFF.
+"""Geo-reference the PNG tiles for a zoom level as a single raster.
 
-It also produces a command to call out gdal_merge.py which will take the TIFFs
-and create a single TIFF from it and if there are too many TIFFs it will write
-a file containing the list.
+By default, this writes a VRT (GDAL Virtual Format) which references the PNGs
+in place and associates the bounds and coordinate system with them, so they
+can be treated as a single file already. The VRT can be used directly or
+converted to a single GeoTIFF with gdal_translate.
 
-TODO:
-Improve this so it doesn't have to create the TIFF from the PNG so instead
-create a VRT to associate the bounds/coordinate system with the PNGsand treat
-it as a single file already.
+The tiles use the slippy map convention which is a regular grid in Web
+Mercator (EPSG:3857), so that is the coordinate system of the VRT.
+
+Alternatively, with --tiff it produces a command/shell script to convert PNG
+to Geo-referenced TIFF. It also produces a command to call out gdal_merge.py
+which will take the TIFFs and create a single TIFF from it and if there are
+too many TIFFs it will write a file containing the list.
 """
 
 import argparse
 import math
 import os
+import struct
+import sys
+
+# The VRT types live with the other snippets.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "snippets"))
+
+import vrt_parser  # noqa: E402
 
 
 OUTPUT_PATH_TEMPLATE = "{output_path_base}\\{zoom}\\{x}\\{y}.tif"
 
+EARTH_RADIUS = 6378137.0
+"""The radius of the Earth in metres used by Web Mercator."""
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# The bands to create for each PNG colour type and for paletted PNGs the
+# component of the colour table to expand to.
+PNG_COLOUR_TYPE_BANDS = {
+    0: [(vrt_parser.ColourInterpretation.GRAY, 1, None)],
+    2: [
+        (vrt_parser.ColourInterpretation.RED, 1, None),
+        (vrt_parser.ColourInterpretation.GREEN, 2, None),
+        (vrt_parser.ColourInterpretation.BLUE, 3, None),
+    ],
+    3: [
+        (vrt_parser.ColourInterpretation.RED, 1, 1),
+        (vrt_parser.ColourInterpretation.GREEN, 1, 2),
+        (vrt_parser.ColourInterpretation.BLUE, 1, 3),
+        (vrt_parser.ColourInterpretation.ALPHA, 1, 4),
+    ],
+    4: [
+        (vrt_parser.ColourInterpretation.GRAY, 1, None),
+        (vrt_parser.ColourInterpretation.ALPHA, 2, None),
+    ],
+    6: [
+        (vrt_parser.ColourInterpretation.RED, 1, None),
+        (vrt_parser.ColourInterpretation.GREEN, 2, None),
+        (vrt_parser.ColourInterpretation.BLUE, 3, None),
+        (vrt_parser.ColourInterpretation.ALPHA, 4, None),
+    ],
+}
+
 
 def tile_edges(x: int, y: int, zoom: int):
     """Convert from tile indices to WGS84 coordinates."""
@@ -33,6 +76,31 @@ def tile_edges(x: int, y: int, zoom: int):
     return (lon1, lat1, lon2, lat2)
 
 
+def wgs84_to_web_mercator(longitude: float, latitude: float):
+    """Convert from WGS84 coordinates to Web Mercator (EPSG:3857)."""
+    return (
+        EARTH_RADIUS * math.radians(longitude),
+        EARTH_RADIUS * math.log(math.tan(math.pi / 4 + math.radians(latitude) / 2)),
+    )
+
+
+def png_header(path):
+    """Return the width, height and colour type of a PNG.
+
+    This only reads the IHDR chunk which follows the signature.
+    """
+    with open(path, "rb") as reader:
+        header = reader.read(26)
+
+    if not header.startswith(PNG_SIGNATURE) or header[12:16] != b"IHDR":
+        raise ValueError(f"Expected {path} to be a PNG")
+
+    width, height, bit_depth, colour_type = struct.unpack(">IIBB", header[16:26])
+    if bit_depth != 8:
+        raise ValueError(f"Only 8-bit PNGs are supported ({path})")
+    return width, height, colour_type
+
+
 def tiles(base_directory, zoom: int):
     """Return the tiles at the given zoom in the base directory.
 
@@ -72,46 +140,104 @@ def convert(base_directory, zoom: int, output_directory) -> list:
     return outputs
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Generate script to use gdal_translate and gdal_merge to "
-        "geo-reference tiles produced from OSM and create a single TIFF from "
-        "them. The script produced calls out to GDAL tools.",
-    )
-    parser.add_argument(
-        "source_tiles",
-        help="The path to the directory containing the tiles as PNGs. "
-        "Since gdal_translate will be called this could be any raster format "
-        "it supports as long as the tiles use slippy map convention of "
-        " zoom/x/y.<ext>.",
-        nargs="?",
-        default="G:\\GeoData\\Generated\\tiles_adelaide_2023",
-    )
-    parser.add_argument(
-        "--zoom",
-        type=int,
-        help="The zoom level of interest.",
-        default=17,
-        # 12 is a good zoom to test for Adelaide as it has 4 tiles (2x2).
-    )
+def build_vrt(base_directory, zoom: int, output_path) -> vrt_parser.Dataset:
+    """Write a VRT that mosaics the tiles at the given zoom.
 
-    parser.add_argument(
-        "--output_directory",
-        help="The path to write out the geo-referenced TIFFs",
-        default="G:\\GeoData\\Generated\\tiles_adelaide_tiff",
-    )
+    The tiles are referenced in place, relative to the VRT where possible,
+    so no intermediate files are written.
 
-    arguments = parser.parse_args()
-    outputs = convert(
-        arguments.source_tiles, arguments.zoom, arguments.output_directory
+    Returns the dataset that was written.
+    """
+    tile_list = list(tiles(base_directory, zoom))
+    if not tile_list:
+        raise ValueError(f"No tiles found for zoom level {zoom}")
+
+    # All the tiles are expected to be the same size and colour type, so only
+    # the first is read.
+    tile_width, tile_height, colour_type = png_header(tile_list[0][0])
+    band_layout = PNG_COLOUR_TYPE_BANDS.get(colour_type)
+    if band_layout is None:
+        raise ValueError(f"Unsupported PNG colour type: {colour_type}")
+
+    min_x = min(x for _, (x, _) in tile_list)
+    max_x = max(x for _, (x, _) in tile_list)
+    min_y = min(y for _, (_, y) in tile_list)
+    max_y = max(y for _, (_, y) in tile_list)
+
+    # The upper-left corner of the top-left tile and lower-right corner of
+    # the bottom-right tile.
+    west, north, _, _ = tile_edges(min_x, min_y, zoom)
+    _, _, east, south = tile_edges(max_x, max_y, zoom)
+    left, top = wgs84_to_web_mercator(west, north)
+    right, bottom = wgs84_to_web_mercator(east, south)
+
+    width = (max_x - min_x + 1) * tile_width
+    height = (max_y - min_y + 1) * tile_height
+    dataset = vrt_parser.Dataset.create(
+        width,
+        height,
+        srs="EPSG:3857",
+        geo_transform=[
+            left,
+            (right - left) / width,
+            0.0,
+            top,
+            0.0,
+            (bottom - top) / height,
+        ],
     )
 
+    output_directory = os.path.dirname(os.path.abspath(output_path))
+    source_rectangle = vrt_parser.Rectangle(0, 0, tile_width, tile_height)
+    properties = {
+        "RasterXSize": str(tile_width),
+        "RasterYSize": str(tile_height),
+        "DataType": "Byte",
+        "BlockXSize": str(tile_width),
+        "BlockYSize": "1",
+    }
+
+    def _source_path(path):
+        try:
+            return os.path.relpath(path, output_directory), True
+        except ValueError:
+            # The tile is on a different drive to the VRT.
+            return os.path.abspath(path), False
+
+    bands = [
+        (dataset.add_band("Byte", interpretation), source_band, component)
+        for interpretation, source_band, component in band_layout
+    ]
+    for path, (x, y) in sorted(tile_list, key=lambda tile: tile[1]):
+        filename, relative = _source_path(path)
+        destination_rectangle = vrt_parser.Rectangle(
+            (x - min_x) * tile_width,
+            (y - min_y) * tile_height,
+            tile_width,
+            tile_height,
+        )
+        for band, source_band, component in bands:
+            band.add_source(
+                filename,
+                source_band,
+                source_rectangle,
+                destination_rectangle,
+                relative_to_vrt=relative,
+                properties=properties,
+                colour_table_component=component,
+            )
+
+    dataset.write(output_path)
+    return dataset
+
+
+def print_merge_command(arguments, outputs):
+    """Print the command to merge the geo-referenced TIFFs into one."""
     # Another way to do the following is:
     # python -c "__import__('pkg_resources').run_script('GDAL', 'gdal_merge.py')"
     # However, that may be short-lived as pkg_resources is deprecated.
     #
-    # Alternatively, use gdalbuildvrt to create a VRT that references each tile
-    # and then use gdal_translate on the resulting VRT.
+    # The default of writing a VRT with build_vrt() avoids this entirely.
 
     merge_command = [
         r"C:\Users\Donno\.conda\envs\geo_env\python.exe",
@@ -119,7 +245,7 @@ if __name__ == "__main__":
         "-o",
         os.path.join(
             arguments.output_directory,
-            "adelaide_{zoom}.tif".format(zoom=arguments.zoom),
+            "{name}_{zoom}.tif".format(name=arguments.name, zoom=arguments.zoom),
         ),
     ]
 
@@ -137,3 +263,70 @@ if __name__ == "__main__":
         merge_command.extend(outputs)
 
     print(" ".join(merge_command))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Geo-reference tiles produced from OSM as a single VRT or "
+        "generate script to use gdal_translate and gdal_merge to create a "
+        "single TIFF from them. The script produced calls out to GDAL tools.",
+    )
+    parser.add_argument(
+        "source_tiles",
+        help="The path to the directory containing the tiles as PNGs. "
+        "Since gdal_translate will be called this could be any raster format "
+        "it supports as long as the tiles use slippy map convention of "
+        " zoom/x/y.<ext>.",
+        nargs="?",
+        default="G:\\GeoData\\Generated\\tiles_adelaide_2023",
+    )
+    parser.add_argument(
+        "--zoom",
+        type=int,
+        help="The zoom level of interest.",
+        default=17,
+        # 12 is a good zoom to test for Adelaide as it has 4 tiles (2x2).
+    )
+
+    parser.add_argument(
+        "--output_directory",
+        help="The path to write out the VRT or the geo-referenced TIFFs",
+        default="G:\\GeoData\\Generated\\tiles_adelaide_tiff",
+    )
+    parser.add_argument(
+        "--name",
+        help="The name of the VRT or merged TIFF, which is suffixed with the "
+        "zoom level. Defaults to the name of the source tiles directory.",
+    )
+    parser.add_argument(
+        "--tiff",
+        action="store_true",
+        help="Generate a script to convert each tile to a geo-referenced TIFF "
+        "and merge them rather than writing a VRT.",
+    )
+
+    arguments = parser.parse_args()
+    if not arguments.name:
+        arguments.name = os.path.basename(
+            os.path.normpath(os.path.abspath(arguments.source_tiles))
+        )
+
+    if not arguments.tiff:
+        vrt_path = os.path.join(
+            arguments.output_directory,
+            "{name}_{zoom}.vrt".format(name=arguments.name, zoom=arguments.zoom),
+        )
+        os.makedirs(arguments.output_directory, exist_ok=True)
+        build_vrt(arguments.source_tiles, arguments.zoom, vrt_path)
+        print(
+            "gdal_translate "
+            + vrt_path
+            + " "
+            + os.path.splitext(vrt_path)[0]
+            + ".tif"
+        )
+    else:
+        outputs = convert(
+            arguments.source_tiles, arguments.zoom, arguments.output_directory
+        )
+        print_merge_command(arguments, outputs)
@@ -0,0 +1,346 @@
+"""Scan a directory of Portable Executables into a SQLite database.
+
+The headers, sections (with their entropy), imports, exports and resources of
+each executable are written to a table per entity, so questions such as
+"which binaries import X" can be answered across a large collection of files
+without parsing them again.
+
+The files are parsed across a pool of processes. The size, modification time
+and SHA-256 of each file is recorded, so a file which is unchanged is skipped
+when the directory is scanned again. Files that can't be parsed are recorded
+with the error and the scan carries on.
+
+LICENSE      : The MIT License (see LICENSE.txt for details)
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import math
+import os
+import pathlib
+import sqlite3
+
+from peparser3 import PEFile
+
+DEFAULT_SUFFIXES = {'.exe', '.dll', '.sys', '.ocx', '.cpl', '.drv', '.scr',
+                    '.efi', '.mui', '.pyd'}
+"""The suffixes of the files that are scanned by default."""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT,
+    machine INTEGER,
+    signature TEXT,
+    time_date_stamp INTEGER,
+    characteristics INTEGER,
+    entry_point INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS sections (
+    path TEXT,
+    name TEXT,
+    virtual_address INTEGER,
+    virtual_size INTEGER,
+    rawdata_size INTEGER,
+    characteristics INTEGER,
+    entropy REAL
+);
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT,
+    library TEXT,
+    function TEXT,
+    hint INTEGER,
+    ordinal INTEGER
+);
+CREATE TABLE IF NOT EXISTS exports (
+    path TEXT,
+    ordinal INTEGER,
+    name TEXT,
+    address INTEGER,
+    forwarder TEXT
+);
+CREATE TABLE IF NOT EXISTS resources (
+    path TEXT,
+    type TEXT,
+    name TEXT,
+    language TEXT,
+    size INTEGER,
+    code_page INTEGER
+);
+CREATE INDEX IF NOT EXISTS sections_path ON sections(path);
+CREATE INDEX IF NOT EXISTS imports_path ON imports(path);
+CREATE INDEX IF NOT EXISTS imports_function ON imports(function COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS imports_library ON imports(library COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS exports_path ON exports(path);
+CREATE INDEX IF NOT EXISTS exports_name ON exports(name);
+CREATE INDEX IF NOT EXISTS resources_path ON resources(path);
+"""
+
+ENTITY_TABLES = ('sections', 'imports', 'exports', 'resources')
+
+
+def entropy(data) -> float:
+    """Calculate the Shannon entropy of the data in bits per byte."""
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(
+        count / total * math.log2(count / total)
+        for count in collections.Counter(bytes(data)).values()
+    )
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as reader:
+        while chunk := reader.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_file(path: str, size: int, mtime_ns: int,
+              known_sha256: str | None = None) -> dict:
+    """Parse the executable and return the rows for each table.
+
+    If the hash of the file is the same as known_sha256 then it isn't parsed
+    and only the row for the files table is returned, with 'unchanged' set.
+
+    This is run in the worker processes so it catches any error from reading
+    or parsing the file and records it rather than raising it, so one bad file
+    doesn't stop the scan.
+    """
+    result = {
+        'path': path,
+        'unchanged': False,
+        'file': [path, size, mtime_ns, None] + [None] * 6,
+        'sections': [],
+        'imports': [],
+        'exports': [],
+        'resources': [],
+    }
+
+    try:
+        sha256 = file_sha256(path)
+        result['file'][3] = sha256
+        if sha256 == known_sha256:
+            result['unchanged'] = True
+            return result
+
+        with PEFile(path) as pe:
+            result['file'][4:9] = [
+                pe.machine,
+                pe.signature,
+                pe.time_date_stamp,
+                pe.characteristics,
+                pe.address_of_entry_point,
+            ]
+            result['sections'] = [
+                (path, section.name, section.virtual_address,
+                 section.virtual_size, section.rawdata_size,
+                 section.characteristics,
+                 entropy(pe.section_data(section)))
+                for section in pe.sections
+            ]
+            result['imports'] = [
+                (path, library.name, function.name, function.hint,
+                 function.ordinal)
+                for library in pe.imports()
+                for function in library.functions
+            ]
+            result['exports'] = [
+                (path, function.ordinal, function.name, function.address,
+                 function.forwarder)
+                for function in pe.exports()
+            ]
+            result['resources'] = [
+                (path, str(resource.type), str(resource.name),
+                 str(resource.language), resource.size, resource.code_page)
+                for resource in pe.resources()
+            ]
+    except Exception as error:
+        # Keep what was read before the error, such as the headers.
+        result['file'][9] = f'{type(error).__name__}: {error}'
+
+    return result
+
+
+def find_files(directory: pathlib.Path, suffixes: set[str] | None):
+    """Yield the path, size and modification time of the files to scan.
+
+    If suffixes is None then every file is included.
+    """
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if suffixes is not None and \
+                    os.path.splitext(filename)[1].lower() not in suffixes:
+                continue
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            yield path, stat.st_size, stat.st_mtime_ns
+
+
+def open_database(path) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _write_result(connection: sqlite3.Connection, result: dict):
+    path = result['path']
+    if result['unchanged']:
+        # Only the modification time changed.
+        connection.execute(
+            'UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?',
+            (result['file'][1], result['file'][2], path))
+        return
+
+    for table in ENTITY_TABLES:
+        connection.execute(f'DELETE FROM {table} WHERE path = ?', (path,))
+    connection.execute(
+        'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        result['file'])
+    connection.executemany(
+        'INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?, ?)',
+        result['sections'])
+    connection.executemany(
+        'INSERT INTO imports VALUES (?, ?, ?, ?, ?)', result['imports'])
+    connection.executemany(
+        'INSERT INTO exports VALUES (?, ?, ?, ?, ?)', result['exports'])
+    connection.executemany(
+        'INSERT INTO resources VALUES (?, ?, ?, ?, ?, ?)',
+        result['resources'])
+
+
+def scan(directory: pathlib.Path, database_path: pathlib.Path, *,
+         workers: int | None = None,
+         suffixes: set[str] | None = DEFAULT_SUFFIXES,
+         commit_every: int = 500) -> collections.Counter:
+    """Scan the executables within directory into the database.
+
+    Returns the number of files that were scanned, unchanged, failed and
+    removed.
+
+    Parameters
+    ----------
+    directory
+        The directory to scan recursively.
+    database_path
+        The path to the SQLite database to write to. It is created if it
+        doesn't exist.
+    workers
+        The number of worker processes, by default this is the number of
+        processors.
+    suffixes
+        The suffixes of the files to scan or None to scan every file.
+    commit_every
+        The number of files between each commit of the database.
+    """
+    counts = collections.Counter()
+    connection = open_database(database_path)
+    try:
+        manifest = {
+            path: (size, mtime_ns, sha256)
+            for path, size, mtime_ns, sha256 in connection.execute(
+                'SELECT path, size, mtime_ns, sha256 FROM files')
+        }
+
+        seen = set()
+        tasks = []
+        for path, size, mtime_ns in find_files(directory, suffixes):
+            seen.add(path)
+            known = manifest.get(path)
+            # A file that couldn't be read has no hash and is scanned again.
+            if known is not None and known[2] is not None and \
+                    known[:2] == (size, mtime_ns):
+                counts['unchanged'] += 1
+                continue
+            tasks.append(
+                (path, size, mtime_ns, known[2] if known else None))
+
+        # Remove the files which are no longer present.
+        prefix = os.path.join(os.fspath(directory), '')
+        removed = [
+            path for path in manifest
+            if path.startswith(prefix) and path not in seen
+        ]
+        with connection:
+            for path in removed:
+                for table in ENTITY_TABLES + ('files',):
+                    connection.execute(
+                        f'DELETE FROM {table} WHERE path = ?', (path,))
+        counts['removed'] = len(removed)
+
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = executor.map(scan_file, *zip(*tasks), chunksize=8) \
+                if tasks else ()
+            for index, result in enumerate(results, start=1):
+                _write_result(connection, result)
+                if result['unchanged']:
+                    counts['unchanged'] += 1
+                elif result['file'][9]:
+                    counts['failed'] += 1
+                else:
+                    counts['scanned'] += 1
+                if index % commit_every == 0:
+                    connection.commit()
+        connection.commit()
+    finally:
+        connection.close()
+    return counts
+
+
+def find_importers(database_path: pathlib.Path, function: str,
+                   library: str | None = None) -> list[tuple[str, str]]:
+    """Return the path and library of the files that import the function."""
+    query = ('SELECT DISTINCT path, library FROM imports '
+             'WHERE function = ? COLLATE NOCASE')
+    parameters = [function]
+    if library:
+        query += ' AND library = ? COLLATE NOCASE'
+        parameters.append(library)
+    connection = sqlite3.connect(database_path)
+    try:
+        return connection.execute(query + ' ORDER BY path', parameters
+                                  ).fetchall()
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Scan a directory of executables into a SQLite database.')
+    parser.add_argument('database', type=pathlib.Path,
+                        help='the SQLite database to write to or query')
+    parser.add_argument('directory', type=pathlib.Path, nargs='?',
+                        help='the directory to scan')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='the number of worker processes')
+    parser.add_argument('--all-files', action='store_true',
+                        help='scan every file rather than only those with '
+                        'the typical suffixes for executables')
+    parser.add_argument('--imports', metavar='FUNCTION',
+                        help='list the files that import the function')
+    arguments = parser.parse_args()
+
+    if arguments.directory:
+        counts = scan(
+            arguments.directory.absolute(),
+            arguments.database,
+            workers=arguments.workers,
+            suffixes=None if arguments.all_files else DEFAULT_SUFFIXES,
+        )
+        print(', '.join(f'{count} {name}'
+                        for name, count in sorted(counts.items())))
+
+    if arguments.imports:
+        for path, library in find_importers(arguments.database,
+                                            arguments.imports):
+            print(f'{library:<24} {path}')
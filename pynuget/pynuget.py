@@ -12,18 +12,31 @@ Future ideas for this module is to:
 The original idea of this module was to use Python.NET to load the
 Nuget.Protocol however that involves too much bootstrapping and packages of it
 own.
+
+The client can be pointed at a different service index, such as a local HTTP
+server serving a directory containing an index.json, package indices and
+packages. That is also how the dependency resolver can be tried out without
+going to nuget.org.
 """
 
 # TODO: Rename this to nugetapi as PyNuGet is already a project on PyPi for a
 # NuGet Server. 
 
+import concurrent.futures
+import json
 import zipfile
 import logging
 import os
+import tempfile
+import threading
 import urllib.parse
 import xml.etree.ElementTree as ElementTree
 
 import requests
+import requests.adapters
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+"""The size of the chunks when writing a download to disk."""
 
 
 class HTTPClient:
@@ -37,10 +50,30 @@ class HTTPClient:
     https://learn.microsoft.com/en-us/nuget/api/service-index
     """
 
-    def __init__(self) -> None:
+    def __init__(self, index_uri=None, cache_directory=None,
+                 pool_size=10) -> None:
+        """Create the client.
+
+        If index_uri is given then that is used for the service index instead
+        of the one for nuget.org.
+
+        If cache_directory is given then the package index for each package
+        and the dependencies of each package are cached in that directory.
+
+        The pool_size is the number of connections the session keeps open,
+        this should be at least the number of threads using the client.
+        """
+        if index_uri:
+            self.INDEX_URI = index_uri
         self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.cache_directory = cache_directory
         self._index = None
         self._package_base_uri = None
+        self._lock = threading.Lock()
         self._logger = logging.getLogger('pynuget.client')
 
     def index(self):
@@ -49,14 +82,15 @@ class HTTPClient:
         See https://learn.microsoft.com/en-us/nuget/api/service-index for
         details.
         """
-        if self._index:
-            return self._index
+        with self._lock:
+            if self._index:
+                return self._index
 
-        response = self.session.get(self.INDEX_URI)
-        response.raise_for_status()
-        index = response.json()
-        self._index = index
-        return index
+            response = self.session.get(self.INDEX_URI)
+            response.raise_for_status()
+            index = response.json()
+            self._index = index
+            return index
 
     def package(self, name):
         """Retrieve the index for a given package.
@@ -65,13 +99,51 @@ class HTTPClient:
         https://learn.microsoft.com/en-us/nuget/api/package-base-address-resource
         """
         # TODO: Validate package ID (name)
+        cache_path = self._cache_path('index', name.lower() + '.json')
+        if cache_path and os.path.isfile(cache_path):
+            with open(cache_path, 'r') as reader:
+                return json.load(reader)
+
         self._logger.info('Fetching package: %s', name)
         package_index = urllib.parse.urljoin(self._package_base_address(),
                                             name.lower() + '/index.json')
         response = self.session.get(package_index)
         response.raise_for_status()
+        if cache_path:
+            _write_atomically(cache_path, [response.content])
         return response.json()
 
+    def dependencies(self, name, version, destination_folder):
+        """Return the dependencies of the package for each target framework.
+
+        The package is downloaded if the dependencies are not in the cache.
+
+        The result is a dictionary of target framework to a list of package
+        ID and version range pairs.
+        """
+        cache_path = self._cache_path(
+            'dependencies', f'{name.lower()}.{version.lower()}.json')
+        if cache_path and os.path.isfile(cache_path):
+            with open(cache_path, 'r') as reader:
+                return {
+                    framework: [tuple(dependency) for dependency in group]
+                    for framework, group in json.load(reader).items()
+                }
+
+        package = self.download_package(name, version, destination_folder)
+        groups = dependency_groups_from_nupkg(package)
+        if cache_path:
+            _write_atomically(cache_path, [json.dumps(groups).encode('utf-8')])
+        return groups
+
+    def _cache_path(self, kind, filename):
+        """Return the path in the cache for the given kind of data."""
+        if not self.cache_directory:
+            return None
+        directory = os.path.join(self.cache_directory, kind)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
     def download_package(self, name, version, destination_folder):
         """Download a package with given name and version.
 
@@ -90,12 +162,15 @@ class HTTPClient:
             self._package_base_address(),
             f'{name.lower()}/{version.lower()}/{filename}')
 
-        # TODO: download to temp file then rename.
-        response = requests.get(package, stream=True)
-        with open(target, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk: # filter out keep-alive new chunks
-                    f.write(chunk)
+        os.makedirs(destination_folder, exist_ok=True)
+        with self.session.get(package, stream=True) as response:
+            response.raise_for_status()
+            # This is written to a temporary file then renamed so a partial
+            # download isn't mistaken for the package.
+            _write_atomically(
+                target,
+                response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE),
+            )
         return target
 
     def _package_base_address(self):
@@ -108,13 +183,32 @@ class HTTPClient:
         self._package_base_uri = resource['@id']
         return self._package_base_uri
 
-def dependencies_from_nupkg(path, framework):
-    """Read dependencies from a nupkg.
 
-    framework must be one of the supported frameworks, with examples being:
-    - .NETFramework4.7.2
-    - .NETStandard2.0
-    - net5.0
+def _write_atomically(target, chunks):
+    """Write the chunks to a temporary file then rename it to target."""
+    handle, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(target) or '.',
+        prefix=os.path.basename(target) + '.',
+        suffix='.tmp',
+    )
+    try:
+        with os.fdopen(handle, 'wb') as writer:
+            for chunk in chunks:
+                if chunk:  # filter out keep-alive new chunks
+                    writer.write(chunk)
+        os.replace(temporary_path, target)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def dependency_groups_from_nupkg(path):
+    """Read the dependencies for each target framework from a nupkg.
+
+    The result is a dictionary of target framework to a list of package
+    ID and version range pairs. Dependencies that are not in a group, or in
+    a group without a target framework, apply to every target framework and
+    are under the '' key.
     """
     with zipfile.ZipFile(path, 'r') as archive:
         nuspec_info = next(
@@ -126,44 +220,281 @@ def dependencies_from_nupkg(path, framework):
     namespaces = {
         'ns0': 'http://schemas.microsoft.com/packaging/2013/05/nuspec.xsd',
     }
-    group_path = './/ns0:metadata/ns0:dependencies/ns0:group'
-
-    frameworks_found = []
-    for group in nuspec.getroot().findall(group_path, namespaces):
-        if group.attrib['targetFramework'] == framework:
-            break
-        frameworks_found.append(group.attrib['targetFramework'])
-    else:
+    dependencies_path = './/ns0:metadata/ns0:dependencies'
+
+    def _dependencies(element):
+        return [
+            (dependency.attrib['id'], dependency.attrib.get('version', ''))
+            for dependency in element.findall('ns0:dependency', namespaces)
+        ]
+
+    # This does not honour the exclude property.
+    groups = {}
+    for dependencies in nuspec.getroot().findall(dependencies_path,
+                                                 namespaces):
+        flat = _dependencies(dependencies)
+        if flat:
+            groups[''] = flat
+        for group in dependencies.findall('ns0:group', namespaces):
+            groups[group.attrib.get('targetFramework', '')] = \
+                _dependencies(group)
+    return groups
+
+
+def _dependencies_for_framework(groups, framework):
+    """Return the dependencies for the framework from the groups.
+
+    The dependencies that apply to every framework (the '' key) are used if
+    there is no group for the framework.
+
+    Raises
+    ------
+    ValueError
+        If there are dependency groups but none for the framework.
+    """
+    if not groups:
+        return []
+
+    try:
+        return groups[framework]
+    except KeyError:
+        if '' in groups:
+            return groups['']
         raise ValueError(
             f'Unable to find a match for framework: {framework} out of '
-            f'{", ".join(frameworks_found)}')
+            f'{", ".join(groups)}') from None
 
-    # This does not honour the exclude property.
-    for dependency in group.findall('.//ns0:dependency', namespaces):
-        yield dependency.attrib['id'], dependency.attrib['version']
 
+def dependencies_from_nupkg(path, framework):
+    """Read dependencies from a nupkg.
+
+    framework must be one of the supported frameworks, with examples being:
+    - .NETFramework4.7.2
+    - .NETStandard2.0
+    - net5.0
+    """
+    groups = dependency_groups_from_nupkg(path)
+    yield from _dependencies_for_framework(groups, framework)
+
+
+def parse_version_range(version_range):
+    """Parse a NuGet version range.
+
+    The result is the lower version, whether the lower version is included,
+    the upper version and whether the upper version is included. The
+    versions are None when there is no bound, an empty range has neither.
+
+    See https://learn.microsoft.com/en-us/nuget/concepts/package-versioning
+    """
+    text = version_range.strip()
+    if not text:
+        return None, False, None, False
+
+    if text[0] not in '[(':
+        # A plain version is the minimum version, included.
+        return text, True, None, False
+
+    if text[-1] not in '])':
+        raise ValueError(f'Invalid version range: {version_range}')
+
+    lower_included = text[0] == '['
+    upper_included = text[-1] == ']'
+    bounds = text[1:-1].split(',')
+    if len(bounds) == 1:
+        # An exact version, for example [1.0].
+        version = bounds[0].strip()
+        if not version or not (lower_included and upper_included):
+            raise ValueError(f'Invalid version range: {version_range}')
+        return version, True, version, True
+    if len(bounds) != 2:
+        raise ValueError(f'Invalid version range: {version_range}')
+
+    lower, upper = (bound.strip() or None for bound in bounds)
+    return lower, lower_included, upper, upper_included
+
+
+def minimum_version(version_range):
+    """Return the minimum version from a NuGet version range.
+
+    NuGet picks the lowest version that satisfies the range, for example
+    "[6.6.1, )" and "6.6.1" both result in 6.6.1.
+
+    Raises
+    ------
+    ValueError
+        If the range has no lower bound or excludes it, as the lowest version
+        that satisfies it depends on the versions of the package, see
+        lowest_matching_version().
+    """
+    lower, lower_included, _, _ = parse_version_range(version_range)
+    if lower is None:
+        raise ValueError(
+            f'The version range {version_range} has no lower bound')
+    if not lower_included:
+        raise ValueError(
+            f'The version range {version_range} excludes its lower bound')
+    return lower
 
 
-def fetch_dependencies(client, package):
+def _version_key(version):
+    """Return a key for ordering NuGet versions.
+
+    Pre-release versions are ordered before their release version and
+    build metadata is ignored.
+    """
+    version = version.split('+')[0]
+    release, _, prerelease = version.partition('-')
+    numbers = [int(part) for part in release.split('.')]
+    numbers += [0] * (4 - len(numbers))
+    if not prerelease:
+        return (numbers, 1, [])
+    labels = [
+        (0, int(label), '') if label.isdigit() else (1, 0, label.lower())
+        for label in prerelease.split('.')
+    ]
+    return (numbers, 0, labels)
+
+
+def lowest_matching_version(version_range, versions):
+    """Return the lowest of the versions that satisfies the version range.
+
+    Like NuGet, pre-release versions are only considered if one of the
+    bounds of the range is a pre-release version.
+
+    Raises
+    ------
+    ValueError
+        If none of the versions satisfies the range.
+    """
+    lower, lower_included, upper, upper_included = parse_version_range(
+        version_range)
+
+    allow_prerelease = any('-' in bound for bound in (lower, upper) if bound)
+
+    def _matches(version):
+        key = _version_key(version)
+        if key[1] == 0 and not allow_prerelease:
+            return False
+        if lower is not None:
+            lower_key = _version_key(lower)
+            if key < lower_key or (key == lower_key and not lower_included):
+                return False
+        if upper is not None:
+            upper_key = _version_key(upper)
+            if key > upper_key or (key == upper_key and not upper_included):
+                return False
+        return True
+
+    matching = [version for version in versions if _matches(version)]
+    if not matching:
+        raise ValueError(
+            f'None of the versions satisfies the range {version_range}')
+    return min(matching, key=_version_key)
+
+
+def _resolve_version(client, package_id, version_range):
+    """Return the lowest version of the package that satisfies the range."""
+    try:
+        return minimum_version(version_range)
+    except ValueError:
+        # The lowest version satisfying the range depends on the versions of
+        # the package.
+        versions = client.package(package_id)['versions']
+        return lowest_matching_version(version_range, versions)
+
+
+def resolve_dependencies(client, packages, framework,
+                         destination_folder='downloads', workers=8):
+    """Resolve the dependencies of the packages and their dependencies.
+
+    The dependency graph is walked breadth-first, with each level fetched in
+    parallel using up to the given number of workers. Each package ID and
+    version is only fetched once. A package is only downloaded (to
+    destination_folder) if its dependencies aren't in the client's cache.
+
+    Parameters
+    ----------
+    client
+        The client (HTTPClient) for fetching the packages.
+    packages
+        A list of the package ID and version pairs to start from.
+    framework
+        The target framework to use the dependencies of, for example
+        .NETFramework4.7.2 or net5.0.
+    destination_folder
+        The folder to download the packages to.
+    workers
+        The maximum number of packages to fetch at the same time.
+
+    Returns
+    -------
+    dict
+        A dictionary where the key is the package ID and version (both lower
+        case) and the value is the list of the IDs and versions it depends
+        on. This includes the given packages.
+    """
+    def _fetch(package):
+        package_id, package_version = package
+        groups = client.dependencies(
+            package_id, package_version, destination_folder)
+        return [
+            (depend_id.lower(),
+             _resolve_version(client, depend_id, depend_version).lower())
+            for depend_id, depend_version in _dependencies_for_framework(
+                groups, framework)
+        ]
+
+    graph = {}
+    frontier = list(dict.fromkeys(
+        (package_id.lower(), version.lower())
+        for package_id, version in packages))
+    seen = set(frontier)
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        while frontier:
+            next_frontier = []
+            for package, dependencies in zip(
+                    frontier, executor.map(_fetch, frontier)):
+                graph[package] = dependencies
+                for depend in dependencies:
+                    if depend not in seen:
+                        seen.add(depend)
+                        next_frontier.append(depend)
+            frontier = next_frontier
+
+    return graph
+
+
+def fetch_dependencies(client, package, framework='.NETFramework4.7.2',
+                       destination_folder='downloads', workers=8):
     """Download the dependencies for the package and their dependencies.
+
+    The package is the path to a nupkg that has already been downloaded.
+
+    Returns the paths to the packages downloaded for the dependencies.
     """
-    packages = [package]
-
-    while packages:
-        package = packages.pop()
-        for depend in dependencies_from_nupkg(package,
-                                              framework='.NETFramework4.7.2'):
-            depend_id, depend_version = depend
-            packages.append(
-                client.download_package(depend_id, depend_version, 'downloads')
-            )
+    dependencies = [
+        (depend_id, _resolve_version(client, depend_id, depend_version))
+        for depend_id, depend_version in dependencies_from_nupkg(
+            package, framework=framework)
+    ]
+    graph = resolve_dependencies(client, dependencies, framework,
+                                 destination_folder, workers)
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(
+            lambda package: client.download_package(
+                package[0], package[1], destination_folder),
+            graph,
+        ))
+
 
 if __name__ == '__main__':
     # This module is under development.
     #
     # At some point it might offer a CLI to allow download and extract.
     logging.basicConfig(level=logging.INFO)
-    client = HTTPClient()
+    client = HTTPClient(cache_directory='cache')
     #print(client.package('NuGet.Protocol'))
     package = client.download_package('NuGet.Protocol', '6.6.1', 'downloads')
     fetch_dependencies(client, package)
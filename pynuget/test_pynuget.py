@@ -0,0 +1,138 @@
+"""Tests the dependency resolver against a local HTTP server.
+
+The server serves a directory laid out like a NuGet server: a service index
+(index.json), the index of each package and the packages themselves.
+"""
+
+import functools
+import http.server
+import json
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+
+import pynuget
+
+NUSPEC_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://schemas.microsoft.com/packaging/2013/05/nuspec.xsd">
+  <metadata>
+    <id>{id}</id>
+    <version>{version}</version>
+    <dependencies>{dependencies}</dependencies>
+  </metadata>
+</package>
+"""
+
+
+class LocalServerTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        handler = functools.partial(
+            _QuietHandler, directory=self.directory.name)
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.base_uri = 'http://127.0.0.1:%d/' % self.server.server_port
+        self._write('index.json', json.dumps({
+            'version': '3.0.0',
+            'resources': [{
+                '@id': self.base_uri + 'flatcontainer/',
+                '@type': 'PackageBaseAddress/3.0.0',
+            }],
+        }))
+
+    def _write(self, path, content):
+        path = os.path.join(self.directory.name, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as writer:
+            writer.write(content)
+
+    def _add_package(self, package_id, versions, dependencies):
+        """Add the versions of a package, each with the same dependencies.
+
+        The dependencies are the XML within the <dependencies> element.
+        """
+        name = package_id.lower()
+        self._write(f'flatcontainer/{name}/index.json',
+                    json.dumps({'versions': versions}))
+        for version in versions:
+            path = os.path.join(self.directory.name, 'flatcontainer', name,
+                                version, f'{name}.{version}.nupkg')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with zipfile.ZipFile(path, 'w') as archive:
+                archive.writestr(f'{package_id}.nuspec', NUSPEC_TEMPLATE.format(
+                    id=package_id, version=version,
+                    dependencies=dependencies))
+
+    def test_resolve_dependencies(self):
+        self._add_package('App', ['1.0.0'], """
+            <group targetFramework="net5.0">
+              <dependency id="Logging" version="[2.0.0, )" />
+              <dependency id="Json" version="(1.0.0, )" />
+            </group>
+            <group targetFramework=".NETFramework4.7.2">
+              <dependency id="Legacy" version="1.0.0" />
+            </group>""")
+        # Flat dependencies apply to every framework.
+        self._add_package('Logging', ['2.0.0', '2.1.0'],
+                          '<dependency id="Json" version="1.2.0" />')
+        self._add_package('Json', ['1.0.0', '1.1.0-beta', '1.1.0', '1.2.0'],
+                          '')
+
+        downloads = os.path.join(self.directory.name, 'downloads')
+        client = pynuget.HTTPClient(
+            index_uri=self.base_uri + 'index.json',
+            cache_directory=os.path.join(self.directory.name, 'cache'))
+        graph = pynuget.resolve_dependencies(
+            client, [('App', '1.0.0')], 'net5.0', downloads, workers=2)
+
+        self.assertEqual(graph, {
+            ('app', '1.0.0'): [('logging', '2.0.0'), ('json', '1.1.0')],
+            ('logging', '2.0.0'): [('json', '1.2.0')],
+            ('json', '1.1.0'): [],
+            ('json', '1.2.0'): [],
+        })
+
+        # The dependencies are now cached so the packages are not needed.
+        for filename in os.listdir(downloads):
+            os.unlink(os.path.join(downloads, filename))
+        self.server.shutdown()
+        self.assertEqual(pynuget.resolve_dependencies(
+            client, [('App', '1.0.0')], 'net5.0', downloads), graph)
+
+
+class VersionRangeTests(unittest.TestCase):
+    def test_version_ranges(self):
+        self.assertEqual(pynuget.minimum_version('6.6.1'), '6.6.1')
+        self.assertEqual(pynuget.minimum_version('[6.6.1, )'), '6.6.1')
+        self.assertEqual(pynuget.minimum_version('[1.0]'), '1.0')
+        with self.assertRaises(ValueError):
+            pynuget.minimum_version('(, 2.0]')
+        with self.assertRaises(ValueError):
+            pynuget.minimum_version('(1.0, )')
+
+        versions = ['0.9', '1.0', '1.0.1-beta', '1.0.1', '2.0']
+        self.assertEqual(
+            pynuget.lowest_matching_version('(1.0, )', versions), '1.0.1')
+        self.assertEqual(
+            pynuget.lowest_matching_version('(, 2.0]', versions), '0.9')
+        with self.assertRaises(ValueError):
+            pynuget.lowest_matching_version('(2.0, )', versions)
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
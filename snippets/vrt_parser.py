@@ -2,6 +2,9 @@
 
 This is a XML format used by GDAL (Geospatial Data Abstraction Library).
 
+A new VRT can also be created with Dataset.create(), adding bands and sources
+to it and then calling write().
+
 https://gdal.org/en/stable/drivers/raster/vrt.html
 https://raw.githubusercontent.com/OSGeo/gdal/master/frmts/vrt/data/gdalvrt.xsd
 """
@@ -15,9 +18,24 @@ from xml.etree import ElementTree
 
 
 class ColourInterpretation(enum.StrEnum):
-    # TODO: Fill this out based on ColorInterpType from lvrt.xsd
+    """Based on ColorInterpType from gdalvrt.xsd."""
     GRAY = "Gray"
     PALETTE = "Palette"
+    RED = "Red"
+    GREEN = "Green"
+    BLUE = "Blue"
+    ALPHA = "Alpha"
+    HUE = "Hue"
+    SATURATION = "Saturation"
+    LIGHTNESS = "Lightness"
+    CYAN = "Cyan"
+    MAGENTA = "Magenta"
+    YELLOW = "Yellow"
+    BLACK = "Black"
+    YCBCR_Y = "YCbCr_Y"
+    YCBCR_CB = "YCbCr_Cb"
+    YCBCR_CR = "YCbCr_Cr"
+    UNDEFINED = "Undefined"
 
 
 @dataclasses.dataclass
@@ -36,6 +54,15 @@ class Rectangle:
             int(element.attrib["ySize"]),
         )
 
+    def to_element(self, tag: str) -> ElementTree.Element:
+        return ElementTree.Element(
+            tag,
+            xOff=str(self.offset_x),
+            yOff=str(self.offset_y),
+            xSize=str(self.size_x),
+            ySize=str(self.size_y),
+        )
+
 
 class Source:
     def __init__(self, element: ElementTree.Element):
@@ -45,6 +72,12 @@ class Source:
     def filename(self) -> str:
         return self._element.find("./SourceFilename").text
 
+    @property
+    def relative_to_vrt(self) -> bool:
+        """True if the filename is relative to the VRT file."""
+        filename = self._element.find("./SourceFilename")
+        return filename.attrib.get("relativeToVRT", "0") == "1"
+
     @property
     def band(self) -> int:
         return int(self._element.find("./SourceBand").text)
@@ -65,6 +98,15 @@ class Source:
     def no_data(self) -> int:
         return self._element.find("./NODATA").text
 
+    @property
+    def colour_table_component(self) -> int | None:
+        """The component (1 to 4) of the colour table to expand a paletted
+        source to, if any."""
+        component = self._element.find("./ColorTableComponent")
+        if component is None:
+            return None
+        return int(component.text)
+
     def __repr__(self):
         return f"<Source File={self.filename}>"
 
@@ -88,25 +130,98 @@ class Band:
     @property
     def no_data_value(self) -> float:
         """The value of NoData for the raster band."""
-        return float(self._element.find("./NoDataValue"))
+        return float(self._element.find("./NoDataValue").text)
 
     @property
     def colour_interpretation(self) -> ColourInterpretation:
         """The type of colour interpolation to perform."""
-        return ColourInterpretation(self._element.find("./ColorInterp"))
+        return ColourInterpretation(self._element.find("./ColorInterp").text)
 
     def __repr__(self):
         return f'<VRTRasterBand dataType="{self.data_type}" band="{self.band_number}">'
 
     @property
     def sources(self):
-        return [Source(element) for element in self._element.findall("./ComplexSource")]
+        return [
+            Source(element) for element in self._element
+            if element.tag in ("SimpleSource", "ComplexSource")
+        ]
+
+    def add_source(
+        self,
+        filename: str,
+        band: int,
+        source_rectangle: Rectangle,
+        destination_rectangle: Rectangle,
+        relative_to_vrt: bool = False,
+        properties: dict[str, str] | None = None,
+        colour_table_component: int | None = None,
+    ) -> Source:
+        """Add a source which provides the pixels for part of this band.
+
+        Providing the properties of the source (RasterXSize, RasterYSize,
+        DataType, BlockXSize and BlockYSize) means GDAL does not need to open
+        the source until its pixels are read.
+
+        A colour table component is used to expand a paletted source, which
+        requires a ComplexSource rather than a SimpleSource.
+        """
+        tag = "SimpleSource" if colour_table_component is None else "ComplexSource"
+        element = ElementTree.SubElement(self._element, tag)
+        filename_element = ElementTree.SubElement(
+            element,
+            "SourceFilename",
+            relativeToVRT="1" if relative_to_vrt else "0",
+        )
+        filename_element.text = filename
+        ElementTree.SubElement(element, "SourceBand").text = str(band)
+        if properties:
+            ElementTree.SubElement(element, "SourceProperties", properties)
+        element.append(source_rectangle.to_element("SrcRect"))
+        element.append(destination_rectangle.to_element("DstRect"))
+        if colour_table_component is not None:
+            ElementTree.SubElement(element, "ColorTableComponent").text = str(
+                colour_table_component
+            )
+        return Source(element)
 
 
 class Dataset:
     def __init__(self, root: ElementTree.Element):
         self._root = root
 
+    @classmethod
+    def create(
+        cls,
+        raster_size_x: int,
+        raster_size_y: int,
+        srs: str,
+        geo_transform: list[float],
+    ):
+        """Create a new dataset with no bands.
+
+        The spatial reference system can be anything GDAL accepts as user
+        input, such as WKT or EPSG:3857.
+        """
+        root = ElementTree.Element(
+            "VRTDataset",
+            rasterXSize=str(raster_size_x),
+            rasterYSize=str(raster_size_y),
+        )
+        ElementTree.SubElement(root, "SRS").text = srs
+        ElementTree.SubElement(root, "GeoTransform").text = ", ".join(
+            repr(float(value)) for value in geo_transform
+        )
+        return cls(root)
+
+    @property
+    def raster_size(self) -> tuple[int, int]:
+        """The width and height of the dataset in pixels."""
+        return (
+            int(self._root.attrib["rasterXSize"]),
+            int(self._root.attrib["rasterYSize"]),
+        )
+
     # Other properties:
     # - ground_control_points
     # - metadata
@@ -123,7 +238,7 @@ class Dataset:
         return srs.text
 
     @property
-    def geo_transform(self) -> str:
+    def geo_transform(self) -> list[float]:
         """Six value affine geotransformation for the data set.
 
         Maps between pixel coordinates and georeferenced coordinates.
@@ -138,6 +253,30 @@ class Dataset:
     def bands(self):
         return [Band(band) for band in self._root.findall("./VRTRasterBand")]
 
+    def add_band(
+        self,
+        data_type: str,
+        colour_interpretation: ColourInterpretation | None = None,
+    ) -> Band:
+        """Add a band to the dataset, the band number is assigned in order."""
+        element = ElementTree.SubElement(
+            self._root,
+            "VRTRasterBand",
+            dataType=data_type,
+            band=str(len(self.bands) + 1),
+        )
+        if colour_interpretation is not None:
+            ElementTree.SubElement(element, "ColorInterp").text = str(
+                colour_interpretation
+            )
+        return Band(element)
+
+    def write(self, path: os.PathLike | str):
+        """Write the dataset out to a VRT file."""
+        tree = ElementTree.ElementTree(self._root)
+        ElementTree.indent(tree)
+        tree.write(os.fspath(path), encoding="utf-8")
+
 
 def parse(path: os.PathLike | str):
     path = pathlib.Path(os.fspath(path))
@@ -4,13 +4,35 @@ Specification: https://docs.mapbox.com/mapbox-gl-js/style-spec/
 Newer Specification: https://maplibre.org/maplibre-style-spec/
 
 This is very much incomplete.
+
+Filters are compiled once per layer into a Python callable which takes the
+context of a feature and returns True if the layer applies to it. The context
+is a dictionary with the following keys, all of which are optional:
+- zoom - the zoom level being rendered.
+- geometry-type - "Point", "LineString" or "Polygon".
+- id - the feature's identifier.
+- properties - the feature's attributes as plain Python values.
+
+Both the legacy filter syntax, for example ["==", "class", "lake"] and the
+expression syntax, for example ["==", ["get", "class"], "lake"] are supported.
+A layer whose filter uses an unsupported operator is still loaded, but it is
+left out of the layers matched against features, see Style.unsupported_layers.
 """
 
+import collections
 import enum
 import json
+import operator
 import pathlib
 
 
+class UnsupportedFilterError(ValueError):
+    """The filter of a layer uses an expression that can't be handled."""
+    def __init__(self, message: str, expression):
+        super().__init__(f"{message}: {json.dumps(expression)}")
+        self.expression = expression
+
+
 class LayerType(enum.StrEnum):
     FILL = "fill"
     """A filled polygon with an optional stroked border."""
@@ -47,6 +69,359 @@ class LayerType(enum.StrEnum):
     layers."""
 
 
+GEOMETRY_TYPE_NAMES = {
+    1: "Point",
+    2: "LineString",
+    3: "Polygon",
+}
+"""The name of the geometry type in a filter from the geometry type of a
+feature in a vector tile (vector_tile_pb2.Tile.GeomType)."""
+
+
+def feature_context(zoom, feature_type: int, properties: dict,
+                    feature_id=None) -> dict:
+    """Create the context to evaluate filters against for a feature.
+
+    Parameters
+    ----------
+    zoom
+        The zoom level being rendered.
+    feature_type
+        The geometry type of the feature from the vector tile.
+    properties
+        The attributes of the feature as plain Python values rather than
+        protocol buffer values.
+    feature_id
+        The identifier of the feature if it has one.
+    """
+    return {
+        "zoom": zoom,
+        "geometry-type": GEOMETRY_TYPE_NAMES.get(feature_type),
+        "id": feature_id,
+        "properties": properties,
+    }
+
+
+_COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def _is_expression_filter(layer_filter) -> bool:
+    """Return True if the filter uses the expression syntax rather than the
+    legacy filter syntax.
+
+    This follows the same rules as isExpressionFilter() in MapLibre GL JS.
+    """
+    if isinstance(layer_filter, bool):
+        return True
+
+    if not isinstance(layer_filter, list) or not layer_filter:
+        return False
+
+    op = layer_filter[0]
+    if op == "has":
+        return len(layer_filter) >= 2 and \
+            layer_filter[1] not in ("$id", "$type")
+    if op == "in":
+        return len(layer_filter) >= 3 and (
+            not isinstance(layer_filter[1], str) or
+            isinstance(layer_filter[2], list))
+    if op in ("!in", "!has", "none"):
+        return False
+    if op in _COMPARISONS:
+        return len(layer_filter) != 3 or \
+            isinstance(layer_filter[1], list) or \
+            isinstance(layer_filter[2], list)
+    if op in ("any", "all"):
+        return all(
+            isinstance(child, bool) or _is_expression_filter(child)
+            for child in layer_filter[1:]
+        )
+    return True
+
+
+def _same_type(a, b) -> bool:
+    """Return True if the two values are of comparable types.
+
+    Filters never compare a string to a number and booleans are not numbers.
+    """
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool)
+    if isinstance(a, str) or isinstance(b, str):
+        return isinstance(a, str) and isinstance(b, str)
+    return isinstance(a, (int, float)) and isinstance(b, (int, float))
+
+
+def _typed_key(value):
+    """Return a key for the value which only compares equal to values of the
+    same type, such that a set lookup matches how filters compare values.
+
+    In Python True == 1 and hash(True) == hash(1) which is not what is wanted.
+    """
+    if isinstance(value, bool):
+        return ("boolean", value)
+    if isinstance(value, str):
+        return ("string", value)
+    if isinstance(value, (int, float)):
+        return ("number", value)
+    if value is None:
+        return ("null", None)
+    return ("other", id(value))
+
+
+def _compile_legacy_getter(key: str):
+    """Return a function that looks up the key in a feature's context."""
+    if key == "$type":
+        return lambda context: context.get("geometry-type")
+    if key == "$id":
+        return lambda context: context.get("id")
+    return lambda context: context.get("properties", {}).get(key)
+
+
+def _check_arity(expression, arguments, minimum, maximum=None):
+    """Raise UnsupportedFilterError if the operator of the expression doesn't
+    have between minimum and maximum arguments (no limit if None)."""
+    if len(arguments) < minimum or \
+            (maximum is not None and len(arguments) > maximum):
+        raise UnsupportedFilterError(
+            "Wrong number of arguments", expression)
+
+
+def _compile_legacy_filter(layer_filter):
+    """Compile a filter using the legacy (deprecated) syntax."""
+    if not isinstance(layer_filter, list) or not layer_filter:
+        raise UnsupportedFilterError("A filter must be a non-empty array",
+                                     layer_filter)
+
+    op, *arguments = layer_filter
+
+    if op in ("all", "any", "none"):
+        children = [compile_filter(child) for child in layer_filter[1:]]
+        if op == "all":
+            return lambda context: all(child(context) for child in children)
+        if op == "any":
+            return lambda context: any(child(context) for child in children)
+        return lambda context: not any(child(context) for child in children)
+
+    if op in ("has", "!has"):
+        _check_arity(layer_filter, arguments, 1, 1)
+        key = layer_filter[1]
+        if key == "$type":
+            has = lambda context: context.get("geometry-type") is not None
+        elif key == "$id":
+            has = lambda context: context.get("id") is not None
+        else:
+            has = lambda context: key in context.get("properties", {})
+        if op == "has":
+            return has
+        return lambda context: not has(context)
+
+    if op in ("in", "!in"):
+        _check_arity(layer_filter, arguments, 1)
+        getter = _compile_legacy_getter(layer_filter[1])
+        candidates = frozenset(_typed_key(value)
+                               for value in layer_filter[2:])
+
+        def is_in(context):
+            return _typed_key(getter(context)) in candidates
+
+        if op == "in":
+            return is_in
+        return lambda context: not is_in(context)
+
+    if op in _COMPARISONS:
+        _check_arity(layer_filter, arguments, 2, 2)
+        getter = _compile_legacy_getter(layer_filter[1])
+        expected = layer_filter[2]
+        compare = _COMPARISONS[op]
+
+        if op == "==":
+            return lambda context: _equal(getter(context), expected)
+        if op == "!=":
+            return lambda context: not _equal(getter(context), expected)
+
+        def ordered(context):
+            value = getter(context)
+            return _same_type(value, expected) and compare(value, expected)
+        return ordered
+
+    raise UnsupportedFilterError("Can't handle this type of filter",
+                                 layer_filter)
+
+
+def _equal(a, b) -> bool:
+    """Compare two values for equality in the same way as the filters do."""
+    if a is None or b is None:
+        return a is None and b is None
+    return _same_type(a, b) and a == b
+
+
+def _compile_expression(expression):
+    """Compile an expression into a function that takes the context and
+    returns the value of the expression.
+    """
+    if not isinstance(expression, list):
+        # Literals are evaluated once.
+        return lambda context: expression
+
+    if not expression:
+        raise UnsupportedFilterError("An expression can not be an empty array",
+                                     expression)
+
+    op, *arguments = expression
+
+    if op == "literal":
+        _check_arity(expression, arguments, 1, 1)
+        value = arguments[0]
+        return lambda context: value
+
+    if op == "zoom":
+        return lambda context: context.get("zoom")
+
+    if op == "geometry-type":
+        return lambda context: context.get("geometry-type")
+
+    if op == "id":
+        return lambda context: context.get("id")
+
+    if op == "properties":
+        return lambda context: context.get("properties", {})
+
+    if op == "get":
+        _check_arity(expression, arguments, 1)
+        if len(arguments) != 1:
+            raise UnsupportedFilterError(
+                "Can't handle get with an object argument", expression)
+        key = arguments[0]
+        return lambda context: context.get("properties", {}).get(key)
+
+    if op == "has":
+        _check_arity(expression, arguments, 1)
+        if len(arguments) != 1:
+            raise UnsupportedFilterError(
+                "Can't handle has with an object argument", expression)
+        key = arguments[0]
+        return lambda context: key in context.get("properties", {})
+
+    if op == "!":
+        _check_arity(expression, arguments, 1, 1)
+        argument = _compile_expression(arguments[0])
+        return lambda context: not argument(context)
+
+    if op in ("all", "any"):
+        children = [_compile_expression(child) for child in arguments]
+        if op == "all":
+            return lambda context: all(child(context) for child in children)
+        return lambda context: any(child(context) for child in children)
+
+    if op in _COMPARISONS:
+        _check_arity(expression, arguments, 2, 3)
+        if len(arguments) != 2:
+            raise UnsupportedFilterError(
+                f"Can't handle {op} with a collator argument", expression)
+        left, right = (_compile_expression(argument)
+                       for argument in arguments)
+        compare = _COMPARISONS[op]
+
+        if op == "==":
+            return lambda context: _equal(left(context), right(context))
+        if op == "!=":
+            return lambda context: not _equal(left(context), right(context))
+
+        def ordered(context):
+            a = left(context)
+            b = right(context)
+            return _same_type(a, b) and compare(a, b)
+        return ordered
+
+    if op == "in":
+        _check_arity(expression, arguments, 2, 2)
+        needle, haystack = (_compile_expression(argument)
+                            for argument in arguments)
+
+        def is_in(context):
+            value = needle(context)
+            values = haystack(context)
+            if isinstance(values, str):
+                return isinstance(value, str) and value in values
+            return any(_equal(value, candidate) for candidate in values or ())
+        return is_in
+
+    if op == "match":
+        # ["match", input, label_1, output_1, ..., label_n, output_n, fallback]
+        # where a label can be a single literal or an array of literals.
+        if len(arguments) < 4 or len(arguments) % 2:
+            raise UnsupportedFilterError("Wrong number of arguments",
+                                         expression)
+        value = _compile_expression(arguments[0])
+        fallback = _compile_expression(arguments[-1])
+        outputs = {}
+        for label, output in zip(arguments[1:-1:2], arguments[2:-1:2]):
+            compiled_output = _compile_expression(output)
+            for key in (label if isinstance(label, list) else [label]):
+                # The first label to match takes priority.
+                outputs.setdefault(_typed_key(key), compiled_output)
+
+        def match(context):
+            output = outputs.get(_typed_key(value(context)), fallback)
+            return output(context)
+        return match
+
+    if op == "case":
+        # ["case", condition_1, output_1, ..., condition_n, output_n, fallback]
+        if len(arguments) < 3 or not len(arguments) % 2:
+            raise UnsupportedFilterError("Wrong number of arguments",
+                                         expression)
+        branches = [
+            (_compile_expression(condition), _compile_expression(output))
+            for condition, output in zip(arguments[:-1:2], arguments[1:-1:2])
+        ]
+        fallback = _compile_expression(arguments[-1])
+
+        def case(context):
+            for condition, output in branches:
+                if condition(context):
+                    return output(context)
+            return fallback(context)
+        return case
+
+    if op == "coalesce":
+        children = [_compile_expression(child) for child in arguments]
+
+        def coalesce(context):
+            for child in children:
+                value = child(context)
+                if value is not None:
+                    return value
+            return None
+        return coalesce
+
+    raise UnsupportedFilterError("Can't handle this type of expression",
+                                 expression)
+
+
+def compile_filter(layer_filter):
+    """Compile the filter into a function that takes the context of a feature
+    and returns True if the filter matches it.
+
+    A missing filter (None) matches everything.
+    """
+    if layer_filter is None:
+        return lambda context: True
+
+    if _is_expression_filter(layer_filter):
+        expression = _compile_expression(layer_filter)
+        return lambda context: bool(expression(context))
+
+    return _compile_legacy_filter(layer_filter)
+
+
 class Style:
     """Represents a Mapbox GL Style."""
     def __init__(self, json_document):
@@ -55,6 +430,18 @@ class Style:
         if self['version'] != 8:
             raise ValueError('Style specification version number must be 8.')
 
+        self._layers = [StyleLayer(layer) for layer in json_document["layers"]]
+
+        # Index the layers by their source layer so a feature is only checked
+        # against the layers that could apply to it.
+        self._layers_by_source_layer = collections.defaultdict(list)
+        for layer in self._layers:
+            if layer.filter_error is not None:
+                continue
+            source_layer = layer.json.get("source-layer")
+            if source_layer is not None:
+                self._layers_by_source_layer[source_layer].append(layer)
+
     def __str__(self):
         return f"Style({self['name']}, v{self['version']})"
 
@@ -63,23 +450,48 @@ class Style:
 
     @property
     def layers(self):
-        for layer in self.json_document["layers"]:
-            yield StyleLayer(layer)
+        yield from self._layers
+
+    @property
+    def unsupported_layers(self):
+        """The layers whose filter can't be handled.
+
+        These layers are never returned by layers_for_feature(), the reason is
+        given by their filter_error.
+        """
+        yield from (layer for layer in self._layers
+                    if layer.filter_error is not None)
 
     def layers_from_source_layer(self, source_layer_name: str):
         """Find layers given the source layer's name.
 
         From there the caller can account for the filter.
         """
-        for layer in self.json_document["layers"]:
-            source_layer = layer.get("source-layer")
-            if source_layer == source_layer_name:
-                yield StyleLayer(layer)
+        yield from self._layers_by_source_layer.get(source_layer_name, ())
+
+    def layers_for_feature(self, source_layer_name: str, context: dict):
+        """Find the layers that apply to a feature from the given source layer.
+
+        This accounts for the filter and, if the context has a zoom level, the
+        zoom range of the layer.
+        """
+        for layer in self._layers_by_source_layer.get(source_layer_name, ()):
+            if layer.filter_matches(context):
+                yield layer
 
 
 class StyleLayer:
     def __init__(self, json_object):
         self.json = json_object
+        self.filter_error = None
+        """The UnsupportedFilterError raised when compiling the filter."""
+        try:
+            self._filter = compile_filter(json_object.get("filter"))
+        except UnsupportedFilterError as error:
+            self.filter_error = error
+            self._filter = None
+        self._minzoom = json_object.get("minzoom")
+        self._maxzoom = json_object.get("maxzoom")
 
     def __str__(self):
         return f"Layer({self.json['id']}, {self.type})"
@@ -105,14 +517,33 @@ class StyleLayer:
         """Layer to use from a vector tile source.
 
         Required for vector tile sources."""
-        return self.json['source_layer']
+        return self.json['source-layer']
+
+    def visible_at(self, zoom) -> bool:
+        """Return true if the layer is visible at the given zoom level.
+
+        The minimum zoom level is inclusive and the maximum is exclusive.
+        """
+        if self._minzoom is not None and zoom < self._minzoom:
+            return False
+        if self._maxzoom is not None and zoom >= self._maxzoom:
+            return False
+        return True
 
     def filter_matches(self, context):
-        """Return true if the filter matches this layer given the context."""
-        layer_filter = self.json["filter"]
-        if len(layer_filter) == 1 and layer_filter[0] == "all":
-            return True
-        raise NotImplementedError("Can't handle this type of filter.")
+        """Return true if the filter matches this layer given the context.
+
+        If the context has a zoom level then the layer must also be visible at
+        that zoom level.
+
+        Raises UnsupportedFilterError if the filter can't be handled.
+        """
+        if self.filter_error is not None:
+            raise self.filter_error
+        zoom = context.get("zoom")
+        if zoom is not None and not self.visible_at(zoom):
+            return False
+        return self._filter(context)
 
 
 def dev_osm_bright():
@@ -128,10 +559,10 @@ def dev_osm_bright():
 
     print("Land cover layers")
     layers = style.layers_from_source_layer("landcover")
+    context = feature_context(zoom=14, feature_type=3,
+                              properties={"class": "grass"})
     for layer in layers:
-        # TODO: Create way to represent the filters.
-        # print(layer.json["filter"])
-        print(layer.json)
+        print(layer, layer.filter_matches(context))
 
 def dev_custom_style():
     """Development performed against style that I developed."""
@@ -140,15 +571,8 @@ def dev_custom_style():
         style_json = json.load(reader)
 
     style = Style(style_json)
-    styles_for_states = style.layers_from_source_layer(
-        "states_and_territories")
-    context = {}
-    for layer in styles_for_states:
-        # Skip it if the filter doesn't apply (this could possibly be merged
-        # with the layers_from_source_layer, once its implemented.
-        if not layer.filter_matches(context):
-            continue
-
+    context = feature_context(zoom=4, feature_type=3, properties={})
+    for layer in style.layers_for_feature("states_and_territories", context):
         # From here convert the "paint" to the corresponding paint object.
         if layer.type == LayerType.FILL:
             print('Fill layer')
@@ -0,0 +1,305 @@
+"""Gather statistics about every tile in a MBTiles file.
+
+This produces an inventory of the file: per zoom level and per layer the
+number of features, the number of vertices and the number of bytes, along
+with the largest tiles. This helps to find where the weight of the tiles is
+concentrated so the tile generation can be tuned.
+
+The tiles are partitioned by their rowid into ranges, each range is scanned
+by a separate worker process and the results are then merged together.
+
+To read vector tiles this needs the package `protobuf` installed.
+"""
+
+__author__ = "Sean Donnellan"
+__copyright__ = "Copyright (C) 2024 Sean Donnellan"
+__version__ = "0.1.0"
+
+import argparse
+import collections
+import concurrent.futures
+import gzip
+import heapq
+import os
+import pathlib
+import sqlite3
+
+import vectortiles
+
+
+class StatisticsVisitor(vectortiles.TileVisitor):
+    """Count the features and vertices per layer for the tiles visited.
+
+    The counters are keyed by zoom level and layer name so the same visitor
+    can be used for every tile in a file.
+    """
+
+    def __init__(self):
+        self.zoom = None
+        self.current_layer_name = None
+        self.feature_counter = collections.Counter()
+        self.vertex_counter = collections.Counter()
+
+    def enter_layer(self, name: str, version: int, extent: int):
+        self.current_layer_name = name
+
+    def leave_layer(self, name: str):
+        self.current_layer_name = None
+
+    def feature(self, feature_type: int, attributes: dict, geometry):
+        key = (self.zoom, self.current_layer_name)
+        self.feature_counter[key] += 1
+        self.vertex_counter[key] += sum(
+            1 for command in geometry
+            if command.command_id != vectortiles.CommandType.CLOSE_PATH
+        )
+
+
+class TileStatistics:
+    """The statistics gathered from the tiles of a MBTiles file.
+
+    The counters are keyed by the zoom level or by the zoom level and layer
+    name.
+    """
+
+    def __init__(self, largest_count: int = 10):
+        self.tile_counter = collections.Counter()
+        """The number of tiles per zoom level."""
+
+        self.tile_bytes = collections.Counter()
+        """The number of bytes of tile data (as stored) per zoom level."""
+
+        self.layer_bytes = collections.Counter()
+        """The number of uncompressed bytes per zoom level and layer."""
+
+        self.feature_counter = collections.Counter()
+        """The number of features per zoom level and layer."""
+
+        self.vertex_counter = collections.Counter()
+        """The number of vertices per zoom level and layer."""
+
+        self.largest_count = largest_count
+
+        self.largest_tiles = []
+        """The largest tiles as (size, zoom, column, row) tuples.
+
+        This is a heap so the smallest of the largest tiles is first, use
+        largest() to get them in descending order.
+        """
+
+    def add_tile(self, z: int, x: int, y: int, tile_data: bytes,
+                 visitor: StatisticsVisitor):
+        """Add the statistics for the given tile."""
+        self.tile_counter[z] += 1
+        self.tile_bytes[z] += len(tile_data)
+
+        entry = (len(tile_data), z, x, y)
+        if len(self.largest_tiles) < self.largest_count:
+            heapq.heappush(self.largest_tiles, entry)
+        else:
+            heapq.heappushpop(self.largest_tiles, entry)
+
+        if tile_data.startswith(vectortiles.GZIP_HEADER):
+            tile_data = gzip.decompress(tile_data)
+
+        tile = vectortiles.read_vector_tile(tile_data)
+        for layer in tile.layers:
+            self.layer_bytes[z, layer.name] += layer.ByteSize()
+
+        visitor.zoom = z
+        vectortiles.process_tile(tile, visitor)
+
+    def merge(self, other: 'TileStatistics'):
+        """Merge the statistics from another into this one."""
+        self.tile_counter.update(other.tile_counter)
+        self.tile_bytes.update(other.tile_bytes)
+        self.layer_bytes.update(other.layer_bytes)
+        self.feature_counter.update(other.feature_counter)
+        self.vertex_counter.update(other.vertex_counter)
+        for entry in other.largest_tiles:
+            if len(self.largest_tiles) < self.largest_count:
+                heapq.heappush(self.largest_tiles, entry)
+            else:
+                heapq.heappushpop(self.largest_tiles, entry)
+
+    def largest(self):
+        """Return the largest tiles from largest to smallest."""
+        return sorted(self.largest_tiles, reverse=True)
+
+    def print(self):
+        total_bytes = sum(self.tile_bytes.values()) or 1
+
+        print('Zoom  Tiles     Bytes         Share  Average')
+        for zoom in sorted(self.tile_counter):
+            count = self.tile_counter[zoom]
+            size = self.tile_bytes[zoom]
+            print(f'{zoom:>4}  {count:<8}  {size:<12}  '
+                  f'{size / total_bytes:>5.1%}  {size // count}')
+
+        total_layer_bytes = sum(self.layer_bytes.values()) or 1
+        print()
+        print('Zoom  Layer                 Features  Vertices    Bytes'
+              '         Share')
+        for (zoom, name), size in sorted(self.layer_bytes.items()):
+            print(f'{zoom:>4}  {name:20}  '
+                  f'{self.feature_counter[zoom, name]:<8}  '
+                  f'{self.vertex_counter[zoom, name]:<10}  {size:<12}  '
+                  f'{size / total_layer_bytes:>5.1%}')
+
+        print()
+        print('Heaviest layers (uncompressed bytes across all zoom levels)')
+        bytes_per_layer = collections.Counter()
+        for (_, name), size in self.layer_bytes.items():
+            bytes_per_layer[name] += size
+        for name, size in bytes_per_layer.most_common():
+            print(f'  {name:20} {size:<12} {size / total_layer_bytes:>5.1%}')
+
+        print()
+        print(f'Largest tiles (top {self.largest_count})')
+        for size, zoom, column, row in self.largest():
+            # The row is flipped from TMS to XYZ as that is what most tools
+            # use to refer to a tile.
+            xyz_row = (1 << zoom) - 1 - row
+            print(f'  {zoom}/{column}/{xyz_row}  {size} bytes')
+
+
+def _tiles_query(database: sqlite3.Connection):
+    """Return the query for the tiles whose rowid are within a range.
+
+    The tiles table may be a view over the map and images tables in which
+    case the rowid of the map table is used as views don't have a rowid.
+    """
+    cursor = database.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'tiles'")
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError('The MBTiles file has no tiles table.')
+
+    if row[0] == 'table':
+        return (
+            "SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles "
+            "WHERE rowid >= ? AND rowid < ?",
+            "SELECT MIN(rowid), MAX(rowid) FROM tiles",
+        )
+
+    return (
+        "SELECT map.zoom_level, map.tile_column, map.tile_row, "
+        "images.tile_data FROM map "
+        "JOIN images ON images.tile_id = map.tile_id "
+        "WHERE map.rowid >= ? AND map.rowid < ?",
+        "SELECT MIN(rowid), MAX(rowid) FROM map",
+    )
+
+
+def _open(path):
+    """Open the MBTiles file for reading only."""
+    uri = pathlib.Path(path).absolute().as_uri() + '?mode=ro'
+    return sqlite3.connect(uri, uri=True)
+
+
+def scan_range(path, start: int, stop: int,
+               largest_count: int = 10) -> TileStatistics:
+    """Gather the statistics for the tiles with a rowid from start to stop.
+
+    Parameters
+    ----------
+    path
+        The path to the mbtiles file.
+    start
+        The first rowid to include.
+    stop
+        The rowid to stop at (exclusive).
+    largest_count
+        The number of largest tiles to keep.
+    """
+    statistics = TileStatistics(largest_count)
+    visitor = StatisticsVisitor()
+
+    database = _open(path)
+    try:
+        query, _ = _tiles_query(database)
+        for z, x, y, tile_data in database.execute(query, (start, stop)):
+            statistics.add_tile(z, x, y, tile_data, visitor)
+    finally:
+        database.close()
+
+    statistics.feature_counter = visitor.feature_counter
+    statistics.vertex_counter = visitor.vertex_counter
+    return statistics
+
+
+def scan(path, workers: int = None, partitions_per_worker: int = 4,
+         largest_count: int = 10) -> TileStatistics:
+    """Gather the statistics for every tile in the MBTiles file.
+
+    Parameters
+    ----------
+    path
+        The path to the mbtiles file.
+    workers
+        The number of worker processes, by default this is the number of
+        processors.
+    partitions_per_worker
+        The number of rowid ranges to create per worker. Having more ranges
+        than workers balances the load when the tiles are unevenly sized.
+    largest_count
+        The number of largest tiles to keep.
+    """
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f'No MBTiles file found at {path}')
+
+    workers = workers or os.cpu_count() or 1
+
+    database = _open(path)
+    try:
+        _, range_query = _tiles_query(database)
+        first, last = database.execute(range_query).fetchone()
+    finally:
+        database.close()
+
+    statistics = TileStatistics(largest_count)
+    if first is None:
+        return statistics
+
+    # The rowids may have gaps, but this is good enough to spread the work.
+    partition_count = max(workers * partitions_per_worker, 1)
+    step = max((last - first + 1) // partition_count, 1)
+    ranges = [
+        (start, min(start + step, last + 1))
+        for start in range(first, last + 1, step)
+    ]
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(scan_range, path, start, stop, largest_count)
+            for start, stop in ranges
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            statistics.merge(future.result())
+
+    return statistics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Gather statistics about every tile in a MBTiles file.',
+        )
+    parser.add_argument(
+        'mbtiles',
+        help='The path to the mbtiles file.')
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        default=None,
+        help='The number of worker processes (default: processor count).',
+    )
+    parser.add_argument(
+        '--largest',
+        type=int,
+        default=10,
+        help='The number of largest tiles to report.',
+    )
+
+    arguments = parser.parse_args()
+    scan(arguments.mbtiles, arguments.workers, largest_count=arguments.largest
+         ).print()
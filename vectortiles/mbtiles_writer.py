@@ -0,0 +1,724 @@
+"""Write vector tiles into a MBTiles file.
+
+This is the counterpart to vectortiles.py which reads them. It is intended for
+generating overlays from our own data such as electoral divisions, G-NAF
+points and contours from HGT files without needing external tools.
+
+The geometry is provided in WGS84 (longitude, latitude) in the form of GeoJSON
+geometry objects, i.e. a dictionary with a "type" and "coordinates". It is
+projected to Web Mercator, clipped to the tile (with a buffer) and then
+quantised to the extent of the tile.
+
+The MBTiles file is written with the de-duplicated schema, where the tiles
+table is a view over a map table and an images table. This means identical
+tiles, such as tiles entirely covered by the ocean, are only stored once.
+
+To write vector tiles this needs the package `protobuf` installed.
+
+The specification is:
+https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+https://github.com/mapbox/mbtiles-spec/blob/master/1.3/spec.md
+"""
+
+__author__ = "Sean Donnellan"
+__copyright__ = "Copyright (C) 2024 Sean Donnellan"
+__version__ = "0.1.0"
+
+import collections
+import gzip
+import hashlib
+import math
+import sqlite3
+
+import vector_tile_pb2
+from vectortiles import CommandType, GeometryType
+
+DEFAULT_EXTENT = 4096
+"""The default extent of a tile, this is the extent used by most tiles."""
+
+DEFAULT_BUFFER = 64
+"""The default size of the buffer around the tile in tile coordinates.
+
+Geometry is clipped to the tile plus this buffer so that lines and polygons
+that cross the edge of a tile are rendered seamlessly."""
+
+
+def lonlat_to_tile_pixel(longitude: float, latitude: float, z: int, x: int,
+                         y: int, extent: int = DEFAULT_EXTENT):
+    """Project WGS84 coordinates into the coordinates of the given tile.
+
+    The tile index is in the XYZ scheme, where the Y axis points down, which
+    is the same as the tile coordinates within the tile.
+
+    Parameters
+    ----------
+    longitude
+        The longitude in degrees.
+    latitude
+        The latitude in degrees.
+    z
+        The zoom level
+    x
+        The tile's x-coordinate
+    y
+        The tile's y-coordinate (XYZ rather than TMS).
+    extent
+        The extent of the tile.
+
+    Returns
+    -------
+    tuple
+        The x and y coordinate within the tile as floats.
+    """
+    n = 2.0 ** z
+    # Clamp the latitude to the limit of Web Mercator, otherwise the poles
+    # are at infinity.
+    latitude = max(min(latitude, 85.0511287798), -85.0511287798)
+    world_x = (longitude + 180.0) / 360.0 * n
+    world_y = (1.0 - math.asinh(math.tan(math.radians(latitude))) /
+               math.pi) / 2.0 * n
+    return (world_x - x) * extent, (world_y - y) * extent
+
+
+def zigzag_encode(value: int) -> int:
+    """Encode a signed integer as an unsigned integer.
+
+    This is the inverse of the decode_zigzag_integer() in parse_geometry().
+    """
+    return (value << 1) ^ (value >> 31)
+
+
+def command_integer(command_id: CommandType, count: int) -> int:
+    """Encode the command ID and the number of times it is repeated."""
+    return (command_id & 0x7) | (count << 3)
+
+
+def _clip_points(points, minimum: float, maximum: float):
+    """Return the points that are within the clip rectangle."""
+    return [
+        (px, py) for px, py in points
+        if minimum <= px <= maximum and minimum <= py <= maximum
+    ]
+
+
+def _clip_line(points, minimum: float, maximum: float):
+    """Clip a line to the square from minimum to maximum.
+
+    This uses the Liang-Barsky algorithm on each segment. As a line can enter
+    and leave the square multiple times this returns a list of lines.
+    """
+    lines = []
+    current = []
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        dx = x1 - x0
+        dy = y1 - y0
+        t0, t1 = 0.0, 1.0
+        for p, q in ((-dx, x0 - minimum), (dx, maximum - x0),
+                     (-dy, y0 - minimum), (dy, maximum - y0)):
+            if p == 0:
+                if q < 0:
+                    t0, t1 = 1.0, 0.0  # Parallel and outside.
+                    break
+            else:
+                t = q / p
+                if p < 0:
+                    t0 = max(t0, t)
+                else:
+                    t1 = min(t1, t)
+
+        if t0 > t1:
+            # The segment is outside, which ends the current line.
+            if current:
+                lines.append(current)
+                current = []
+            continue
+
+        start = (x0 + t0 * dx, y0 + t0 * dy)
+        end = (x0 + t1 * dx, y0 + t1 * dy)
+        if not current:
+            current = [start]
+        elif t0 > 0.0:
+            # The segment re-entered the square.
+            lines.append(current)
+            current = [start]
+        current.append(end)
+
+        if t1 < 1.0:
+            # The segment left the square.
+            lines.append(current)
+            current = []
+
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _clip_ring(ring, minimum: float, maximum: float):
+    """Clip a polygon's ring to the square from minimum to maximum.
+
+    This uses the Sutherland-Hodgman algorithm, which can introduce
+    degenerate edges along the boundary of the square, which is fine for
+    rendering.
+    """
+    def clip_edge(points, inside, intersect):
+        output = []
+        if not points:
+            return output
+        previous = points[-1]
+        for point in points:
+            if inside(point):
+                if not inside(previous):
+                    output.append(intersect(previous, point))
+                output.append(point)
+            elif inside(previous):
+                output.append(intersect(previous, point))
+            previous = point
+        return output
+
+    def intersect_x(value):
+        def intersect(a, b):
+            t = (value - a[0]) / (b[0] - a[0])
+            return value, a[1] + t * (b[1] - a[1])
+        return intersect
+
+    def intersect_y(value):
+        def intersect(a, b):
+            t = (value - a[1]) / (b[1] - a[1])
+            return a[0] + t * (b[0] - a[0]), value
+        return intersect
+
+    points = list(ring)
+    points = clip_edge(points, lambda p: p[0] >= minimum, intersect_x(minimum))
+    points = clip_edge(points, lambda p: p[0] <= maximum, intersect_x(maximum))
+    points = clip_edge(points, lambda p: p[1] >= minimum, intersect_y(minimum))
+    points = clip_edge(points, lambda p: p[1] <= maximum, intersect_y(maximum))
+    return points
+
+
+def _quantise(points, closed=False):
+    """Round the points to integers and remove repeated points.
+
+    For a closed ring, the last point is removed if it is the same as the
+    first as the ClosePath command implies it.
+    """
+    quantised = []
+    for px, py in points:
+        point = (round(px), round(py))
+        if not quantised or quantised[-1] != point:
+            quantised.append(point)
+    if closed and len(quantised) > 1 and quantised[0] == quantised[-1]:
+        quantised.pop()
+    return quantised
+
+
+def _ring_area(ring) -> int:
+    """Return twice the signed area of the ring using the surveyor's formula.
+
+    In tile coordinates, exterior rings must have a positive area and interior
+    rings a negative area.
+    """
+    return sum(
+        x0 * y1 - x1 * y0
+        for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1])
+    )
+
+
+class _GeometryEncoder:
+    """Encode the parts of a geometry into a command stream.
+
+    The cursor carries over from one part to the next.
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.cursor_x = 0
+        self.cursor_y = 0
+
+    def _append_points(self, points):
+        for px, py in points:
+            self.commands.append(zigzag_encode(px - self.cursor_x))
+            self.commands.append(zigzag_encode(py - self.cursor_y))
+            self.cursor_x = px
+            self.cursor_y = py
+
+    def points(self, points):
+        self.commands.append(command_integer(CommandType.MOVE_TO, len(points)))
+        self._append_points(points)
+
+    def line(self, points):
+        self.commands.append(command_integer(CommandType.MOVE_TO, 1))
+        self._append_points(points[:1])
+        self.commands.append(
+            command_integer(CommandType.LINE_TO, len(points) - 1))
+        self._append_points(points[1:])
+
+    def ring(self, points):
+        self.line(points)
+        self.commands.append(command_integer(CommandType.CLOSE_PATH, 1))
+
+
+def encode_geometry(geometry: dict, z: int, x: int, y: int,
+                    extent: int = DEFAULT_EXTENT,
+                    buffer: int = DEFAULT_BUFFER):
+    """Encode a GeoJSON geometry in WGS84 for the given tile.
+
+    Parameters
+    ----------
+    geometry
+        A GeoJSON geometry object (type and coordinates). The supported types
+        are Point, MultiPoint, LineString, MultiLineString, Polygon and
+        MultiPolygon.
+    z
+        The zoom level
+    x
+        The tile's x-coordinate
+    y
+        The tile's y-coordinate (XYZ rather than TMS).
+    extent
+        The extent of the tile.
+    buffer
+        The size of the buffer around the tile in tile coordinates.
+
+    Returns
+    -------
+    tuple
+        The geometry type and the command stream or None if nothing of the
+        geometry is within the tile.
+    """
+    minimum = -buffer
+    maximum = extent + buffer
+
+    def project(coordinates):
+        return [
+            lonlat_to_tile_pixel(longitude, latitude, z, x, y, extent)
+            for longitude, latitude, *_ in coordinates
+        ]
+
+    geometry_type = geometry["type"]
+    coordinates = geometry["coordinates"]
+    encoder = _GeometryEncoder()
+
+    if geometry_type in ("Point", "MultiPoint"):
+        if geometry_type == "Point":
+            coordinates = [coordinates]
+        points = _quantise(_clip_points(project(coordinates), minimum, maximum))
+        if not points:
+            return None
+        encoder.points(points)
+        return GeometryType.POINT, encoder.commands
+
+    if geometry_type in ("LineString", "MultiLineString"):
+        if geometry_type == "LineString":
+            coordinates = [coordinates]
+        for line in coordinates:
+            for clipped in _clip_line(project(line), minimum, maximum):
+                clipped = _quantise(clipped)
+                if len(clipped) >= 2:
+                    encoder.line(clipped)
+        if not encoder.commands:
+            return None
+        return GeometryType.LINESTRING, encoder.commands
+
+    if geometry_type in ("Polygon", "MultiPolygon"):
+        if geometry_type == "Polygon":
+            coordinates = [coordinates]
+        for polygon in coordinates:
+            for index, ring in enumerate(polygon):
+                clipped = _quantise(
+                    _clip_ring(project(ring), minimum, maximum), closed=True)
+                area = _ring_area(clipped) if len(clipped) >= 3 else 0
+                if area == 0:
+                    if index == 0:
+                        # Without the exterior ring the holes are meaningless.
+                        break
+                    continue
+
+                # The exterior ring must be clockwise (positive area) and
+                # the interior rings counter-clockwise (negative area).
+                is_exterior = index == 0
+                if (area > 0) != is_exterior:
+                    clipped.reverse()
+                encoder.ring(clipped)
+        if not encoder.commands:
+            return None
+        return GeometryType.POLYGON, encoder.commands
+
+    raise ValueError(f'Unsupported geometry type: {geometry_type}')
+
+
+def encode_value(value, tile_value: vector_tile_pb2.Tile.Value):
+    """Set the tile value from a plain Python value.
+
+    This is the inverse of vectortiles.decode_value().
+    """
+    if isinstance(value, bool):
+        tile_value.bool_value = value
+    elif isinstance(value, int):
+        if value < 0:
+            tile_value.sint_value = value
+        else:
+            tile_value.uint_value = value
+    elif isinstance(value, float):
+        tile_value.double_value = value
+    else:
+        tile_value.string_value = str(value)
+
+
+class LayerBuilder:
+    """Build a layer within a vector tile.
+
+    The keys and values are de-duplicated within the layer.
+    """
+
+    def __init__(self, layer: vector_tile_pb2.Tile.Layer, name: str,
+                 extent: int = DEFAULT_EXTENT):
+        self.layer = layer
+        self.layer.name = name
+        self.layer.version = 2
+        self.layer.extent = extent
+        self._key_index = {}
+        self._value_index = {}
+
+    def _key(self, key: str) -> int:
+        index = self._key_index.get(key)
+        if index is None:
+            index = len(self.layer.keys)
+            self.layer.keys.append(key)
+            self._key_index[key] = index
+        return index
+
+    def _value(self, value) -> int:
+        # The type is part of the key so 1, 1.0 and True are distinct.
+        lookup_key = (type(value), value)
+        index = self._value_index.get(lookup_key)
+        if index is None:
+            index = len(self.layer.values)
+            encode_value(value, self.layer.values.add())
+            self._value_index[lookup_key] = index
+        return index
+
+    def add_feature(self, geometry_type: int, commands: list,
+                    properties: dict, feature_id=None):
+        """Add a feature with an already encoded geometry to the layer.
+
+        The identifier of a vector tile feature is an unsigned integer, any
+        other identifier, such as a negative number or a string, is left out.
+        """
+        feature = self.layer.features.add()
+        feature.type = geometry_type
+        feature.geometry.extend(commands)
+        if isinstance(feature_id, int) and not isinstance(feature_id, bool) \
+                and 0 <= feature_id < (1 << 64):
+            feature.id = feature_id
+        for key, value in properties.items():
+            if value is None:
+                continue
+            feature.tags.append(self._key(key))
+            feature.tags.append(self._value(value))
+        return feature
+
+
+def encode_tile(layers: dict, z: int, x: int, y: int,
+                extent: int = DEFAULT_EXTENT,
+                buffer: int = DEFAULT_BUFFER) -> vector_tile_pb2.Tile:
+    """Encode the features in the layers into a vector tile.
+
+    Parameters
+    ----------
+    layers
+        A mapping of layer names to a list of GeoJSON features.
+    z
+        The zoom level
+    x
+        The tile's x-coordinate
+    y
+        The tile's y-coordinate (XYZ rather than TMS).
+    extent
+        The extent of the tile.
+    buffer
+        The size of the buffer around the tile in tile coordinates.
+
+    Returns
+    -------
+    vector_tile_pb2.Tile
+        The tile, layers with no features in the tile are left out.
+    """
+    tile = vector_tile_pb2.Tile()
+    for name, features in layers.items():
+        builder = None
+        for feature in features:
+            encoded = encode_geometry(
+                feature["geometry"], z, x, y, extent, buffer)
+            if encoded is None:
+                continue
+
+            if builder is None:
+                builder = LayerBuilder(tile.layers.add(), name, extent)
+
+            geometry_type, commands = encoded
+            builder.add_feature(geometry_type, commands,
+                                feature.get("properties") or {},
+                                feature.get("id"))
+    return tile
+
+
+def _coordinates_bounds(coordinates):
+    """Return the bounds (west, south, east, north) of nested coordinates.
+
+    Returns None if there are no coordinates, such as an empty geometry.
+    """
+    if not coordinates:
+        return None
+
+    if isinstance(coordinates[0], (int, float)):
+        longitude, latitude = coordinates[:2]
+        return longitude, latitude, longitude, latitude
+
+    bounds = [bound for bound in map(_coordinates_bounds, coordinates)
+              if bound is not None]
+    if not bounds:
+        return None
+    return (
+        min(bound[0] for bound in bounds),
+        min(bound[1] for bound in bounds),
+        max(bound[2] for bound in bounds),
+        max(bound[3] for bound in bounds),
+    )
+
+
+def tile_range(bounds, zoom: int, buffer_fraction: float = 0.0):
+    """Return the range of tiles at the zoom level that cover the bounds.
+
+    Parameters
+    ----------
+    bounds
+        The west, south, east and north bounds in degrees.
+    zoom
+        The zoom level
+    buffer_fraction
+        The fraction of a tile to expand the range by, such that features
+        in the buffer of a neighbouring tile are included in it.
+
+    Returns
+    -------
+    tuple
+        The minimum x, minimum y, maximum x and maximum y (inclusive) in the
+        XYZ scheme.
+    """
+    west, south, east, north = bounds
+    last = (1 << zoom) - 1
+    min_x, min_y = lonlat_to_tile_pixel(west, north, zoom, 0, 0, extent=1)
+    max_x, max_y = lonlat_to_tile_pixel(east, south, zoom, 0, 0, extent=1)
+    return (
+        max(int(math.floor(min_x - buffer_fraction)), 0),
+        max(int(math.floor(min_y - buffer_fraction)), 0),
+        min(int(math.floor(max_x + buffer_fraction)), last),
+        min(int(math.floor(max_y + buffer_fraction)), last),
+    )
+
+
+class MBTilesWriter:
+    """Create and write vector tiles into a mbtiles file.
+
+    This class can be used as a context manager. The tiles are inserted in
+    batches and committed when the writer is closed. If the context is left
+    because of an exception, nothing is committed.
+
+    Identical tiles are stored once, the tiles table is a view that joins the
+    map table (tile coordinates to tile ID) to the images table (tile ID to
+    the tile data).
+    """
+
+    def __init__(self, filename: str, metadata: dict = None,
+                 batch_size: int = 1000):
+        """Create a mbtiles file.
+
+        Parameters
+        ----------
+        filename
+            The path to the mbtiles file to create.
+        metadata
+            The name/value pairs to write into the metadata table. The format
+            will be pbf and the minimum and maximum zoom are determined from
+            the tiles written if they are not given.
+        batch_size
+            The number of tiles to buffer before inserting them.
+        """
+        self._database = sqlite3.connect(filename)
+        self._database.executescript("""
+            CREATE TABLE metadata (name TEXT, value TEXT);
+            CREATE UNIQUE INDEX name ON metadata (name);
+            CREATE TABLE map (
+                zoom_level INTEGER,
+                tile_column INTEGER,
+                tile_row INTEGER,
+                tile_id TEXT
+            );
+            CREATE UNIQUE INDEX map_index ON map
+                (zoom_level, tile_column, tile_row);
+            CREATE TABLE images (tile_data BLOB, tile_id TEXT);
+            CREATE UNIQUE INDEX images_id ON images (tile_id);
+            CREATE VIEW tiles AS
+                SELECT
+                    map.zoom_level AS zoom_level,
+                    map.tile_column AS tile_column,
+                    map.tile_row AS tile_row,
+                    images.tile_data AS tile_data
+                FROM map JOIN images ON images.tile_id = map.tile_id;
+        """)
+
+        self.metadata = {'format': 'pbf'}
+        self.metadata.update(metadata or {})
+        self.batch_size = batch_size
+        self._map_rows = []
+        self._image_rows = {}
+        self._zoom_levels = set()
+        self.tile_count = 0
+        self.unique_tile_count = 0
+        self._seen_tile_ids = set()
+
+    def write_tile(self, z: int, x: int, y: int, tile: vector_tile_pb2.Tile):
+        """Write a tile, the y-coordinate is in the XYZ scheme.
+
+        The tile is stored with the row flipped to the TMS scheme as required
+        by the MBTiles specification.
+        """
+        # The modification time is fixed so identical tiles produce identical
+        # blobs, otherwise they couldn't be de-duplicated.
+        data = gzip.compress(tile.SerializeToString(), mtime=0)
+        self.write_tile_data(z, x, y, data)
+
+    def write_tile_data(self, z: int, x: int, y: int, data: bytes):
+        """Write the already encoded tile data at z, x, y (XYZ scheme)."""
+        tile_id = hashlib.sha256(data).hexdigest()
+        if tile_id not in self._seen_tile_ids:
+            self._seen_tile_ids.add(tile_id)
+            self._image_rows[tile_id] = data
+            self.unique_tile_count += 1
+
+        tms_y = (1 << z) - 1 - y
+        self._map_rows.append((z, x, tms_y, tile_id))
+        self._zoom_levels.add(z)
+        self.tile_count += 1
+
+        if len(self._map_rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert the buffered tiles into the database."""
+        self._database.executemany(
+            "INSERT INTO images (tile_data, tile_id) VALUES (?, ?)",
+            ((data, tile_id) for tile_id, data in self._image_rows.items()),
+        )
+        self._database.executemany(
+            "INSERT OR REPLACE INTO map "
+            "(zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)",
+            self._map_rows,
+        )
+        self._image_rows.clear()
+        self._map_rows.clear()
+
+    def close(self):
+        """Write the remaining tiles and metadata then close the file."""
+        self.flush()
+
+        metadata = dict(self.metadata)
+        if self._zoom_levels:
+            metadata.setdefault('minzoom', min(self._zoom_levels))
+            metadata.setdefault('maxzoom', max(self._zoom_levels))
+        self._database.executemany(
+            "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+            ((name, str(value)) for name, value in metadata.items()),
+        )
+        self._database.commit()
+        self._database.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._database.rollback()
+            self._database.close()
+
+
+def write_layers(writer: MBTilesWriter, layers: dict, zoom_levels,
+                 extent: int = DEFAULT_EXTENT, buffer: int = DEFAULT_BUFFER):
+    """Encode the features in the layers into tiles written by the writer.
+
+    The caller manages the writer, for example to write several sets of layers
+    into the same file or to read its tile counts once it is closed.
+
+    Parameters
+    ----------
+    writer
+        The writer of the mbtiles file.
+    layers
+        A mapping of layer names to a list of GeoJSON features in WGS84.
+    zoom_levels
+        The zoom levels to generate tiles for.
+    extent
+        The extent of the tiles.
+    buffer
+        The size of the buffer around the tile in tile coordinates.
+    """
+    feature_bounds = {
+        name: [_coordinates_bounds(feature["geometry"]["coordinates"])
+               for feature in features]
+        for name, features in layers.items()
+    }
+
+    for zoom in zoom_levels:
+        # Bucket the features by the tiles they may appear in, so each
+        # tile only considers the features that overlap it.
+        features_per_tile = collections.defaultdict(
+            lambda: collections.defaultdict(list))
+        for name, features in layers.items():
+            for feature, bounds in zip(features, feature_bounds[name]):
+                if bounds is None:
+                    # The geometry is empty.
+                    continue
+                min_x, min_y, max_x, max_y = tile_range(
+                    bounds, zoom, buffer_fraction=buffer / extent)
+                for x in range(min_x, max_x + 1):
+                    for y in range(min_y, max_y + 1):
+                        features_per_tile[x, y][name].append(feature)
+
+        for (x, y), tile_layers in sorted(features_per_tile.items()):
+            tile = encode_tile(tile_layers, zoom, x, y, extent, buffer)
+            if tile.layers:
+                writer.write_tile(zoom, x, y, tile)
+
+
+def build_mbtiles(filename: str, layers: dict, zoom_levels,
+                  metadata: dict = None, extent: int = DEFAULT_EXTENT,
+                  buffer: int = DEFAULT_BUFFER) -> str:
+    """Build a mbtiles file containing the features in the layers.
+
+    See write_layers() to write into a writer managed by the caller.
+
+    Parameters
+    ----------
+    filename
+        The path to the mbtiles file to create.
+    layers
+        A mapping of layer names to a list of GeoJSON features in WGS84.
+    zoom_levels
+        The zoom levels to generate tiles for.
+    metadata
+        The name/value pairs to write into the metadata table.
+    extent
+        The extent of the tiles.
+    buffer
+        The size of the buffer around the tile in tile coordinates.
+
+    Returns
+    -------
+    str
+        The path to the mbtiles file created.
+    """
+    with MBTilesWriter(filename, metadata) as writer:
+        write_layers(writer, layers, zoom_levels, extent, buffer)
+    return filename
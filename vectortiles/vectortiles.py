@@ -178,6 +178,18 @@ def read_vector_tile(source_data):
     return decoded_tile
 
 
+def decode_value(value: vector_tile_pb2.Tile.Value):
+    """Return the plain Python value from a value in a layer of a tile.
+
+    This is suitable for building the properties for glstyle.feature_context().
+    """
+    for field in ('string_value', 'float_value', 'double_value', 'int_value',
+                  'uint_value', 'sint_value', 'bool_value'):
+        if value.HasField(field):
+            return getattr(value, field)
+    return None
+
+
 def parse_geometry(geometry: list):
     """Parses the geometry command stream from the vector tile specification.
 
@@ -228,8 +240,13 @@ def parse_geometry(geometry: list):
     def decode_zigzag_integer(value):
         return (value>> 1) ^ (-(value & 1))
 
-    while geometry:
-        command = geometry.pop(0)
+    # The geometry is walked by index rather than with pop(0), which made
+    # this quadratic in the number of vertices and emptied the caller's list.
+    index = 0
+    end = len(geometry)
+    while index < end:
+        command = geometry[index]
+        index += 1
         command_id = command & 0x7
         count = command >> 3
 
@@ -242,12 +259,13 @@ def parse_geometry(geometry: list):
         if command_type is None:
             raise ValueError(f'Unexpected command ID ({command_id}).')
 
+        parameter_count = command_type.parameter_count
         for _ in range(count):
             parameters = [
                 decode_zigzag_integer(parameter)
-                for parameter in geometry[:command_type.parameter_count]
+                for parameter in geometry[index:index + parameter_count]
             ]
-            del geometry[:command_type.parameter_count]
+            index += parameter_count
             yield command_type(*parameters)
 
 
@@ -341,30 +359,40 @@ class DevelopmentTileVisitor(TileVisitor):
 class CounterVisitor(TileVisitor):
     """Counts various things.
 
-    TODO: Add option to do this per-layer.
+    If per_layer is True, then the counts are keyed by the layer name and the
+    class or geometry type rather than just the class or geometry type.
     """
 
-    def __init__(self):
+    def __init__(self, per_layer=False):
         self.class_counter = collections.Counter()
         self.geometry_type_counter = collections.Counter()
+        self.per_layer = per_layer
+        self.current_layer_name = None
+
+    def enter_layer(self, name: str, version: int, extent: int):
+        self.current_layer_name = name
 
-    def enter_layer(self, *args):
-        pass
+    def leave_layer(self, name: str):
+        self.current_layer_name = None
 
-    def leave_layer(self, *args):
-        pass
+    def _key(self, key):
+        if self.per_layer:
+            return (self.current_layer_name, key)
+        return key
 
     def feature(self, feature_type: int, attributes: dict, geometry):
-        self.geometry_type_counter[feature_type] += 1
+        self.geometry_type_counter[self._key(feature_type)] += 1
 
         feature_class = attributes.get('class', None)
         if feature_class:
             feature_class = feature_class.string_value
-            self.class_counter[feature_class] += 1
+            self.class_counter[self._key(feature_class)] += 1
 
     def print(self):
         print('Class usage (top 15)')
         for key, count in self.class_counter.most_common(15):
+            if self.per_layer:
+                key = '/'.join(key)
             print(f'  {key:15} {count}')
 
         print('Geometry type')
@@ -448,11 +476,19 @@ if __name__ == '__main__':
              'classes.',
         action='store_true',
     )
+    parser.add_argument(
+        '--per-layer',
+        help='Count the usage per-layer, this requires --count.',
+        action='store_true',
+    )
     # TODO: Add argument to specific the tile coordinates.
 
     arguments = parser.parse_args()
 
-    visitor = CounterVisitor() if arguments.count else DevelopmentTileVisitor()
+    if arguments.count:
+        visitor = CounterVisitor(per_layer=arguments.per_layer)
+    else:
+        visitor = DevelopmentTileVisitor()
 
     with MBTiles(arguments.mbtiles) as src:
         print(src.meta)